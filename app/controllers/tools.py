@@ -0,0 +1,22 @@
+import logging
+from typing import Any, Dict
+
+from app.helpers.call_log import get_call_log
+from app.helpers.tool_dispatcher import Tool, ToolContext
+
+logger = logging.getLogger(__name__)
+
+
+async def hangup_call(context: ToolContext, arguments: Dict[str, Any]) -> None:
+    """
+    Records the outcome the agent collected and ends the call.
+    """
+    logger.info(f"Function call 'hangup_call' with args: {arguments}")
+    get_call_log().add_outcome(context.call_sid or context.stream_sid or "unknown", arguments)
+    context.end_call()
+
+
+# Handlers of the functions declared in the session `tools`, by function name
+TOOLS: Dict[str, Tool] = {
+    "hangup_call": Tool(hangup_call, reply=False),
+}
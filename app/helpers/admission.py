@@ -0,0 +1,166 @@
+import logging
+import time
+from collections import Counter
+from typing import List, Optional
+
+from app.helpers.call_state import CallStateStore, get_call_state_store
+from app.helpers.config import get_settings
+from app.helpers.metrics import CALLS_REJECTED
+
+logger = logging.getLogger(__name__)
+
+REJECT_WORKER = "worker"
+REJECT_GLOBAL = "global"
+REJECT_RATE_LIMIT = "rate_limit"
+
+
+class AdmissionController:
+    """
+    Decides whether a new call can be taken without degrading the calls in progress.
+
+    Three limits apply:
+    - `max_calls_per_worker` media streams on this worker;
+    - `max_calls` calls across all workers, counted as slots in the call state
+      backend (Redis when running several workers). A slot is reserved for
+      `pending_ttl` seconds when Twilio asks for instructions and extended to
+      `call_ttl` once the media stream starts. It is released as soon as the
+      stream is refused or ends, the TTLs only cover workers that die;
+    - Azure's quota: when a rate_limits.updated event shows less than
+      `rate_limit_reserve` of a limit remaining, no call is admitted until it resets.
+
+    A limit of 0 disables it.
+    """
+
+    def __init__(
+        self,
+        store: CallStateStore,
+        max_calls: int = 0,
+        max_calls_per_worker: int = 0,
+        pending_ttl: float = 60.0,
+        call_ttl: float = 3600.0,
+        rate_limit_reserve: float = 0.1,
+    ):
+        self.store = store
+        self.max_calls = max_calls
+        self.max_calls_per_worker = max_calls_per_worker
+        self.pending_ttl = pending_ttl
+        self.call_ttl = call_ttl
+        self.rate_limit_reserve = rate_limit_reserve
+
+        self.active_streams = 0
+        self.throttled_until = 0.0
+        self.admitted = 0
+        self.rejected: Counter = Counter()
+
+    @property
+    def throttled(self) -> bool:
+        return time.monotonic() < self.throttled_until
+
+    async def admit(self, call_sid: Optional[str]) -> Optional[str]:
+        """
+        Reserves room for a call about to be connected. Returns None when it is
+        admitted, or the reason it is not.
+        """
+        reason = None
+        if self.throttled:
+            reason = REJECT_RATE_LIMIT
+        elif 0 < self.max_calls_per_worker <= self.active_streams:
+            reason = REJECT_WORKER
+        elif self.max_calls > 0 and call_sid and not await self.store.acquire_slot(call_sid, self.max_calls, self.pending_ttl):
+            reason = REJECT_GLOBAL
+
+        if reason is None:
+            self.admitted += 1
+        else:
+            self.rejected[reason] += 1
+            CALLS_REJECTED.labels(reason=reason).inc()
+            logger.warning(f"Call {call_sid} not admitted ({reason} limit reached).")
+        return reason
+
+    async def available(self) -> Optional[int]:
+        """
+        Returns how many more calls can be taken right now, None when unlimited.
+        """
+        if self.throttled:
+            return 0
+        free = []
+        if self.max_calls_per_worker > 0:
+            free.append(self.max_calls_per_worker - self.active_streams)
+        if self.max_calls > 0:
+            free.append(self.max_calls - await self.store.count_slots())
+        return max(min(free), 0) if free else None
+
+    def enter_stream(self) -> bool:
+        """
+        Counts a media stream on this worker, unless the worker is full.
+        """
+        if 0 < self.max_calls_per_worker <= self.active_streams:
+            self.rejected[REJECT_WORKER] += 1
+            CALLS_REJECTED.labels(reason=REJECT_WORKER).inc()
+            return False
+        self.active_streams += 1
+        return True
+
+    def leave_stream(self):
+        self.active_streams -= 1
+
+    async def confirm(self, call_sid: str):
+        """
+        Holds the call's slot for the length of a call once its media stream started.
+        """
+        if self.max_calls > 0:
+            await self.store.acquire_slot(call_sid, 0, self.call_ttl)
+
+    async def release(self, call_sid: str):
+        if self.max_calls > 0:
+            await self.store.release_slot(call_sid)
+
+    def update_rate_limits(self, rate_limits: List[dict]):
+        """
+        Applies the rate_limits of an Azure rate_limits.updated event.
+        """
+        for rate_limit in rate_limits:
+            limit = rate_limit.get("limit") or 0
+            remaining = rate_limit.get("remaining")
+            if limit <= 0 or remaining is None or remaining >= limit * self.rate_limit_reserve:
+                continue
+            until = time.monotonic() + float(rate_limit.get("reset_seconds") or 0)
+            if until > self.throttled_until:
+                if not self.throttled:
+                    logger.warning(
+                        f"Azure {rate_limit.get('name')} quota low ({remaining}/{limit}), "
+                        f"not admitting calls for {until - time.monotonic():.1f}s."
+                    )
+                self.throttled_until = until
+
+    def stats(self) -> dict:
+        return {
+            "max_calls": self.max_calls,
+            "max_calls_per_worker": self.max_calls_per_worker,
+            "active_streams": self.active_streams,
+            "throttled": self.throttled,
+            "throttled_for_s": max(self.throttled_until - time.monotonic(), 0.0),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
+
+
+_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    """
+    Returns the process-wide admission controller configured from the settings.
+    """
+    global _controller
+    if _controller is None:
+        settings = get_settings()
+        _controller = AdmissionController(
+            get_call_state_store(),
+            max_calls=settings.ADMISSION_MAX_CALLS,
+            max_calls_per_worker=settings.ADMISSION_MAX_CALLS_PER_WORKER,
+            pending_ttl=settings.ADMISSION_PENDING_TTL_S,
+            call_ttl=settings.CALL_STATE_TTL_S,
+            rate_limit_reserve=settings.ADMISSION_RATE_LIMIT_RESERVE,
+        )
+    return _controller
@@ -0,0 +1,135 @@
+import asyncio
+import base64
+import logging
+import time
+from collections import Counter, deque
+from typing import Awaitable, Callable, Deque, Optional
+
+from app.helpers.metrics import latency_percentiles_ms
+
+logger = logging.getLogger(__name__)
+
+# g711_ulaw at 8 kHz is one byte per sample
+ULAW_BYTES_PER_MS = 8
+LATENCY_SAMPLES = 4096
+
+
+class CoalescerStats:
+    """
+    Process-wide counters for one coalescing configuration, shared by all calls,
+    so the latency cost of a window size can be compared against the number of
+    upstream sends it saves.
+    """
+
+    def __init__(self, window_ms: int, max_bytes: int, max_latency_ms: int):
+        self.window_ms = window_ms
+        self.max_bytes = max_bytes
+        self.max_latency_ms = max_latency_ms
+        self.frames_in = 0
+        self.appends_out = 0
+        self.bytes_out = 0
+        self.flush_reasons: Counter = Counter()
+        self._added_latency: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    def record_flush(self, size: int, added_latency: float, reason: str):
+        self.appends_out += 1
+        self.bytes_out += size
+        self.flush_reasons[reason] += 1
+        self._added_latency.append(added_latency)
+
+    def summary(self) -> dict:
+        """
+        Returns the counters and the added upstream latency percentiles in milliseconds.
+        """
+        return {
+            "window_ms": self.window_ms,
+            "max_bytes": self.max_bytes,
+            "max_latency_ms": self.max_latency_ms,
+            "frames_in": self.frames_in,
+            "appends_out": self.appends_out,
+            "frames_per_append": self.frames_in / self.appends_out if self.appends_out else 0.0,
+            "bytes_out": self.bytes_out,
+            "flush_reasons": dict(self.flush_reasons),
+            "added_latency_ms": latency_percentiles_ms(self._added_latency),
+        }
+
+
+class AudioCoalescer:
+    """
+    Merges consecutive Twilio media frames into a single input_audio_buffer.append
+    towards Azure once `window_ms` of audio or `max_bytes` have been buffered.
+    `send` receives the base64 payload of each batch.
+    A timer bounds how long the oldest buffered frame may wait, and flush() can be
+    called to send what is buffered right away (stop, hangup, speech events).
+
+    With both `window_ms` and `max_bytes` at 0 every frame is forwarded as-is.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str], Awaitable[None]],
+        stats: CoalescerStats,
+        window_ms: int = 0,
+        max_bytes: int = 0,
+        max_latency_ms: int = 100,
+    ):
+        self.send = send
+        self.stats = stats
+        self.enabled = window_ms > 0 or max_bytes > 0
+        limits = [limit for limit in (window_ms * ULAW_BYTES_PER_MS, max_bytes) if limit > 0]
+        self.flush_bytes = min(limits) if limits else 0
+        self.max_latency = max_latency_ms / 1000
+
+        self._buffer = bytearray()
+        self._first_frame_at: Optional[float] = None
+        self._timer: Optional[asyncio.Task] = None
+
+    async def add(self, payload: str):
+        """
+        Adds one base64 encoded g711_ulaw frame, sending it upstream when a limit is reached.
+        """
+        self.stats.frames_in += 1
+        if not self.enabled:
+            await self.send(payload)
+            self.stats.record_flush(len(payload) * 3 // 4, 0.0, "passthrough")
+            return
+
+        self._buffer += base64.b64decode(payload)
+        if self._first_frame_at is None:
+            self._first_frame_at = time.perf_counter()
+            self._timer = asyncio.create_task(self._flush_after(self.max_latency))
+
+        if len(self._buffer) >= self.flush_bytes:
+            await self.flush("window")
+
+    async def flush(self, reason: str = "event"):
+        """
+        Sends whatever is buffered as one append.
+        """
+        if not self._buffer:
+            return
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        self._timer = None
+
+        # Swap the buffer out before awaiting so frames added meanwhile start a new batch
+        audio, first_frame_at = self._buffer, self._first_frame_at
+        self._buffer, self._first_frame_at = bytearray(), None
+
+        await self.send(base64.b64encode(audio).decode("ascii"))
+        self.stats.record_flush(len(audio), time.perf_counter() - first_frame_at, reason)
+
+    def close(self):
+        """
+        Cancels the pending max-latency timer, dropping anything still buffered.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    async def _flush_after(self, delay: float):
+        await asyncio.sleep(delay)
+        try:
+            await self.flush("max_latency")
+        except Exception as e:
+            logger.error(f"Error flushing coalesced audio to Azure: {e}")
@@ -0,0 +1,227 @@
+import base64
+import math
+
+import numpy as np
+
+# G.711 μ-law bias added to the magnitude before encoding
+ULAW_BIAS = 0x84
+# 14-bit magnitude above which μ-law encoding saturates
+ULAW_CLIP = 8159
+PCM16_FULL_SCALE = 32768.0
+
+
+def _build_ulaw_table() -> np.ndarray:
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + ULAW_BIAS) << exponent) - ULAW_BIAS
+    return np.where(codes & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+# Linear PCM16 sample and its square for every μ-law byte
+ULAW_TO_PCM16 = _build_ulaw_table()
+ULAW_POWER = ULAW_TO_PCM16.astype(np.float64) ** 2
+
+
+def _build_ulaw_encode_table() -> np.ndarray:
+    # Same rounding as G.711 reference encoders: 14-bit magnitude, biased, clipped
+    samples = np.arange(65536, dtype=np.int32)
+    samples = np.where(samples >= 32768, samples - 65536, samples)
+    shifted = samples >> 2
+    sign_mask = np.where(shifted < 0, 0x7F, 0xFF)
+    magnitude = np.minimum(np.abs(shifted), ULAW_CLIP) + (ULAW_BIAS >> 2)
+    exponent = np.minimum(np.floor(np.log2(magnitude)).astype(np.int32) - 5, 7)
+    mantissa = (magnitude >> (exponent + 1)) & 0x0F
+    # Magnitudes past the last segment saturate to its top code
+    codes = np.where(magnitude > 0x1FFF, 0x7F, exponent << 4 | mantissa)
+    return (codes ^ sign_mask).astype(np.uint8)
+
+
+# μ-law byte of every PCM16 sample, indexed by the sample's 16 bits read as unsigned
+PCM16_TO_ULAW = _build_ulaw_encode_table()
+
+
+def ulaw_to_pcm16(audio: bytes) -> np.ndarray:
+    """
+    Decodes g711_ulaw bytes into PCM16 samples.
+    """
+    return ULAW_TO_PCM16[np.frombuffer(audio, dtype=np.uint8)]
+
+
+def mean_power(audio: bytes) -> float:
+    """
+    Mean square of the PCM16 samples of g711_ulaw bytes, without decoding them
+    into an intermediate array of samples.
+    """
+    if not audio:
+        return 0.0
+    return float(ULAW_POWER[np.frombuffer(audio, dtype=np.uint8)].mean())
+
+
+def dbfs_to_power(dbfs: float) -> float:
+    """
+    Mean square of a PCM16 signal at the given RMS level in dBFS.
+    """
+    return (PCM16_FULL_SCALE * 10 ** (dbfs / 20)) ** 2
+
+
+def power_to_dbfs(power: float) -> float:
+    if power <= 0:
+        return -math.inf
+    return 10 * math.log10(power) - 20 * math.log10(PCM16_FULL_SCALE)
+
+
+AZURE_FORMATS = ("g711_ulaw", "pcm16")
+# Sample rate of the pcm16 audio of Azure realtime sessions, three times Twilio's 8 kHz
+PCM16_RATE_FACTOR = 3
+
+
+def pcm16_to_ulaw(samples: np.ndarray) -> bytes:
+    """
+    Encodes PCM16 samples into g711_ulaw bytes.
+    """
+    return PCM16_TO_ULAW[samples.astype(np.int16, copy=False).view(np.uint16)].tobytes()
+
+
+def lowpass_taps(factor: int, taps_per_phase: int = 16, cutoff: float = 0.9) -> np.ndarray:
+    """
+    Kaiser-windowed sinc low-pass filter for resampling by `factor`, cutting off
+    at `cutoff` times the Nyquist frequency of the lower rate, with unity DC gain.
+    """
+    size = factor * taps_per_phase
+    t = np.arange(size) - (size - 1) / 2
+    fc = cutoff / (2 * factor)
+    taps = 2 * fc * np.sinc(2 * fc * t) * np.kaiser(size, 8.0)
+    return (taps / taps.sum()).astype(np.float32)
+
+
+class _SampleHistory:
+    """
+    Preallocated input buffer of a streaming FIR filter: the tail of the previous
+    frames followed by the current frame, grown only when a larger frame arrives.
+    """
+
+    def __init__(self, keep: int, capacity: int = 4800):
+        self._buffer = np.zeros(keep + capacity, dtype=np.float32)
+        self._held = keep
+
+    def extend(self, samples: np.ndarray):
+        end = self._held + len(samples)
+        if end > len(self._buffer):
+            buffer = np.zeros(end * 2, dtype=np.float32)
+            buffer[:self._held] = self._buffer[:self._held]
+            self._buffer = buffer
+        self._buffer[self._held:end] = samples
+        self._held = end
+
+    def windows(self, size: int, step: int = 1) -> np.ndarray:
+        """
+        View of every `step`-th run of `size` consecutive held samples,
+        one per row. Built directly on the buffer: sliding_window_view costs more
+        than the filtering of a 20 ms frame.
+        """
+        count = (self._held - size) // step + 1
+        itemsize = self._buffer.itemsize
+        return np.ndarray((max(count, 0), size), np.float32, self._buffer, 0, (step * itemsize, itemsize))
+
+    def keep_from(self, start: int):
+        tail = self._held - start
+        self._buffer[:tail] = self._buffer[start:self._held]
+        self._held = tail
+
+
+class Upsampler:
+    """
+    Streaming polyphase interpolator by an integer `factor`. Each input sample
+    yields `factor` output samples, one per phase of the low-pass filter, all
+    computed for a whole frame with a single matrix product.
+    """
+
+    def __init__(self, factor: int = PCM16_RATE_FACTOR, taps_per_phase: int = 16):
+        taps = lowpass_taps(factor, taps_per_phase) * factor
+        # phases[j, k] weighs input sample n - j into output sample factor * n + k, newest input last
+        self._phases = np.ascontiguousarray(taps.reshape(taps_per_phase, factor)[::-1])
+        self._size = taps_per_phase
+        self._history = _SampleHistory(taps_per_phase - 1)
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        self._history.extend(samples)
+        windows = self._history.windows(self._size)
+        output = (windows @ self._phases).ravel()
+        self._history.keep_from(len(windows))
+        return output
+
+
+class Downsampler:
+    """
+    Streaming decimator by an integer `factor`: low-pass filters the input and
+    keeps every `factor`-th sample, computing only the samples kept. Input frames
+    need not be multiples of `factor`; the remainder is carried to the next frame.
+    """
+
+    def __init__(self, factor: int = PCM16_RATE_FACTOR, taps_per_phase: int = 16):
+        self._taps = lowpass_taps(factor, taps_per_phase)[::-1].copy()
+        self._factor = factor
+        self._size = len(self._taps)
+        self._history = _SampleHistory(self._size - 1)
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        self._history.extend(samples)
+        windows = self._history.windows(self._size, self._factor)
+        output = windows @ self._taps
+        self._history.keep_from(len(windows) * self._factor)
+        return output
+
+
+def to_pcm16(samples: np.ndarray) -> np.ndarray:
+    """
+    Rounds and saturates filter output into PCM16 samples, overwriting `samples`.
+    """
+    np.rint(samples, out=samples)
+    np.clip(samples, -32768, 32767, out=samples)
+    return samples.astype("<i2")
+
+
+class AudioTranscoder:
+    """
+    Converts the audio of one call between Twilio's 8 kHz g711_ulaw and the format
+    of the Azure session: g711_ulaw is passed through as-is, pcm16 is 24 kHz
+    little-endian PCM. The resamplers keep their state from frame to frame, so
+    each direction must be fed in order.
+    """
+
+    def __init__(self, azure_format: str = "g711_ulaw"):
+        if azure_format not in AZURE_FORMATS:
+            raise ValueError(f"Unknown Azure audio format '{azure_format}', expected one of {AZURE_FORMATS}.")
+        self.passthrough = azure_format == "g711_ulaw"
+        self._upsampler = Upsampler()
+        self._downsampler = Downsampler()
+        # Trailing byte of a pcm16 delta that split a sample
+        self._pending = b""
+
+    def to_azure(self, payload: str) -> str:
+        """
+        Converts a base64 caller payload into the Azure session format.
+        """
+        if self.passthrough:
+            return payload
+        return base64.b64encode(self.encode_azure(base64.b64decode(payload))).decode("ascii")
+
+    def from_azure(self, payload: str) -> str:
+        """
+        Converts a base64 Azure audio delta into g711_ulaw for Twilio.
+        """
+        if self.passthrough:
+            return payload
+        return base64.b64encode(self.decode_azure(base64.b64decode(payload))).decode("ascii")
+
+    def encode_azure(self, audio: bytes) -> bytes:
+        return to_pcm16(self._upsampler.process(ULAW_TO_PCM16[np.frombuffer(audio, dtype=np.uint8)])).tobytes()
+
+    def decode_azure(self, audio: bytes) -> bytes:
+        if self._pending:
+            audio, self._pending = self._pending + audio, b""
+        if len(audio) % 2:
+            audio, self._pending = audio[:-1], audio[-1:]
+        samples = self._downsampler.process(np.frombuffer(audio, dtype="<i2"))
+        return pcm16_to_ulaw(to_pcm16(samples))
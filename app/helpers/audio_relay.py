@@ -0,0 +1,85 @@
+import base64
+import binascii
+from typing import Optional, Tuple
+
+# Pre-rendered frame templates. Base64 payloads and Twilio stream SIDs only
+# contain characters that never need JSON escaping, so they can be spliced in
+# as-is instead of going through a dict and json.dumps.
+TWILIO_MEDIA_TEMPLATE = '{"event":"media","streamSid":"%s","media":{"payload":"%s"}}'
+AZURE_APPEND_TEMPLATE = '{"type":"input_audio_buffer.append","audio":"%s"}'
+# Asks Azure for a response; sent by the media stream, the tool dispatcher and the greeting cache
+RESPONSE_CREATE_MESSAGE = '{"type":"response.create"}'
+
+_TIMESTAMP_KEY = '"timestamp":"'
+_PAYLOAD_KEY = '"payload":"'
+_DELTA_KEY = '"delta":"'
+_ITEM_ID_KEY = '"item_id":"'
+
+
+def _find_string(message: str, key: str) -> Optional[str]:
+    start = message.find(key)
+    if start == -1:
+        return None
+    start += len(key)
+    end = message.find('"', start)
+    if end == -1:
+        return None
+    return message[start:end]
+
+
+def render_twilio_media(stream_sid: str, payload: str) -> str:
+    """
+    Builds an outbound Twilio media frame around an already base64 encoded g711_ulaw payload.
+    """
+    return TWILIO_MEDIA_TEMPLATE % (stream_sid, payload)
+
+
+def render_azure_append(payload: str) -> str:
+    """
+    Builds an input_audio_buffer.append event around an already base64 encoded g711_ulaw payload.
+    """
+    return AZURE_APPEND_TEMPLATE % payload
+
+
+def extract_twilio_media(message: str) -> Optional[Tuple[int, str]]:
+    """
+    Pulls the timestamp and payload out of a raw Twilio media frame without decoding the JSON.
+
+    Returns:
+        Optional[Tuple[int, str]]: (timestamp, payload) or None when the frame is not a
+        media frame in the expected compact layout, in which case the caller should
+        fall back to a full JSON decode.
+    """
+    if '"event":"media"' not in message:
+        return None
+
+    timestamp = _find_string(message, _TIMESTAMP_KEY)
+    payload = _find_string(message, _PAYLOAD_KEY)
+    if timestamp is None or payload is None or not timestamp.isdigit() or "\\" in payload:
+        return None
+    return int(timestamp), payload
+
+
+def extract_azure_audio_delta(message: str) -> Optional[Tuple[Optional[str], str]]:
+    """
+    Pulls the item id and base64 audio out of a raw response.audio.delta event without decoding the JSON.
+
+    Returns:
+        Optional[Tuple[Optional[str], str]]: (item_id, delta) or None when the delta
+        could not be found, in which case the caller should decode the full message.
+    """
+    delta = _find_string(message, _DELTA_KEY)
+    if delta is None or "\\" in delta:
+        return None
+    return _find_string(message, _ITEM_ID_KEY), delta
+
+
+def is_valid_payload(payload: str) -> bool:
+    """
+    Checks once that a payload is well-formed base64 without re-encoding it.
+    """
+    try:
+        base64.b64decode(payload, validate=True)
+    except (binascii.Error, TypeError, ValueError):
+        return False
+    return True
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, Tuple
+
+import websockets
+
+from app.helpers.metrics import latency_percentiles_ms
+
+logger = logging.getLogger(__name__)
+
+# Number of recent checkout latencies kept for the percentile figures in stats()
+LATENCY_SAMPLES = 1024
+
+
+class AzureSessionPool:
+    """
+    Keeps a number of pre-connected and pre-configured Azure realtime WebSocket
+    sessions ready so that a new Twilio stream does not wait for the TCP/TLS
+    handshake and the session.update round-trip.
+
+    Idle sessions are pinged periodically, dropped once they are older than
+    `max_age` seconds and refilled in the background up to `size`.
+    `on_checkout`, if given, is called with the latency and hit/miss of every checkout.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        configure: Callable[[websockets.WebSocketClientProtocol], Awaitable[None]],
+        size: int = 2,
+        max_age: float = 600.0,
+        ping_interval: float = 15.0,
+        ping_timeout: float = 5.0,
+        on_checkout: Optional[Callable[[float, bool], None]] = None,
+    ):
+        self.url = url
+        self.configure = configure
+        self.size = max(size, 0)
+        self.max_age = max_age
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.on_checkout = on_checkout
+
+        self._idle: Deque[Tuple[websockets.WebSocketClientProtocol, float]] = deque()
+        self._refill_needed: Optional[asyncio.Event] = None
+        self._maintain_task: Optional[asyncio.Task] = None
+        self._connecting = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+        self.connect_failures = 0
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    async def connect(self) -> websockets.WebSocketClientProtocol:
+        """
+        Opens and configures a brand new Azure realtime session.
+        """
+        azure_ws = await websockets.connect(self.url, ssl=True if self.url.startswith("wss://") else None)
+        try:
+            await self.configure(azure_ws)
+        except Exception:
+            await azure_ws.close()
+            raise
+        return azure_ws
+
+    async def start(self):
+        """
+        Starts the background task that keeps the pool filled.
+        """
+        if self.size == 0 or self._maintain_task is not None:
+            return
+        self._refill_needed = asyncio.Event()
+        self._maintain_task = asyncio.create_task(self._maintain(), name="azure_session_pool")
+        self._refill_needed.set()
+        logger.info(f"Azure session pool started with target size {self.size}.")
+
+    async def stop(self):
+        """
+        Stops the background task and closes all idle sessions.
+        """
+        if self._maintain_task is not None:
+            self._maintain_task.cancel()
+            try:
+                await self._maintain_task
+            except asyncio.CancelledError:
+                pass
+            self._maintain_task = None
+
+        while self._idle:
+            azure_ws, _ = self._idle.popleft()
+            await self._close_quietly(azure_ws)
+        logger.info("Azure session pool stopped.")
+
+    async def acquire(self) -> websockets.WebSocketClientProtocol:
+        """
+        Returns a ready Azure session, taken from the pool when one is available
+        or opened on demand otherwise. The caller owns and closes the session.
+        """
+        started = time.perf_counter()
+        azure_ws = None
+        while self._idle:
+            candidate, created_at = self._idle.popleft()
+            if self._is_usable(candidate, created_at):
+                azure_ws = candidate
+                break
+            self.discarded += 1
+            asyncio.create_task(self._close_quietly(candidate))
+
+        if self._maintain_task is not None:
+            self._refill_needed.set()
+
+        hit = azure_ws is not None
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+            azure_ws = await self.connect()
+
+        latency = time.perf_counter() - started
+        self._latencies.append(latency)
+        if self.on_checkout is not None:
+            self.on_checkout(latency, hit)
+        logger.info("Azure session checked out (%s) in %.1fms.", "hit" if hit else "miss", latency * 1000)
+        return azure_ws
+
+    def stats(self) -> dict:
+        """
+        Returns pool counters and checkout latency figures in milliseconds.
+        """
+        checkouts = self.hits + self.misses
+        return {
+            "target_size": self.size,
+            "idle": len(self._idle),
+            "connecting": self._connecting,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / checkouts if checkouts else 0.0,
+            "discarded": self.discarded,
+            "connect_failures": self.connect_failures,
+            "checkout_latency_ms": latency_percentiles_ms(self._latencies),
+        }
+
+    def _is_usable(self, azure_ws, created_at: float) -> bool:
+        return azure_ws.open and time.monotonic() - created_at < self.max_age
+
+    async def _maintain(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._refill_needed.wait(), timeout=self.ping_interval)
+            except asyncio.TimeoutError:
+                await self._health_check()
+            self._refill_needed.clear()
+            await self._refill()
+
+    async def _health_check(self):
+        """
+        Pings every idle session and drops the stale or unresponsive ones. The
+        sessions stay in the pool while they are pinged, so calls arriving meanwhile
+        can still check them out; a session checked out before its ping failed
+        belongs to its call and is left alone.
+        """
+        idle = list(self._idle)
+        results = await asyncio.gather(*(self._ping(azure_ws, created_at) for azure_ws, created_at in idle))
+        for entry, healthy in zip(idle, results):
+            if healthy or entry not in self._idle:
+                continue
+            self._idle.remove(entry)
+            self.discarded += 1
+            await self._close_quietly(entry[0])
+
+    async def _ping(self, azure_ws, created_at: float) -> bool:
+        if not self._is_usable(azure_ws, created_at):
+            return False
+        try:
+            pong_waiter = await azure_ws.ping()
+            await asyncio.wait_for(pong_waiter, timeout=self.ping_timeout)
+            return True
+        except Exception as e:
+            logger.warning(f"Pooled Azure session failed health ping: {e}")
+            return False
+
+    async def _refill(self):
+        missing = self.size - len(self._idle) - self._connecting
+        if missing <= 0:
+            return
+        self._connecting += missing
+        try:
+            results = await asyncio.gather(*(self.connect() for _ in range(missing)), return_exceptions=True)
+        finally:
+            self._connecting -= missing
+
+        for result in results:
+            if isinstance(result, Exception):
+                self.connect_failures += 1
+                logger.error(f"Failed to pre-connect Azure session: {result}")
+            else:
+                self._idle.append((result, time.monotonic()))
+
+    async def _close_quietly(self, azure_ws):
+        try:
+            await azure_ws.close()
+        except Exception as e:
+            logger.debug(f"Error closing pooled Azure session: {e}")
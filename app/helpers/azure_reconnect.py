@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, List, Optional, Tuple
+
+import websockets
+
+from app.helpers import codec
+from app.helpers.audio_coalescer import ULAW_BYTES_PER_MS
+from app.helpers.metrics import AZURE_RECONNECTS, AZURE_RECONNECT_SECONDS
+from app.helpers.playback_tracker import decoded_length
+
+logger = logging.getLogger(__name__)
+
+Connector = Callable[[], Awaitable[websockets.WebSocketClientProtocol]]
+
+RESUME_INSTRUCTIONS = (
+    "The call was briefly interrupted by a technical issue and has now resumed. "
+    "Continue the conversation from where it stopped, without greeting the customer again "
+    "or repeating what was already said. Conversation so far:"
+)
+
+
+class ReconnectStats:
+    """
+    Process-wide figures of the Azure reconnects of all calls.
+    """
+
+    def __init__(self):
+        self.drops = 0
+        self.reconnects = 0
+        self.failures = 0
+        self.attempts = 0
+        self.frames_buffered = 0
+        self.frames_dropped = 0
+        self.last_gap_ms = 0.0
+        self.max_gap_ms = 0.0
+
+    def summary(self) -> dict:
+        return {
+            "drops": self.drops,
+            "reconnects": self.reconnects,
+            "failures": self.failures,
+            "attempts": self.attempts,
+            "frames_buffered": self.frames_buffered,
+            "frames_dropped": self.frames_dropped,
+            "last_gap_ms": self.last_gap_ms,
+            "max_gap_ms": self.max_gap_ms,
+        }
+
+
+class AudioRingBuffer:
+    """
+    Holds the caller audio received while there is no Azure session, up to the
+    latest `max_ms`; older frames are dropped as new ones arrive.
+    """
+
+    def __init__(self, max_ms: int, stats: ReconnectStats):
+        self.max_bytes = max(max_ms, 0) * ULAW_BYTES_PER_MS
+        self.stats = stats
+        # (payload, size in bytes)
+        self._frames: Deque[Tuple[str, int]] = deque()
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def add(self, payload: str):
+        size = decoded_length(payload)
+        self._frames.append((payload, size))
+        self._bytes += size
+        self.stats.frames_buffered += 1
+        while self._frames and self._bytes > self.max_bytes:
+            _, dropped = self._frames.popleft()
+            self._bytes -= dropped
+            self.stats.frames_dropped += 1
+
+    def drain(self) -> List[str]:
+        payloads = [payload for payload, _ in self._frames]
+        self._frames.clear()
+        self._bytes = 0
+        return payloads
+
+
+class ConversationHistory:
+    """
+    The latest transcript segments of a call, replayed into a new Azure session
+    as a single condensed system message so the model picks up where it stopped.
+    """
+
+    def __init__(self, max_segments: int = 20, max_chars: int = 4000):
+        self.max_chars = max_chars
+        self._segments: Deque[Tuple[str, str]] = deque(maxlen=max(max_segments, 0))
+
+    def add(self, role: str, text: str):
+        if self._segments.maxlen:
+            self._segments.append((role, text))
+
+    def resume_message(self) -> Optional[str]:
+        """
+        Returns the conversation.item.create message carrying the history, None
+        when there is nothing to replay.
+        """
+        if not self._segments:
+            return None
+        lines, size = [], 0
+        # Newest first, so the most recent turns are kept when the history is too long
+        for role, text in reversed(self._segments):
+            line = f"{role.capitalize()}: {text}"
+            if lines and size + len(line) > self.max_chars:
+                break
+            lines.append(line)
+            size += len(line) + 1
+        return codec.dumps({
+            "type": "conversation.item.create",
+            "item": {
+                "type": "message",
+                "role": "system",
+                "content": [{"type": "input_text", "text": "\n".join([RESUME_INSTRUCTIONS, *reversed(lines)])}],
+            },
+        })
+
+
+class AzureReconnector:
+    """
+    Opens a replacement Azure session after the one of a call dropped. Each round
+    tries the `connectors` in order (e.g. the session pool of the primary
+    deployment, then a secondary endpoint), each bounded by `connect_timeout`;
+    rounds are separated by an exponential backoff starting at `backoff`.
+    `attempts` of 0 disables reconnecting.
+    """
+
+    def __init__(
+        self,
+        connectors: List[Connector],
+        stats: ReconnectStats,
+        attempts: int = 3,
+        backoff: float = 0.25,
+        backoff_max: float = 2.0,
+        connect_timeout: float = 5.0,
+    ):
+        self.connectors = connectors
+        self.stats = stats
+        self.attempts = attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.connect_timeout = connect_timeout
+
+    @property
+    def enabled(self) -> bool:
+        return self.attempts > 0 and bool(self.connectors)
+
+    async def reconnect(self) -> websockets.WebSocketClientProtocol:
+        """
+        Returns a new configured session, or raises the last connection error once
+        every attempt failed.
+        """
+        started = time.perf_counter()
+        self.stats.drops += 1
+        delay = self.backoff
+        error: Optional[Exception] = None
+        for attempt in range(self.attempts):
+            if attempt:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.backoff_max)
+            for index, connect in enumerate(self.connectors):
+                self.stats.attempts += 1
+                try:
+                    azure_ws = await asyncio.wait_for(connect(), timeout=self.connect_timeout)
+                except Exception as e:
+                    error = e
+                    logger.warning(f"Azure reconnect attempt {attempt + 1} via endpoint {index} failed: {e!r}")
+                    continue
+                self._observe(started, "ok")
+                self.stats.reconnects += 1
+                logger.info("Azure session reconnected via endpoint %s after %s attempt(s).", index, attempt + 1)
+                return azure_ws
+
+        self._observe(started, "failed")
+        self.stats.failures += 1
+        raise error or ConnectionError("No Azure endpoint to reconnect to.")
+
+    def _observe(self, started: float, result: str):
+        gap = time.perf_counter() - started
+        self.stats.last_gap_ms = gap * 1000
+        self.stats.max_gap_ms = max(self.stats.max_gap_ms, gap * 1000)
+        AZURE_RECONNECTS.labels(result=result).inc()
+        AZURE_RECONNECT_SECONDS.labels(result=result).observe(gap)
@@ -0,0 +1,339 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from app.helpers.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+SEGMENT = "segment"
+OUTCOME = "outcome"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcript_segments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    call_sid TEXT NOT NULL,
+    stream_sid TEXT,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transcript_segments_call ON transcript_segments (call_sid, seq);
+CREATE TABLE IF NOT EXISTS call_outcomes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    call_sid TEXT NOT NULL,
+    customer_name TEXT,
+    is_interested INTEGER,
+    comments TEXT,
+    contact_number TEXT,
+    arguments TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS call_outcomes_created ON call_outcomes (created_at);
+CREATE INDEX IF NOT EXISTS call_outcomes_call ON call_outcomes (call_sid);
+"""
+
+
+def outcome_from_arguments(call_sid: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Builds an outcome record from the arguments of the hangup_call function.
+    """
+    interested = arguments.get("is_Intrested")
+    contact_number = arguments.get("ContactNumber")
+    return {
+        "call_sid": call_sid,
+        "customer_name": arguments.get("customer_name"),
+        "is_interested": bool(interested) if interested is not None else None,
+        "comments": arguments.get("Comments"),
+        "contact_number": str(contact_number) if contact_number is not None else None,
+        "arguments": arguments,
+        "created_at": time.time(),
+    }
+
+
+class CallLogBackend:
+    """
+    Base class for call log backends: an append-only store of transcript segments
+    and call outcomes. All methods block and are run with asyncio.to_thread.
+    """
+
+    def write(self, segments: List[dict], outcomes: List[dict]):
+        raise NotImplementedError
+
+    def transcript(self, call_sid: str) -> List[dict]:
+        raise NotImplementedError
+
+    def outcomes(self, since: Optional[float] = None, interested: Optional[bool] = None, limit: int = 100) -> List[dict]:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SQLiteCallLogBackend(CallLogBackend):
+    """
+    Call log in SQLite, indexed by call and by time. Can be shared by the workers
+    of one node.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def write(self, segments: List[dict], outcomes: List[dict]):
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany(
+                    "INSERT INTO transcript_segments (call_sid, stream_sid, seq, role, text, created_at) "
+                    "VALUES (:call_sid, :stream_sid, :seq, :role, :text, :created_at)",
+                    segments,
+                )
+                self._db.executemany(
+                    "INSERT INTO call_outcomes (call_sid, customer_name, is_interested, comments, contact_number, arguments, created_at) "
+                    "VALUES (:call_sid, :customer_name, :is_interested, :comments, :contact_number, :arguments, :created_at)",
+                    ({**outcome, "arguments": json.dumps(outcome["arguments"])} for outcome in outcomes),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                # Otherwise the connection stays in the transaction and every later BEGIN fails
+                if self._db.in_transaction:
+                    self._db.execute("ROLLBACK")
+                raise
+
+    def transcript(self, call_sid: str) -> List[dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT call_sid, stream_sid, seq, role, text, created_at FROM transcript_segments "
+                "WHERE call_sid = ? ORDER BY seq",
+                (call_sid,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def outcomes(self, since: Optional[float] = None, interested: Optional[bool] = None, limit: int = 100) -> List[dict]:
+        query = "SELECT call_sid, customer_name, is_interested, comments, contact_number, arguments, created_at FROM call_outcomes WHERE created_at >= ?"
+        params: list = [since or 0.0]
+        if interested is not None:
+            query += " AND is_interested = ?"
+            params.append(int(interested))
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        results = []
+        for row in rows:
+            outcome = dict(row)
+            outcome["is_interested"] = bool(outcome["is_interested"]) if outcome["is_interested"] is not None else None
+            outcome["arguments"] = json.loads(outcome["arguments"])
+            results.append(outcome)
+        return results
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class JsonlCallLogBackend(CallLogBackend):
+    """
+    Call log as one JSON object per line, tagged with its kind. Easy to ship to a
+    log pipeline; queries scan the whole file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, segments: List[dict], outcomes: List[dict]):
+        lines = [json.dumps({"kind": SEGMENT, **segment}) for segment in segments]
+        lines.extend(json.dumps({"kind": OUTCOME, **outcome}) for outcome in outcomes)
+        with self._lock:
+            self._file.write("\n".join(lines) + "\n")
+            self._file.flush()
+
+    def _scan(self, kind: str):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.pop("kind", None) == kind:
+                    yield record
+
+    def transcript(self, call_sid: str) -> List[dict]:
+        return sorted((s for s in self._scan(SEGMENT) if s["call_sid"] == call_sid), key=lambda s: s["seq"])
+
+    def outcomes(self, since: Optional[float] = None, interested: Optional[bool] = None, limit: int = 100) -> List[dict]:
+        matches = [
+            outcome for outcome in self._scan(OUTCOME)
+            if outcome["created_at"] >= (since or 0.0) and (interested is None or outcome["is_interested"] == interested)
+        ]
+        matches.sort(key=lambda outcome: outcome["created_at"], reverse=True)
+        return matches[:limit]
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class CallLog:
+    """
+    Write-behind pipeline in front of a CallLogBackend. Transcript segments and
+    outcomes are queued without blocking the media stream and written in batches
+    from a worker thread, once `batch_size` records are pending or every
+    `flush_interval` seconds. At most `max_pending` records are held; beyond that
+    the oldest are dropped. Whatever is pending is written on stop().
+    """
+
+    def __init__(self, backend: CallLogBackend, batch_size: int = 100, flush_interval: float = 1.0, max_pending: int = 10000):
+        self.backend = backend
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.max_pending = max(max_pending, self.batch_size)
+
+        self._pending: Deque[tuple] = deque()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    async def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="call_log_writer")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        await asyncio.to_thread(self.backend.close)
+
+    def add_segment(self, call_sid: str, role: str, text: str, seq: int, stream_sid: Optional[str] = None):
+        """
+        Queues transcript segment number `seq` ("agent" or "customer") of a call.
+        """
+        self._put((SEGMENT, {
+            "call_sid": call_sid,
+            "stream_sid": stream_sid,
+            "seq": seq,
+            "role": role,
+            "text": text,
+            "created_at": time.time(),
+        }))
+
+    def add_outcome(self, call_sid: str, arguments: Dict[str, Any]):
+        """
+        Queues the outcome of a call from the hangup_call function arguments.
+        """
+        self._put((OUTCOME, outcome_from_arguments(call_sid, arguments)))
+
+    def _put(self, record: tuple):
+        if len(self._pending) >= self.max_pending:
+            self._pending.popleft()
+            self.dropped += 1
+        self._pending.append(record)
+        if len(self._pending) >= self.batch_size and self._wake is not None:
+            self._wake.set()
+
+    async def flush(self):
+        """
+        Writes the pending records now.
+        """
+        while self._pending:
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            segments = [record for kind, record in batch if kind == SEGMENT]
+            outcomes = [record for kind, record in batch if kind == OUTCOME]
+            try:
+                await asyncio.to_thread(self.backend.write, segments, outcomes)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error writing {len(batch)} call log records, will retry: {e}")
+                # Keep them for the next round unless newer records already fill the queue
+                room = self.max_pending - len(self._pending)
+                self._pending.extendleft(reversed(batch[:room]))
+                self.dropped += len(batch) - min(room, len(batch))
+                return
+            self.written += len(batch)
+
+    async def _run(self):
+        while True:
+            try:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in call log writer: {e}", exc_info=True)
+
+    async def transcript(self, call_sid: str) -> List[dict]:
+        """
+        Returns the transcript segments of a call in order. Segments of a call in
+        progress show up after at most `flush_interval` seconds.
+        """
+        return await asyncio.to_thread(self.backend.transcript, call_sid)
+
+    async def outcomes(self, since: Optional[float] = None, interested: Optional[bool] = None, limit: int = 100) -> List[dict]:
+        """
+        Returns call outcomes, newest first, optionally since a UNIX time and only
+        the interested (or uninterested) customers.
+        """
+        return await asyncio.to_thread(self.backend.outcomes, since, interested, limit)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+_call_log: Optional[CallLog] = None
+
+
+def get_call_log() -> CallLog:
+    """
+    Returns the process-wide call log selected by CALL_LOG_BACKEND.
+    """
+    global _call_log
+    if _call_log is None:
+        settings = get_settings()
+        if settings.CALL_LOG_BACKEND == "sqlite":
+            backend = SQLiteCallLogBackend(settings.CALL_LOG_PATH)
+        elif settings.CALL_LOG_BACKEND == "jsonl":
+            backend = JsonlCallLogBackend(settings.CALL_LOG_PATH)
+        else:
+            raise ValueError(f"Unknown CALL_LOG_BACKEND '{settings.CALL_LOG_BACKEND}'.")
+        _call_log = CallLog(
+            backend,
+            batch_size=settings.CALL_LOG_BATCH_SIZE,
+            flush_interval=settings.CALL_LOG_FLUSH_INTERVAL_S,
+            max_pending=settings.CALL_LOG_MAX_PENDING,
+        )
+        logger.info(f"Using '{settings.CALL_LOG_BACKEND}' call log at {settings.CALL_LOG_PATH}.")
+    return _call_log
@@ -0,0 +1,229 @@
+import asyncio
+import base64
+import logging
+import os
+import re
+import struct
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.helpers.audio_coalescer import ULAW_BYTES_PER_MS
+from app.helpers.audio_codec import ULAW_TO_PCM16
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("ulaw", "pcm16")
+
+# Recording names come from the stream start event, so they may not carry path separators or dots
+NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+# μ-law code of a zero sample
+ULAW_SILENCE = 0xFF
+
+# Log record: kind, position in bytes from the start of the stream, audio length
+RECORD_HEADER = struct.Struct("<BIH")
+CALLER, AGENT, AGENT_CLEAR = 0, 1, 2
+MAX_RECORD_AUDIO = 0xFFFF
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_MULAW = 7
+
+
+def wav_header(frames: int, audio_format: str) -> bytes:
+    """
+    Header of a stereo 8 kHz WAV file holding `frames` sample frames.
+    """
+    if audio_format == "pcm16":
+        data_size = frames * 4
+        fmt = struct.pack("<HHIIHH", WAVE_FORMAT_PCM, 2, 8000, 32000, 4, 16)
+        chunks = b"fmt " + struct.pack("<I", len(fmt)) + fmt
+    else:
+        data_size = frames * 2
+        # Non-PCM formats carry cbSize and a fact chunk
+        fmt = struct.pack("<HHIIHHH", WAVE_FORMAT_MULAW, 2, 8000, 16000, 2, 8, 0)
+        chunks = b"fmt " + struct.pack("<I", len(fmt)) + fmt + b"fact" + struct.pack("<II", 4, frames)
+    chunks += b"data" + struct.pack("<I", data_size)
+    return b"RIFF" + struct.pack("<I", 4 + len(chunks) + data_size) + b"WAVE" + chunks
+
+
+class CallRecorder:
+    """
+    Records both sides of a call into a stereo WAV file, the caller on the left
+    channel and the agent on the right.
+
+    While the call runs, audio is appended with its position to a preallocated
+    buffer of `chunk_bytes`. Each full buffer is appended to a log file on disk
+    by a worker thread, so the relay loop only copies bytes. At most
+    `max_pending_bytes` may wait for the disk; audio beyond that is dropped.
+
+    Positions follow the Twilio media timestamps of the caller audio. Agent audio
+    is placed right after the previous agent audio, or at the latest caller
+    timestamp if it has fallen behind, as Twilio plays it. When playback is
+    cleared on barge-in, the agent audio not yet heard is erased. On finish() a
+    worker thread lays the log out into the WAV file, μ-law or PCM16, and removes it.
+    Audio beyond `max_seconds` is not recorded.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        name: str,
+        audio_format: str = "ulaw",
+        chunk_bytes: int = 256 * 1024,
+        max_pending_bytes: int = 4 * 1024 * 1024,
+        max_seconds: int = 3600,
+    ):
+        if audio_format not in FORMATS:
+            raise ValueError(f"Unknown recording format '{audio_format}', expected one of {FORMATS}.")
+        if not NAME_PATTERN.match(name):
+            raise ValueError(f"Invalid recording name {name!r}.")
+        self.path = os.path.join(directory, f"{name}.wav")
+        self.log_path = os.path.join(directory, f"{name}.rec")
+        self.audio_format = audio_format
+        self.max_pending_bytes = max_pending_bytes
+        self.max_position = max_seconds * 1000 * ULAW_BYTES_PER_MS
+
+        self._buffer = bytearray(max(chunk_bytes, RECORD_HEADER.size + MAX_RECORD_AUDIO))
+        self._used = 0
+        self._pending_bytes = 0
+        self._writing: Optional[asyncio.Future] = None
+        self._directory = directory
+        self._clock = 0
+        self._agent_position = 0
+
+        self.bytes_recorded = 0
+        self.bytes_dropped = 0
+        self.write_failures = 0
+
+    def add_caller(self, payload: str, timestamp_ms: int):
+        """
+        Records a base64 caller frame received at `timestamp_ms` of the stream.
+        """
+        position = timestamp_ms * ULAW_BYTES_PER_MS
+        audio = base64.b64decode(payload)
+        self._clock = max(self._clock, position)
+        self._record(CALLER, position, audio)
+
+    def add_agent(self, payload: str):
+        """
+        Records a base64 agent audio chunk sent to Twilio.
+        """
+        audio = base64.b64decode(payload)
+        position = max(self._agent_position, self._clock)
+        self._agent_position = position + len(audio)
+        self._record(AGENT, position, audio)
+
+    def clear_agent(self):
+        """
+        Erases the agent audio queued past the current position, which Twilio drops on clear.
+        """
+        self._agent_position = self._clock
+        self._record(AGENT_CLEAR, self._clock, b"")
+
+    async def finish(self) -> Optional[str]:
+        """
+        Writes what is buffered and lays the recording out into the WAV file.
+        Returns its path, None when nothing could be written.
+        """
+        self._flush()
+        if self._writing is not None:
+            await self._writing
+        if not self.bytes_recorded or self.write_failures:
+            await asyncio.to_thread(self._remove_log)
+            return None
+        try:
+            frames = await asyncio.to_thread(self._render)
+        except Exception as e:
+            logger.error(f"Failed to write recording {self.path}: {e}", exc_info=True)
+            return None
+        logger.info(
+            f"Recording {self.path} written: {frames / 8000:.1f}s, {self.bytes_recorded} bytes of audio, "
+            f"{self.bytes_dropped} dropped."
+        )
+        return self.path
+
+    def _record(self, kind: int, position: int, audio: bytes):
+        if position >= self.max_position:
+            self.bytes_dropped += len(audio)
+            return
+        for offset in range(0, max(len(audio), 1), MAX_RECORD_AUDIO):
+            part = audio[offset:offset + MAX_RECORD_AUDIO]
+            if self._used + RECORD_HEADER.size + len(part) > len(self._buffer):
+                self._flush()
+            if self._pending_bytes + self._used > self.max_pending_bytes:
+                self.bytes_dropped += len(part)
+                continue
+            RECORD_HEADER.pack_into(self._buffer, self._used, kind, position + offset, len(part))
+            self._used += RECORD_HEADER.size
+            self._buffer[self._used:self._used + len(part)] = part
+            self._used += len(part)
+            self.bytes_recorded += len(part)
+
+    def _flush(self):
+        if not self._used:
+            return
+        data = bytes(self._buffer[:self._used])
+        self._used = 0
+        self._pending_bytes += len(data)
+        self._writing = asyncio.ensure_future(self._append(self._writing, data))
+
+    async def _append(self, previous: Optional[asyncio.Future], data: bytes):
+        # Chained, so the chunks reach the log in order
+        if previous is not None:
+            await previous
+        try:
+            await asyncio.to_thread(self._write_log, data)
+        except Exception as e:
+            self.write_failures += 1
+            logger.error(f"Failed to write to recording log {self.log_path}: {e}")
+        finally:
+            self._pending_bytes -= len(data)
+
+    def _write_log(self, data: bytes):
+        os.makedirs(self._directory, exist_ok=True)
+        with open(self.log_path, "ab") as file:
+            file.write(data)
+
+    def _read_log(self) -> List[Tuple[int, int, bytes]]:
+        with open(self.log_path, "rb") as file:
+            log = file.read()
+        records, offset = [], 0
+        while offset < len(log):
+            kind, position, length = RECORD_HEADER.unpack_from(log, offset)
+            offset += RECORD_HEADER.size
+            records.append((kind, position, log[offset:offset + length]))
+            offset += length
+        return records
+
+    def _render(self) -> int:
+        records = self._read_log()
+        frames = min(max(position + len(audio) for _, position, audio in records), self.max_position)
+        header = wav_header(frames, self.audio_format)
+        pcm = self.audio_format == "pcm16"
+        silence = 0 if pcm else ULAW_SILENCE
+
+        with open(self.path, "wb") as file:
+            file.write(header)
+            file.truncate(len(header) + frames * (4 if pcm else 2))
+        samples = np.memmap(self.path, dtype=np.int16 if pcm else np.uint8, mode="r+", offset=len(header), shape=(frames, 2))
+        samples[:] = silence
+        agent_end = 0
+        for kind, position, audio in records:
+            if kind == AGENT_CLEAR:
+                if position < agent_end:
+                    samples[position:agent_end, 1] = silence
+                agent_end = min(agent_end, position)
+                continue
+            codes = np.frombuffer(audio, dtype=np.uint8)[:max(frames - position, 0)]
+            samples[position:position + len(codes), kind] = ULAW_TO_PCM16[codes] if pcm else codes
+            if kind == AGENT:
+                agent_end = max(agent_end, position + len(codes))
+        samples.flush()
+        del samples
+        self._remove_log()
+        return frames
+
+    def _remove_log(self):
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
@@ -0,0 +1,341 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from app.helpers.config import get_settings
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - optional dependency
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+# Call slots are members of a sorted set scored by their expiry time; checking
+# the count and adding the call happen atomically on the server.
+ACQUIRE_SLOT_SCRIPT = """
+local now, ttl, limit = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZSCORE', KEYS[1], ARGV[4]) or limit <= 0 or redis.call('ZCARD', KEYS[1]) < limit then
+    redis.call('ZADD', KEYS[1], now + ttl, ARGV[4])
+    return 1
+end
+return 0
+"""
+
+# Identifies the process serving a call, so a call can be traced back to its worker
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class CallRecord(BaseModel):
+    """
+    Shared view of a call, visible from every worker and node.
+    """
+    call_sid: str
+    status: str
+    to_phone: Optional[str] = None
+    from_phone: Optional[str] = None
+    stream_sid: Optional[str] = None
+    worker: Optional[str] = None
+    started_at: float
+    updated_at: float
+
+
+class CallStateStore:
+    """
+    Base class for call state backends. Keeps call records and delivers control
+    commands (such as "hangup") to the worker holding the call's media stream.
+    """
+
+    async def save(self, record: CallRecord):
+        raise NotImplementedError
+
+    async def get(self, call_sid: str) -> Optional[CallRecord]:
+        raise NotImplementedError
+
+    async def list_active(self) -> List[CallRecord]:
+        raise NotImplementedError
+
+    async def remove(self, call_sid: str):
+        raise NotImplementedError
+
+    async def send_command(self, call_sid: str, command: str):
+        raise NotImplementedError
+
+    async def subscribe_commands(self, call_sid: str) -> AsyncIterator[str]:
+        """
+        Subscribes to the commands sent to a call and returns them as they arrive.
+        The subscription is in place once this returns, so a command sent from
+        then on is never missed, even before the iterator is first read.
+        """
+        raise NotImplementedError
+
+    async def acquire_slot(self, call_sid: str, limit: int, ttl: float) -> bool:
+        """
+        Takes one of `limit` call slots for `ttl` seconds, or extends the slot the
+        call already holds. A `limit` of 0 always succeeds. Returns False when full.
+        """
+        raise NotImplementedError
+
+    async def release_slot(self, call_sid: str):
+        raise NotImplementedError
+
+    async def count_slots(self) -> int:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    async def update(self, call_sid: str, **fields) -> CallRecord:
+        """
+        Creates or updates the record of a call with the given fields.
+        """
+        now = time.time()
+        record = await self.get(call_sid)
+        if record is None:
+            record = CallRecord(call_sid=call_sid, status=fields.pop("status", "unknown"), started_at=now, updated_at=now)
+        record = record.model_copy(update={**fields, "updated_at": now})
+        await self.save(record)
+        return record
+
+
+class InMemoryCallStateStore(CallStateStore):
+    """
+    Keeps call state in the memory of the current process. Only suitable for a
+    single worker; use the Redis backend when running several.
+    """
+
+    def __init__(self):
+        self._records: Dict[str, CallRecord] = {}
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._slots: Dict[str, float] = {}
+
+    async def save(self, record: CallRecord):
+        self._records[record.call_sid] = record
+
+    async def get(self, call_sid: str) -> Optional[CallRecord]:
+        return self._records.get(call_sid)
+
+    async def list_active(self) -> List[CallRecord]:
+        return list(self._records.values())
+
+    async def remove(self, call_sid: str):
+        self._records.pop(call_sid, None)
+        queue = self._queues.pop(call_sid, None)
+        if queue is not None:
+            queue.put_nowait(None)
+
+    async def send_command(self, call_sid: str, command: str):
+        self._queues.setdefault(call_sid, asyncio.Queue()).put_nowait(command)
+
+    async def subscribe_commands(self, call_sid: str) -> AsyncIterator[str]:
+        return self._listen(self._queues.setdefault(call_sid, asyncio.Queue()))
+
+    async def _listen(self, queue: asyncio.Queue) -> AsyncIterator[str]:
+        while True:
+            command = await queue.get()
+            if command is None:
+                return
+            yield command
+
+    def _expire_slots(self):
+        now = time.monotonic()
+        for call_sid in [call_sid for call_sid, expires_at in self._slots.items() if expires_at <= now]:
+            del self._slots[call_sid]
+
+    async def acquire_slot(self, call_sid: str, limit: int, ttl: float) -> bool:
+        self._expire_slots()
+        if call_sid not in self._slots and 0 < limit <= len(self._slots):
+            return False
+        self._slots[call_sid] = time.monotonic() + ttl
+        return True
+
+    async def release_slot(self, call_sid: str):
+        self._slots.pop(call_sid, None)
+
+    async def count_slots(self) -> int:
+        self._expire_slots()
+        return len(self._slots)
+
+
+class RedisCallStateStore(CallStateStore):
+    """
+    Keeps call state in Redis, or any server speaking the Redis protocol, so
+    /call, /incoming-call and /media-stream can be served by different workers
+    and nodes. Commands are delivered over pub/sub: each worker holds a single
+    pattern subscription to the command channels of all calls and hands each
+    command to the calls it serves.
+    """
+
+    def __init__(self, client, ttl: int = 3600, prefix: str = "calls"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self._pubsub = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._subscribe_lock: Optional[asyncio.Lock] = None
+        # Local subscribers of each call served by this worker
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+
+    @classmethod
+    def from_url(cls, url: str, ttl: int = 3600) -> "RedisCallStateStore":
+        if aioredis is None:
+            raise RuntimeError("The redis package is required for CALL_STATE_BACKEND=redis (pip install redis).")
+        return cls(aioredis.from_url(url, decode_responses=True), ttl=ttl)
+
+    def _key(self, call_sid: str) -> str:
+        return f"{self.prefix}:{call_sid}"
+
+    def _channel(self, call_sid: str) -> str:
+        return f"{self.prefix}:{call_sid}:commands"
+
+    async def save(self, record: CallRecord):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.set(self._key(record.call_sid), record.model_dump_json(), ex=self.ttl)
+            pipe.sadd(f"{self.prefix}:active", record.call_sid)
+            await pipe.execute()
+
+    async def get(self, call_sid: str) -> Optional[CallRecord]:
+        data = await self.client.get(self._key(call_sid))
+        return CallRecord.model_validate_json(data) if data else None
+
+    async def list_active(self) -> List[CallRecord]:
+        call_sids = sorted(await self.client.smembers(f"{self.prefix}:active"))
+        if not call_sids:
+            return []
+        values = await self.client.mget([self._key(call_sid) for call_sid in call_sids])
+        expired = [call_sid for call_sid, value in zip(call_sids, values) if value is None]
+        if expired:
+            await self.client.srem(f"{self.prefix}:active", *expired)
+        return [CallRecord.model_validate_json(value) for value in values if value is not None]
+
+    async def remove(self, call_sid: str):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.delete(self._key(call_sid))
+            pipe.srem(f"{self.prefix}:active", call_sid)
+            await pipe.execute()
+
+    async def send_command(self, call_sid: str, command: str):
+        await self.client.publish(self._channel(call_sid), command)
+
+    async def update(self, call_sid: str, **fields) -> CallRecord:
+        # Optimistic transaction: retried when another worker changes the record in between
+        key = self._key(call_sid)
+        async with self.client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    data = await pipe.get(key)
+                    now = time.time()
+                    if data:
+                        record = CallRecord.model_validate_json(data)
+                    else:
+                        record = CallRecord(call_sid=call_sid, status=fields.get("status", "unknown"), started_at=now, updated_at=now)
+                    record = record.model_copy(update={**fields, "updated_at": now})
+                    pipe.multi()
+                    pipe.set(key, record.model_dump_json(), ex=self.ttl)
+                    pipe.sadd(f"{self.prefix}:active", call_sid)
+                    await pipe.execute()
+                    return record
+                except aioredis.WatchError:
+                    continue
+
+    async def subscribe_commands(self, call_sid: str) -> AsyncIterator[str]:
+        await self._subscribe_worker()
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(call_sid, []).append(queue)
+        return self._listen(call_sid, queue)
+
+    async def _subscribe_worker(self):
+        """
+        Subscribes this worker to the command channels of all calls, once.
+        """
+        if self._subscribe_lock is None:
+            self._subscribe_lock = asyncio.Lock()
+        async with self._subscribe_lock:
+            if self._pubsub is None:
+                pubsub = self.client.pubsub()
+                await pubsub.psubscribe(self._channel("*"))
+                self._pubsub = pubsub
+                self._dispatcher = asyncio.create_task(self._dispatch(pubsub), name="call_commands")
+
+    async def _dispatch(self, pubsub):
+        prefix, suffix = len(self._key("")), len(self._channel("")) - len(self._key(""))
+        while True:
+            try:
+                async for message in pubsub.listen():
+                    if message.get("type") != "pmessage":
+                        continue
+                    call_sid = message["channel"][prefix:-suffix]
+                    for queue in self._subscribers.get(call_sid, ()):
+                        queue.put_nowait(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Call command subscription failed, resubscribing: {e}")
+                await asyncio.sleep(1.0)
+
+    async def _listen(self, call_sid: str, queue: asyncio.Queue) -> AsyncIterator[str]:
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            queues = self._subscribers.get(call_sid)
+            if queues is not None:
+                queues.remove(queue)
+                if not queues:
+                    del self._subscribers[call_sid]
+
+    async def acquire_slot(self, call_sid: str, limit: int, ttl: float) -> bool:
+        acquired = await self.client.eval(
+            ACQUIRE_SLOT_SCRIPT, 1, f"{self.prefix}:slots", time.time(), ttl, limit, call_sid
+        )
+        return bool(acquired)
+
+    async def release_slot(self, call_sid: str):
+        await self.client.zrem(f"{self.prefix}:slots", call_sid)
+
+    async def count_slots(self) -> int:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zremrangebyscore(f"{self.prefix}:slots", "-inf", time.time())
+            pipe.zcard(f"{self.prefix}:slots")
+            _, count = await pipe.execute()
+        return count
+
+    async def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        await self.client.aclose()
+
+
+_store: Optional[CallStateStore] = None
+
+
+def get_call_state_store() -> CallStateStore:
+    """
+    Returns the process-wide call state store selected by CALL_STATE_BACKEND.
+    """
+    global _store
+    if _store is None:
+        settings = get_settings()
+        if settings.CALL_STATE_BACKEND == "redis":
+            _store = RedisCallStateStore.from_url(settings.CALL_STATE_REDIS_URL, ttl=settings.CALL_STATE_TTL_S)
+        elif settings.CALL_STATE_BACKEND == "memory":
+            _store = InMemoryCallStateStore()
+        else:
+            raise ValueError(f"Unknown CALL_STATE_BACKEND '{settings.CALL_STATE_BACKEND}'.")
+        logger.info(f"Using '{settings.CALL_STATE_BACKEND}' call state backend on worker {WORKER_ID}.")
+    return _store
@@ -0,0 +1,562 @@
+import asyncio
+import contextlib
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional
+from urllib.parse import urlencode
+
+from aiohttp import ClientConnectorError, ClientError
+from twilio.base.exceptions import TwilioRestException
+
+from app.helpers.admission import get_admission_controller
+from app.helpers.call_state import WORKER_ID, get_call_state_store
+from app.helpers.config import get_settings
+from app.helpers.twilio_client import get_twilio_client
+
+logger = logging.getLogger(__name__)
+
+# Final Twilio call statuses that may be retried later
+RETRY_STATUSES = {"busy", "no-answer"}
+FINAL_STATUSES = {"completed", "busy", "no-answer", "failed", "canceled"}
+
+# Seconds after a dial of unknown outcome before it is looked up in Twilio's call list
+UNKNOWN_CHECK_DELAY_S = 30.0
+# Calls created this long before the dial started still match it, for clock skew with Twilio
+UNKNOWN_CLOCK_SKEW_S = 30.0
+# An unresolved row counts against the concurrency limit like a call being dialed
+IN_FLIGHT = "(status = 'dialing' OR (status = 'unknown' AND finished_at IS NULL))"
+
+
+def is_retryable_dial_error(error: Exception) -> bool:
+    """
+    Whether a failed calls.create may be sent again: rate limiting, Twilio server
+    errors and failures to connect, where the request never reached Twilio. Other
+    errors, e.g. an invalid number or missing permissions, fail the same way on
+    every attempt.
+    """
+    if isinstance(error, TwilioRestException):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, ClientConnectorError)
+
+
+def is_unknown_dial_error(error: Exception) -> bool:
+    """
+    Whether a failed calls.create may have created the call anyway: the request was
+    sent, but timed out or lost its connection before Twilio answered.
+    """
+    return not is_retryable_dial_error(error) and isinstance(
+        error, (ClientError, asyncio.TimeoutError, ConnectionError)
+    )
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaigns (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    base_url TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS campaign_calls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    campaign_id TEXT NOT NULL,
+    to_phone TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    call_sid TEXT,
+    last_result TEXT,
+    dialed_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS campaign_calls_due ON campaign_calls (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS campaign_calls_sid ON campaign_calls (call_sid);
+CREATE INDEX IF NOT EXISTS campaign_calls_campaign ON campaign_calls (campaign_id, status);
+CREATE TABLE IF NOT EXISTS dispatcher_lease (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class CampaignStore:
+    """
+    Persistent campaign queue in SQLite. Survives restarts and can be shared by
+    the workers of one node; all methods block and are meant to be run with
+    asyncio.to_thread.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def create_campaign(self, name: Optional[str], base_url: str) -> str:
+        campaign_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO campaigns (id, name, base_url, status, created_at) VALUES (?, ?, ?, 'running', ?)",
+                (campaign_id, name, base_url, time.time()),
+            )
+        return campaign_id
+
+    @contextlib.contextmanager
+    def _transaction(self, begin: str = "BEGIN"):
+        """
+        Runs the block in a transaction, rolled back when it fails so the
+        connection is never left inside it. Must hold the lock.
+        """
+        self._db.execute(begin)
+        try:
+            yield
+            self._db.execute("COMMIT")
+        except BaseException:
+            if self._db.in_transaction:
+                self._db.execute("ROLLBACK")
+            raise
+
+    def add_numbers(self, campaign_id: str, numbers: List[str]) -> int:
+        with self._lock, self._transaction():
+            self._db.executemany(
+                "INSERT INTO campaign_calls (campaign_id, to_phone, status) VALUES (?, ?, 'pending')",
+                ((campaign_id, number) for number in numbers),
+            )
+            self._db.execute("UPDATE campaigns SET total = total + ? WHERE id = ?", (len(numbers), campaign_id))
+        return len(numbers)
+
+    def acquire_lease(self, owner: str, ttl: float) -> bool:
+        """
+        Makes sure only one worker dispatches at a time.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO dispatcher_lease (id, owner, expires_at) VALUES (1, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE dispatcher_lease.owner = excluded.owner OR dispatcher_lease.expires_at < ?",
+                (owner, now + ttl, now),
+            )
+            row = self._db.execute("SELECT owner FROM dispatcher_lease WHERE id = 1").fetchone()
+        return row is not None and row["owner"] == owner
+
+    def count_dialing(self) -> int:
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM campaign_calls WHERE {IN_FLIGHT}").fetchone()[0]
+
+    def claim_due(self, limit: int) -> List[sqlite3.Row]:
+        """
+        Marks up to `limit` due numbers of running campaigns as dialing and returns them.
+        """
+        now = time.time()
+        with self._lock, self._transaction("BEGIN IMMEDIATE"):
+            rows = self._db.execute(
+                "SELECT c.id, c.campaign_id, c.to_phone, c.attempts, p.base_url FROM campaign_calls c "
+                "JOIN campaigns p ON p.id = c.campaign_id "
+                "WHERE c.status = 'pending' AND c.next_attempt_at <= ? AND p.status = 'running' "
+                "ORDER BY c.next_attempt_at, c.id LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            self._db.executemany(
+                "UPDATE campaign_calls SET status = 'dialing', attempts = attempts + 1, dialed_at = ?, call_sid = NULL "
+                "WHERE id = ?",
+                ((now, row["id"]) for row in rows),
+            )
+        return rows
+
+    def set_call_sid(self, row_id: int, attempt: int, call_sid: str):
+        with self._lock:
+            self._db.execute(
+                "UPDATE campaign_calls SET call_sid = ? WHERE id = ? AND attempts = ?", (call_sid, row_id, attempt)
+            )
+
+    def mark_unknown(self, row_id: int, attempt: int, check_at: float):
+        """
+        Records a dial that may or may not have created a call, to be looked up at
+        `check_at`. Left alone when its status callback already came in.
+        """
+        with self._lock:
+            self._db.execute(
+                "UPDATE campaign_calls SET status = 'unknown', last_result = 'unknown', next_attempt_at = ? "
+                "WHERE id = ? AND attempts = ? AND status = 'dialing'",
+                (check_at, row_id, attempt),
+            )
+
+    def claim_unknown(self, limit: int, check_again_at: float) -> List[sqlite3.Row]:
+        """
+        Returns up to `limit` unresolved dials due for a lookup, pushing their next lookup back.
+        """
+        now = time.time()
+        with self._lock, self._transaction("BEGIN IMMEDIATE"):
+            rows = self._db.execute(
+                "SELECT id, campaign_id, to_phone, attempts, dialed_at FROM campaign_calls "
+                "WHERE status = 'unknown' AND finished_at IS NULL AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at, id LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            self._db.executemany(
+                "UPDATE campaign_calls SET next_attempt_at = ? WHERE id = ?",
+                ((check_again_at, row["id"]) for row in rows),
+            )
+        return rows
+
+    def confirm_dial(self, row_id: int, call_sid: str):
+        """
+        Resumes waiting for the status callback of an unresolved dial found in progress.
+        """
+        with self._lock:
+            self._db.execute(
+                "UPDATE campaign_calls SET status = 'dialing', call_sid = ? "
+                "WHERE id = ? AND status = 'unknown' AND finished_at IS NULL",
+                (call_sid, row_id),
+            )
+
+    def finish(self, row_id: int, result: str, retry_at: Optional[float]):
+        """
+        Records the outcome of an attempt, queueing the number again when `retry_at` is given.
+        """
+        with self._lock:
+            if retry_at is not None:
+                self._db.execute(
+                    "UPDATE campaign_calls SET status = 'pending', last_result = ?, next_attempt_at = ? WHERE id = ?",
+                    (result, retry_at, row_id),
+                )
+            else:
+                self._db.execute(
+                    "UPDATE campaign_calls SET status = ?, last_result = ?, finished_at = ? WHERE id = ?",
+                    (result, result, time.time(), row_id),
+                )
+
+    def find_attempt(self, row_id: int, attempt: int) -> Optional[sqlite3.Row]:
+        with self._lock:
+            return self._db.execute(
+                f"SELECT id, attempts FROM campaign_calls WHERE id = ? AND attempts = ? AND {IN_FLIGHT}",
+                (row_id, attempt),
+            ).fetchone()
+
+    def find_by_call_sid(self, call_sid: str) -> Optional[sqlite3.Row]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, attempts FROM campaign_calls WHERE call_sid = ? AND status = 'dialing'", (call_sid,)
+            ).fetchone()
+
+    def expire_stale(self, older_than: float) -> int:
+        """
+        Gives up on attempts whose status callback never arrived, e.g. while the app was down.
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE campaign_calls SET status = 'unknown', last_result = 'unknown', finished_at = ? "
+                f"WHERE {IN_FLIGHT} AND dialed_at < ?",
+                (time.time(), time.time() - older_than),
+            )
+        return cursor.rowcount
+
+    def set_campaign_status(self, campaign_id: str, status: str) -> bool:
+        with self._lock:
+            cursor = self._db.execute("UPDATE campaigns SET status = ? WHERE id = ?", (status, campaign_id))
+            if status == "cancelled":
+                self._db.execute(
+                    "UPDATE campaign_calls SET status = 'cancelled', finished_at = ? "
+                    "WHERE campaign_id = ? AND status = 'pending'",
+                    (time.time(), campaign_id),
+                )
+        return cursor.rowcount > 0
+
+    def progress(self, campaign_id: str, window: float = 60.0) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            campaign = self._db.execute("SELECT * FROM campaigns WHERE id = ?", (campaign_id,)).fetchone()
+            if campaign is None:
+                return None
+            counts = dict(self._db.execute(
+                "SELECT status, COUNT(*) FROM campaign_calls WHERE campaign_id = ? GROUP BY status", (campaign_id,)
+            ).fetchall())
+            attempts = self._db.execute(
+                "SELECT COALESCE(SUM(attempts), 0) FROM campaign_calls WHERE campaign_id = ?", (campaign_id,)
+            ).fetchone()[0]
+            unresolved = self._db.execute(
+                "SELECT COUNT(*) FROM campaign_calls WHERE campaign_id = ? AND status = 'unknown' "
+                "AND finished_at IS NULL",
+                (campaign_id,),
+            ).fetchone()[0]
+            recent = self._db.execute(
+                "SELECT COUNT(*) FROM campaign_calls WHERE campaign_id = ? AND finished_at >= ?",
+                (campaign_id, now - window),
+            ).fetchone()[0]
+
+        remaining = counts.get("pending", 0) + counts.get("dialing", 0) + unresolved
+        finished = campaign["total"] - remaining
+        elapsed = max(now - campaign["created_at"], 1e-6)
+        throughput = recent / min(window, elapsed)
+        status = campaign["status"]
+        if status == "running" and remaining == 0:
+            status = "completed"
+        return {
+            "campaign_id": campaign_id,
+            "name": campaign["name"],
+            "status": status,
+            "total": campaign["total"],
+            "finished": finished,
+            "remaining": remaining,
+            "attempts": attempts,
+            "by_status": counts,
+            "throughput_per_min": throughput * 60,
+            "eta_s": remaining / throughput if throughput > 0 else None,
+            "elapsed_s": elapsed,
+        }
+
+
+class CampaignDialer:
+    """
+    Dials queued campaign numbers through the async Twilio client while keeping
+    under a calls-per-second rate and a max number of calls in flight. Busy and
+    unanswered numbers are retried after a delay, up to a max number of attempts.
+    A dial that timed out is never sent again; it is looked up in Twilio's call
+    list instead, and only retried once Twilio has no call for it.
+    """
+
+    def __init__(
+        self,
+        store: CampaignStore,
+        calls_per_second: float,
+        max_concurrent_calls: int,
+        max_attempts: int = 3,
+        retry_delay: float = 300.0,
+        stale_after: float = 7200.0,
+        lease_ttl: float = 10.0,
+    ):
+        self.store = store
+        self.interval = 1.0 / calls_per_second
+        self.max_concurrent_calls = max_concurrent_calls
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.stale_after = stale_after
+        self.lease_ttl = lease_ttl
+
+        self._next_slot = 0.0
+        self._lease_renewed_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._dials = set()
+
+    async def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="campaign_dialer")
+            logger.info(f"Campaign dialer started ({1 / self.interval:g} calls/s, {self.max_concurrent_calls} concurrent).")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def create_campaign(self, name: Optional[str], base_url: str) -> str:
+        return await asyncio.to_thread(self.store.create_campaign, name, base_url)
+
+    async def add_numbers(self, campaign_id: str, numbers: List[str]) -> int:
+        added = await asyncio.to_thread(self.store.add_numbers, campaign_id, numbers)
+        self.wake()
+        return added
+
+    async def set_campaign_status(self, campaign_id: str, status: str) -> bool:
+        updated = await asyncio.to_thread(self.store.set_campaign_status, campaign_id, status)
+        self.wake()
+        return updated
+
+    async def progress(self, campaign_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(self.store.progress, campaign_id)
+
+    async def handle_status(
+        self, call_sid: str, call_status: str, row_id: Optional[int] = None, attempt: Optional[int] = None
+    ) -> bool:
+        """
+        Applies a Twilio status callback to the campaign queue. The callback is matched
+        on the row and attempt carried in its URL, so it applies even when it arrives
+        before calls.create has returned the Call SID; callbacks of calls dialed
+        without them are matched on the Call SID.
+
+        Returns:
+            bool: True when the call belonged to a campaign.
+        """
+        if call_status not in FINAL_STATUSES:
+            return False
+        if row_id is not None and attempt is not None:
+            row = await asyncio.to_thread(self.store.find_attempt, row_id, attempt)
+        else:
+            row = await asyncio.to_thread(self.store.find_by_call_sid, call_sid)
+        if row is None:
+            return False
+
+        await self._finish_call(row, call_sid, call_status)
+        return True
+
+    async def _finish_call(self, row, call_sid: str, call_status: str):
+        retry_at = None
+        if call_status in RETRY_STATUSES and row["attempts"] < self.max_attempts:
+            retry_at = time.time() + self.retry_delay
+        await asyncio.to_thread(self.store.finish, row["id"], call_status, retry_at)
+        logger.info("Campaign call %s ended with '%s'%s.", call_sid, call_status, " (will retry)" if retry_at else "")
+        self.wake()
+
+    async def _run(self):
+        while True:
+            try:
+                if not await self._renew_lease():
+                    await asyncio.sleep(self.lease_ttl / 2)
+                    continue
+
+                expired = await asyncio.to_thread(self.store.expire_stale, self.stale_after)
+                if expired:
+                    logger.warning(f"Gave up on {expired} campaign calls without a status callback.")
+                await self._check_unknown()
+
+                capacity = self.max_concurrent_calls - await asyncio.to_thread(self.store.count_dialing)
+                # Leave room for the calls admission control can still take
+                available = await get_admission_controller().available()
+                if available is not None:
+                    capacity = min(capacity, available)
+                rows = await asyncio.to_thread(self.store.claim_due, capacity) if capacity > 0 else []
+                for row in rows:
+                    await self._wait_for_slot()
+                    task = asyncio.create_task(self._dial(row))
+                    self._dials.add(task)
+                    task.add_done_callback(self._dials.discard)
+
+                if not rows:
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), timeout=1.0)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wake.clear()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in campaign dialer: {e}", exc_info=True)
+                await asyncio.sleep(1.0)
+
+    async def _wait_for_slot(self):
+        while True:
+            now = time.monotonic()
+            if self._next_slot <= now:
+                break
+            await asyncio.sleep(min(self._next_slot - now, self.lease_ttl / 2))
+            # A batch of claimed rows can take longer than the lease to dial at a low rate
+            if time.monotonic() - self._lease_renewed_at >= self.lease_ttl / 2:
+                await self._renew_lease()
+        self._next_slot = max(now, self._next_slot) + self.interval
+
+    async def _renew_lease(self) -> bool:
+        acquired = await asyncio.to_thread(self.store.acquire_lease, WORKER_ID, self.lease_ttl)
+        if acquired:
+            self._lease_renewed_at = time.monotonic()
+        return acquired
+
+    async def _check_unknown(self):
+        """
+        Looks up dials of unknown outcome in Twilio's call list, by number and time
+        dialed. A call found there is followed like any other; when there is none,
+        the dial never created a call and the number can be dialed again.
+        """
+        settings = get_settings()
+        rows = await asyncio.to_thread(self.store.claim_unknown, 10, time.time() + UNKNOWN_CHECK_DELAY_S)
+        for row in rows:
+            # Keeps the previous attempt of a number out of the match when retries are close together
+            created_after = row["dialed_at"] - min(UNKNOWN_CLOCK_SKEW_S, self.retry_delay / 2)
+            try:
+                calls = await get_twilio_client().calls.list_async(
+                    to=row["to_phone"], from_=settings.TWILIO_PHONE_NUMBER, limit=20
+                )
+            except Exception as e:
+                logger.warning(f"Could not look up the dial of {row['to_phone']} in Twilio's call list: {e!r}")
+                continue
+            matches = [
+                call for call in calls
+                if call.date_created is not None
+                and call.date_created >= datetime.fromtimestamp(created_after, timezone.utc)
+            ]
+            if not matches:
+                retry_at = time.time() + self.retry_delay if row["attempts"] < self.max_attempts else None
+                await asyncio.to_thread(self.store.finish, row["id"], "failed", retry_at)
+                logger.info(
+                    "Campaign %s dial of %s never reached Twilio%s.",
+                    row["campaign_id"], row["to_phone"], " (will retry)" if retry_at else "",
+                )
+                continue
+            call = max(matches, key=lambda match: match.date_created)
+            if call.status in FINAL_STATUSES:
+                await self._finish_call(row, call.sid, call.status)
+            else:
+                await asyncio.to_thread(self.store.confirm_dial, row["id"], call.sid)
+                logger.info("Campaign %s dial of %s found in progress, Call SID: %s", row["campaign_id"], row["to_phone"], call.sid)
+
+    async def _dial(self, row):
+        settings = get_settings()
+        # The row and attempt let the status callback find the row before the Call SID is stored
+        callback_query = urlencode({"row": row["id"], "attempt": row["attempts"] + 1})
+        try:
+            # Each request is bounded by TWILIO_HTTP_TIMEOUT_S in the client, which also retries rate limiting
+            call = await get_twilio_client().calls.create_async(
+                to=row["to_phone"],
+                from_=settings.TWILIO_PHONE_NUMBER,
+                url=f"{row['base_url']}/incoming-call",
+                status_callback=f"{row['base_url']}/campaigns/status?{callback_query}",
+                status_callback_method="POST",
+            )
+        except Exception as e:
+            if is_unknown_dial_error(e):
+                logger.error(
+                    f"Dial of {row['to_phone']} for campaign {row['campaign_id']} has an unknown outcome, "
+                    f"checking Twilio's call list later: {e!r}"
+                )
+                check_at = time.time() + UNKNOWN_CHECK_DELAY_S
+                await asyncio.to_thread(self.store.mark_unknown, row["id"], row["attempts"] + 1, check_at)
+                return
+            retryable = is_retryable_dial_error(e)
+            logger.error(
+                f"Error dialing {row['to_phone']} for campaign {row['campaign_id']}"
+                f"{'' if retryable else ' (not retried)'}: {e!r}"
+            )
+            retry_at = None
+            if retryable and row["attempts"] + 1 < self.max_attempts:
+                retry_at = time.time() + self.retry_delay
+            await asyncio.to_thread(self.store.finish, row["id"], "failed", retry_at)
+            return
+
+        await asyncio.to_thread(self.store.set_call_sid, row["id"], row["attempts"] + 1, call.sid)
+        await get_call_state_store().update(call.sid, status="initiated", to_phone=row["to_phone"], from_phone=settings.TWILIO_PHONE_NUMBER)
+        logger.info("Campaign %s dialed %s (attempt %s), Call SID: %s", row['campaign_id'], row['to_phone'], row['attempts'] + 1, call.sid)
+
+
+_dialer: Optional[CampaignDialer] = None
+
+
+def get_campaign_dialer() -> CampaignDialer:
+    """
+    Returns the process-wide campaign dialer configured from the settings.
+    """
+    global _dialer
+    if _dialer is None:
+        settings = get_settings()
+        _dialer = CampaignDialer(
+            CampaignStore(settings.CAMPAIGN_DB_PATH),
+            calls_per_second=settings.CAMPAIGN_CALLS_PER_SECOND,
+            max_concurrent_calls=settings.CAMPAIGN_MAX_CONCURRENT_CALLS,
+            max_attempts=settings.CAMPAIGN_MAX_ATTEMPTS,
+            retry_delay=settings.CAMPAIGN_RETRY_DELAY_S,
+        )
+    return _dialer
@@ -0,0 +1,217 @@
+import hashlib
+import logging
+import re
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Optional, Tuple
+
+from app.helpers.config import get_settings
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - optional dependency
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_message(message: str) -> str:
+    """
+    Folds the spellings of the same question onto one key: Unicode compatibility
+    forms, case, punctuation and runs of whitespace are ignored, so
+    "What are your hours?" and "what are  your hours" share a cache entry.
+    """
+    message = unicodedata.normalize("NFKC", message).casefold()
+    message = _PUNCTUATION.sub(" ", message)
+    return _WHITESPACE.sub(" ", message).strip()
+
+
+def make_key(message: str, history: str, deployment: str) -> str:
+    """
+    Builds the cache key of a chat request from its normalized message, a hash of
+    the conversation history and the deployment that answers it.
+    """
+    history_hash = hashlib.sha256(history.encode("utf-8")).hexdigest() if history else ""
+    raw = "\x00".join((deployment, normalize_message(message), history_hash))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ChatResponseCache:
+    """
+    Base class for /chat response cache backends. Counts hits, misses and
+    evictions so the hit ratio can be watched in production.
+    """
+
+    backend = "none"
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions: Counter = Counter()
+
+    async def get(self, key: str) -> Optional[str]:
+        return None
+
+    async def set(self, key: str, value: str):
+        pass
+
+    async def close(self):
+        pass
+
+    def _record_lookup(self, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "ttl_s": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": dict(self.evictions),
+        }
+
+
+class InMemoryChatResponseCache(ChatResponseCache):
+    """
+    Per-process LRU cache with a TTL, bounded by number of entries and by the
+    total size of the cached responses.
+    """
+
+    backend = "memory"
+
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        # key -> (expires_at, response, size), least recently used first
+        self._entries: "OrderedDict[str, Tuple[float, str, int]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= time.monotonic():
+            self._evict(key, "expired")
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return self._record_lookup(entry[1] if entry is not None else None)
+
+    async def set(self, key: str, value: str):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._evict(key, None)
+        self._entries[key] = (time.monotonic() + self.ttl, value, size)
+        self.bytes += size
+        self.stores += 1
+        while len(self._entries) > self.max_entries:
+            self._evict(next(iter(self._entries)), "max_entries")
+        while self.bytes > self.max_bytes:
+            self._evict(next(iter(self._entries)), "max_bytes")
+
+    def _evict(self, key: str, reason: Optional[str]):
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+        if reason is not None:
+            self.evictions[reason] += 1
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+class RedisChatResponseCache(ChatResponseCache):
+    """
+    Cache shared by every worker and node through Redis, or any server speaking
+    the Redis protocol. Entries expire after the TTL; size-based eviction is left
+    to the server's maxmemory policy (e.g. allkeys-lru). Counters are per worker.
+    """
+
+    backend = "redis"
+
+    def __init__(self, client, ttl: float, prefix: str = "chat-cache"):
+        super().__init__(ttl)
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, ttl: float) -> "RedisChatResponseCache":
+        if aioredis is None:
+            raise RuntimeError("The redis package is required for CHAT_CACHE_BACKEND=redis (pip install redis).")
+        return cls(aioredis.from_url(url, decode_responses=True), ttl=ttl)
+
+    async def get(self, key: str) -> Optional[str]:
+        try:
+            value = await self.client.get(f"{self.prefix}:{key}")
+        except Exception as e:
+            logger.warning(f"Chat cache lookup failed: {e}")
+            value = None
+        return self._record_lookup(value)
+
+    async def set(self, key: str, value: str):
+        try:
+            await self.client.set(f"{self.prefix}:{key}", value, ex=max(1, int(self.ttl)))
+            self.stores += 1
+        except Exception as e:
+            logger.warning(f"Chat cache store failed: {e}")
+
+    async def close(self):
+        await self.client.aclose()
+
+
+_cache: Optional[ChatResponseCache] = None
+
+
+def get_chat_cache() -> ChatResponseCache:
+    """
+    Returns the process-wide /chat response cache selected by CHAT_CACHE_BACKEND.
+    """
+    global _cache
+    if _cache is None:
+        settings = get_settings()
+        if settings.CHAT_CACHE_BACKEND == "memory":
+            _cache = InMemoryChatResponseCache(
+                ttl=settings.CHAT_CACHE_TTL_S,
+                max_entries=settings.CHAT_CACHE_MAX_ENTRIES,
+                max_bytes=settings.CHAT_CACHE_MAX_BYTES,
+            )
+        elif settings.CHAT_CACHE_BACKEND == "redis":
+            _cache = RedisChatResponseCache.from_url(
+                settings.CHAT_CACHE_REDIS_URL or settings.CALL_STATE_REDIS_URL,
+                ttl=settings.CHAT_CACHE_TTL_S,
+            )
+        elif settings.CHAT_CACHE_BACKEND == "none":
+            _cache = ChatResponseCache(ttl=0)
+        else:
+            raise ValueError(f"Unknown CHAT_CACHE_BACKEND '{settings.CHAT_CACHE_BACKEND}'.")
+        logger.info(f"Using '{settings.CHAT_CACHE_BACKEND}' chat response cache.")
+    return _cache
+
+
+async def close_chat_cache():
+    """
+    Closes the connection of a shared cache backend.
+    """
+    global _cache
+    if _cache is not None:
+        await _cache.close()
+        _cache = None
@@ -0,0 +1,111 @@
+"""
+JSON codec shared by the Twilio and Azure event streams.
+
+Uses orjson or msgspec when installed and falls back to the standard library.
+Always call it through the module (`codec.loads(...)`) so a backend switch made
+with use_backend() is picked up everywhere.
+"""
+import json
+import re
+from typing import Any, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - optional dependency
+    msgspec = None
+
+_DISCRIMINATORS = {}
+
+
+def _stdlib_loads(message: Union[str, bytes]) -> Any:
+    return json.loads(message)
+
+
+def _stdlib_dumps(obj: Any) -> str:
+    return json.dumps(obj, separators=(",", ":"))
+
+
+if orjson is not None:
+    def _orjson_dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+
+# Raised by loads() for malformed input, whatever the backend
+DECODE_ERRORS = (ValueError,) if msgspec is None else (ValueError, msgspec.DecodeError)
+
+if msgspec is not None:
+    _msgspec_encoder = msgspec.json.Encoder()
+    _msgspec_decoder = msgspec.json.Decoder()
+
+    def _msgspec_dumps(obj: Any) -> str:
+        return _msgspec_encoder.encode(obj).decode("utf-8")
+
+
+def available_backends() -> list:
+    """
+    Returns the JSON backends that can be used in this environment, fastest first.
+    """
+    backends = []
+    if orjson is not None:
+        backends.append("orjson")
+    if msgspec is not None:
+        backends.append("msgspec")
+    backends.append("json")
+    return backends
+
+
+def use_backend(name: str = "auto") -> str:
+    """
+    Selects the JSON backend used by loads() and dumps().
+
+    Args:
+        name: "orjson", "msgspec", "json" or "auto" for the fastest one installed.
+
+    Returns:
+        str: The name of the backend now in use.
+    """
+    global BACKEND, loads, dumps
+    if name == "auto":
+        name = available_backends()[0]
+    if name not in available_backends():
+        raise ValueError(f"JSON backend '{name}' is not installed.")
+
+    if name == "orjson":
+        loads, dumps = orjson.loads, _orjson_dumps
+    elif name == "msgspec":
+        loads, dumps = _msgspec_decoder.decode, _msgspec_dumps
+    else:
+        loads, dumps = _stdlib_loads, _stdlib_dumps
+    BACKEND = name
+    return name
+
+
+def peek(message: str, key: str) -> Optional[str]:
+    """
+    Reads a top-level string field, such as the Twilio `event` or Azure `type`
+    discriminator, without decoding the rest of the message.
+
+    Only the part of the message before the first nested object is scanned so a
+    key with the same name inside a nested object is never picked up.
+
+    Returns:
+        Optional[str]: The field value, or None when it could not be found cheaply,
+        in which case the caller should decode the full message.
+    """
+    pattern = _DISCRIMINATORS.get(key)
+    if pattern is None:
+        pattern = _DISCRIMINATORS[key] = re.compile(r'"%s"\s*:\s*"([^"\\]*)"' % re.escape(key))
+
+    nested = message.find("{", 1)
+    match = pattern.search(message, 0, nested if nested != -1 else len(message))
+    return match.group(1) if match else None
+
+
+BACKEND = "json"
+loads = _stdlib_loads
+dumps = _stdlib_dumps
+use_backend("auto")
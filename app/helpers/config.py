@@ -1,17 +1,44 @@
+from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
 
+    # Logging: level, "text" or "json" lines, queued records before new ones are dropped, and
+    # records per second kept of each message below WARNING (0 keeps all)
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "text"
+    LOG_QUEUE_MAX_RECORDS: int = 10000
+    LOG_RATE_LIMIT_PER_S: float = 20.0
     # Twilio
     TWILIO_ACCOUNT_SID : str 
     TWILIO_AUTH_TOKEN : str 
     TWILIO_PHONE_NUMBER : str 
+    TWILIO_HTTP_TIMEOUT_S: float = 10.0
+    TWILIO_HTTP_MAX_RETRIES: int = 2
+    TWILIO_HTTP_POOL_SIZE: int = 20
+    TWILIO_HTTP_KEEPALIVE_S: float = 30.0
+    # Overrides https://api.twilio.com, e.g. to point at a fake Twilio endpoint in load tests
+    TWILIO_API_BASE_URL: Optional[str] = None
     # Azure OpenAI
     AZURE_OPENAI_API_KEY : str 
     AZURE_OPENAI_ENDPOINT : str 
     AZURE_OPENAI_DEPLOYMENT_NAME : str 
     AZURE_OPENAI_API_VERSION : str 
     AZURE_OPENAI_CHAT_DEPLOYMENT_NAME: str
+    # Overrides the realtime WebSocket URL built from the settings, e.g. to point at a fake server in load tests
+    AZURE_OPENAI_REALTIME_URL: Optional[str] = None
+    # HTTP connection pool for /chat
+    CHAT_HTTP_POOL_SIZE: int = 100
+    CHAT_HTTP_POOL_SIZE_PER_HOST: int = 50
+    CHAT_HTTP_KEEPALIVE_S: float = 60.0
+    CHAT_HTTP_TIMEOUT_S: float = 60.0
+    # /chat response cache ("memory", "redis" or "none")
+    CHAT_CACHE_BACKEND: str = "memory"
+    CHAT_CACHE_TTL_S: float = 3600.0
+    CHAT_CACHE_MAX_ENTRIES: int = 1024
+    CHAT_CACHE_MAX_BYTES: int = 8 * 1024 * 1024
+    # Defaults to CALL_STATE_REDIS_URL
+    CHAT_CACHE_REDIS_URL: Optional[str] = None
     # GPT Audio
     GPT_AUDIO_TEMPRATURE: float  
     GPT_AUDIO_THRESHOLD: float  
@@ -19,6 +46,100 @@ class Settings(BaseSettings):
     GPT_AUDIO_SILENCE_DURATION_MS: int  
     GPT_AUDIO_PREFIX_PADDING_MS: int  
     GPT_AUDIO_VOICE_NAME: str  
+    # Named session profiles (<name>.json), defaults to app/config/profiles
+    SESSION_PROFILES_DIR: Optional[str] = None
+    # Seconds between checks for changed session files (0 disables)
+    SESSION_PROFILES_RELOAD_INTERVAL_S: float = 5.0
+    # Azure realtime session pool
+    AZURE_POOL_SIZE: int = 2
+    AZURE_POOL_MAX_AGE_S: float = 600.0
+    AZURE_POOL_PING_INTERVAL_S: float = 15.0
+    AZURE_POOL_PING_TIMEOUT_S: float = 5.0
+    # Mid-call reconnect when the Azure session drops: rounds of attempts (0 ends the call instead),
+    # each trying the primary endpoint then the fallback one, and the caller audio kept meanwhile
+    AZURE_OPENAI_REALTIME_FALLBACK_URL: Optional[str] = None
+    AZURE_RECONNECT_ATTEMPTS: int = 3
+    AZURE_RECONNECT_BACKOFF_S: float = 0.25
+    AZURE_RECONNECT_TIMEOUT_S: float = 5.0
+    AZURE_RECONNECT_BUFFER_MS: int = 5000
+    # Transcript replayed into the new session: latest segments, capped in characters
+    AZURE_RECONNECT_HISTORY_SEGMENTS: int = 20
+    AZURE_RECONNECT_HISTORY_MAX_CHARS: int = 4000
+    # Opening utterance of each profile rendered once and played from memory when a call starts,
+    # optionally also kept on disk; rendered again when the instructions or the voice change
+    GREETING_CACHE_ENABLED: bool = False
+    GREETING_CACHE_DIR: Optional[str] = None
+    GREETING_RENDER_TIMEOUT_S: float = 20.0
+    # Stereo call recordings (caller left, agent right) written to RECORDING_DIR/<call sid>.wav,
+    # "ulaw" or "pcm16"; audio is buffered in chunks and dropped past the pending limit or the max length
+    RECORDING_ENABLED: bool = False
+    RECORDING_DIR: str = "recordings"
+    RECORDING_FORMAT: str = "ulaw"
+    RECORDING_CHUNK_KB: int = 256
+    RECORDING_MAX_PENDING_KB: int = 4096
+    RECORDING_MAX_S: int = 3600
+    # Audio format of the Azure session: "g711_ulaw" relays Twilio audio as-is, "pcm16" converts
+    # it to and from 24 kHz PCM in the media stream
+    AZURE_AUDIO_FORMAT: str = "g711_ulaw"
+    # Audio relay
+    AUDIO_RELAY_ZERO_COPY: bool = True
+    AUDIO_RELAY_VALIDATE_PAYLOAD: bool = False
+    # Per-direction relay queues: audio waiting longer than the lag threshold is
+    # dropped or merged into one send ("drop" or "merge")
+    RELAY_QUEUE_MAX_ITEMS: int = 500
+    RELAY_MAX_LAG_MS: int = 500
+    RELAY_UPSTREAM_POLICY: str = "merge"
+    RELAY_DOWNSTREAM_POLICY: str = "drop"
+    # Agent audio is re-framed into PLAYOUT_FRAME_MS frames and sent at most PLAYOUT_LEAD_MS
+    # ahead of real time, instead of forwarding each Azure burst as it arrives
+    PLAYOUT_PACING_ENABLED: bool = True
+    PLAYOUT_FRAME_MS: int = 20
+    PLAYOUT_LEAD_MS: int = 200
+    # Milliseconds of agent audio between playback marks sent to Twilio (0 marks every delta)
+    PLAYBACK_MARK_INTERVAL_MS: int = 200
+    # Local voice gate: caller frames below the threshold are kept from Azure, except for the
+    # pre-roll sent at speech onset and the hangover after it (keep it above GPT_AUDIO_SILENCE_DURATION_MS)
+    VAD_ENABLED: bool = False
+    VAD_THRESHOLD_DBFS: float = -45.0
+    VAD_ONSET_MS: int = 40
+    VAD_PRE_ROLL_MS: int = 300
+    VAD_HANGOVER_MS: int = 1000
+    VAD_KEEPALIVE_MS: int = 0
+    # Tool calls: default handler timeout and size of the shared result cache
+    TOOL_TIMEOUT_S: float = 5.0
+    TOOL_CACHE_MAX_ENTRIES: int = 1024
+    # Admission control: concurrent calls per worker and across workers (0 = unlimited), how long
+    # a slot is held for a call not streaming yet, and the share of Azure quota kept in reserve
+    ADMISSION_MAX_CALLS_PER_WORKER: int = 0
+    ADMISSION_MAX_CALLS: int = 0
+    ADMISSION_PENDING_TTL_S: float = 60.0
+    ADMISSION_RATE_LIMIT_RESERVE: float = 0.1
+    # What callers hear when no call can be taken: "queue" (hold music, then a callback offer), "callback" or "reject"
+    ADMISSION_OVERFLOW_MODE: str = "queue"
+    ADMISSION_QUEUE_MAX_ATTEMPTS: int = 3
+    ADMISSION_HOLD_MUSIC_URL: str = "http://com.twilio.music.classical.s3.amazonaws.com/BusyStrings.mp3"
+    # Upstream audio coalescing (0 forwards every 20 ms frame on its own)
+    AUDIO_COALESCE_WINDOW_MS: int = 0
+    AUDIO_COALESCE_MAX_BYTES: int = 0
+    AUDIO_COALESCE_MAX_LATENCY_MS: int = 100
+    # Call state shared between workers ("memory" or "redis")
+    CALL_STATE_BACKEND: str = "memory"
+    CALL_STATE_REDIS_URL: str = "redis://localhost:6379/0"
+    CALL_STATE_TTL_S: int = 3600
+    # Outbound campaigns
+    CAMPAIGN_DB_PATH: str = "campaigns.db"
+    CAMPAIGN_CALLS_PER_SECOND: float = 1.0
+    CAMPAIGN_MAX_CONCURRENT_CALLS: int = 10
+    CAMPAIGN_MAX_ATTEMPTS: int = 3
+    CAMPAIGN_RETRY_DELAY_S: float = 300.0
+    # Transcripts and call outcomes ("sqlite" or "jsonl"), written in batches
+    CALL_LOG_BACKEND: str = "sqlite"
+    CALL_LOG_PATH: str = "call_log.db"
+    CALL_LOG_BATCH_SIZE: int = 100
+    CALL_LOG_FLUSH_INTERVAL_S: float = 1.0
+    CALL_LOG_MAX_PENDING: int = 10000
+    # Overrides the https://{host} base of the callback URLs handed to Twilio
+    PUBLIC_BASE_URL: Optional[str] = None
 
     # API Auth
     API_AUTH_USERNAME : str
@@ -0,0 +1,233 @@
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import websockets
+
+from app.helpers import codec
+from app.helpers.audio_coalescer import ULAW_BYTES_PER_MS
+from app.helpers.audio_relay import RESPONSE_CREATE_MESSAGE
+from app.helpers.audio_codec import AudioTranscoder
+from app.helpers.session_profiles import SessionProfiles
+
+logger = logging.getLogger(__name__)
+
+
+class Greeting:
+    """
+    The opening utterance of a profile: its g711_ulaw audio, pre-split into
+    base64 payloads of `chunk_ms`, and its transcript.
+    """
+
+    def __init__(self, key: str, audio: bytes, transcript: str, chunk_ms: int = 100):
+        self.key = key
+        self.transcript = transcript
+        self.duration_ms = len(audio) // ULAW_BYTES_PER_MS
+        chunk = max(chunk_ms, 1) * ULAW_BYTES_PER_MS
+        # (payload, size in bytes)
+        self.chunks: List[Tuple[str, int]] = [
+            (base64.b64encode(audio[offset:offset + chunk]).decode("ascii"), len(audio[offset:offset + chunk]))
+            for offset in range(0, len(audio), chunk)
+        ]
+
+    def item_message(self, item_id: str) -> str:
+        """
+        Returns the conversation.item.create message that tells the model it
+        already said the greeting.
+        """
+        return codec.dumps({
+            "type": "conversation.item.create",
+            "item": {
+                "id": item_id,
+                "type": "message",
+                "role": "assistant",
+                "content": [{"type": "text", "text": self.transcript}],
+            },
+        })
+
+    @staticmethod
+    def new_item_id() -> str:
+        return f"greeting_{uuid.uuid4().hex[:20]}"
+
+
+class GreetingCache:
+    """
+    Opening utterances rendered once per profile, so a call can start playing the
+    greeting as soon as its stream starts instead of waiting for the model to
+    generate the same line live.
+
+    A greeting is rendered by asking a throwaway Azure session, configured with the
+    profile, for its opening response, and kept as g711_ulaw whatever the session
+    format. It is keyed by the instructions, voice and output format of the
+    profile, so it is rendered again once the system instructions or the voice
+    change. With `directory` set, greetings are also kept on disk and survive
+    restarts.
+
+    get() never waits for a render: a profile without a current greeting is
+    rendered in the background and the call falls back to a live opening response.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Awaitable[websockets.WebSocketClientProtocol]],
+        profiles: SessionProfiles,
+        enabled: bool = False,
+        directory: Optional[str] = None,
+        render_timeout: float = 20.0,
+        chunk_ms: int = 100,
+    ):
+        self.connect = connect
+        self.profiles = profiles
+        self.enabled = enabled
+        self.directory = directory
+        self.render_timeout = render_timeout
+        self.chunk_ms = chunk_ms
+
+        self._greetings: Dict[str, Greeting] = {}
+        # Profile name -> (profiles version, greeting key)
+        self._keys: Dict[str, Tuple[int, str]] = {}
+        self._rendering: Dict[str, asyncio.Task] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.renders = 0
+        self.render_failures = 0
+        self.last_render_ms = 0.0
+
+    async def start(self):
+        """
+        Renders, or loads from disk, the greeting of every profile in the background.
+        """
+        if not self.enabled:
+            return
+        for name in self.profiles.names:
+            self._schedule(name, self._key(name))
+
+    async def stop(self):
+        for task in list(self._rendering.values()):
+            task.cancel()
+        await asyncio.gather(*self._rendering.values(), return_exceptions=True)
+        self._rendering.clear()
+
+    def get(self, profile: Optional[str] = None) -> Optional[Greeting]:
+        """
+        Returns the current greeting of a profile, None when it is not rendered yet.
+        """
+        if not self.enabled:
+            return None
+        name = self.profiles.resolve(profile)
+        key = self._key(name)
+        greeting = self._greetings.get(name)
+        if greeting is not None and greeting.key == key:
+            self.hits += 1
+            return greeting
+        self.misses += 1
+        self._schedule(name, key)
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "greetings": {
+                name: {"key": greeting.key, "duration_ms": greeting.duration_ms, "transcript": greeting.transcript}
+                for name, greeting in self._greetings.items()
+            },
+            "rendering": len(self._rendering),
+            "hits": self.hits,
+            "misses": self.misses,
+            "renders": self.renders,
+            "render_failures": self.render_failures,
+            "last_render_ms": self.last_render_ms,
+        }
+
+    def _key(self, name: str) -> str:
+        cached = self._keys.get(name)
+        if cached is not None and cached[0] == self.profiles.version:
+            return cached[1]
+        session = codec.loads(self.profiles.payload(name))["session"]
+        fields = [session.get("instructions"), session.get("voice"), session.get("output_audio_format")]
+        key = hashlib.sha256(codec.dumps(fields).encode("utf-8")).hexdigest()[:16]
+        self._keys[name] = (self.profiles.version, key)
+        return key
+
+    def _schedule(self, name: str, key: str):
+        if name in self._rendering:
+            return
+        task = asyncio.create_task(self._load_or_render(name, key), name=f"greeting_{name}")
+        self._rendering[name] = task
+        task.add_done_callback(lambda _: self._rendering.pop(name, None))
+
+    async def _load_or_render(self, name: str, key: str):
+        try:
+            loaded = await asyncio.to_thread(self._load, key) if self.directory else None
+            if loaded is not None:
+                audio, transcript = loaded
+                logger.info("Greeting of profile '%s' loaded from disk.", name)
+            else:
+                started = time.perf_counter()
+                audio, transcript = await asyncio.wait_for(self._render(name), timeout=self.render_timeout)
+                self.renders += 1
+                self.last_render_ms = (time.perf_counter() - started) * 1000
+                logger.info("Greeting of profile '%s' rendered in %.0fms: %r", name, self.last_render_ms, transcript)
+                if self.directory:
+                    await asyncio.to_thread(self._save, key, audio, transcript)
+            self._greetings[name] = Greeting(key, audio, transcript, self.chunk_ms)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.render_failures += 1
+            logger.error("Failed to render the greeting of profile '%s': %r", name, e)
+
+    async def _render(self, name: str) -> Tuple[bytes, str]:
+        azure_ws = await self.connect()
+        try:
+            await self.profiles.apply(azure_ws, name)
+            await azure_ws.send(RESPONSE_CREATE_MESSAGE)
+            audio, transcript = bytearray(), ""
+            async for message in azure_ws:
+                event = codec.loads(message)
+                event_type = event.get("type")
+                if event_type == "response.audio.delta":
+                    audio += base64.b64decode(event["delta"])
+                elif event_type == "response.audio_transcript.done":
+                    transcript = event.get("transcript") or ""
+                elif event_type == "error":
+                    raise RuntimeError(f"Azure error: {event.get('error')}")
+                elif event_type == "response.done":
+                    break
+            if not audio or not transcript:
+                raise RuntimeError("The opening response carried no audio or no transcript.")
+            output_format = codec.loads(self.profiles.payload(name))["session"].get("output_audio_format")
+            if output_format and output_format != "g711_ulaw":
+                audio = AudioTranscoder(output_format).decode_azure(bytes(audio))
+            return bytes(audio), transcript
+        finally:
+            await azure_ws.close()
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        return os.path.join(self.directory, f"{key}.ulaw"), os.path.join(self.directory, f"{key}.txt")
+
+    def _load(self, key: str) -> Optional[Tuple[bytes, str]]:
+        audio_path, transcript_path = self._paths(key)
+        if not (os.path.exists(audio_path) and os.path.exists(transcript_path)):
+            return None
+        with open(audio_path, "rb") as file:
+            audio = file.read()
+        with open(transcript_path, "r", encoding="utf-8") as file:
+            return audio, file.read()
+
+    def _save(self, key: str, audio: bytes, transcript: str):
+        os.makedirs(self.directory, exist_ok=True)
+        audio_path, transcript_path = self._paths(key)
+        # The transcript is written last and the audio atomically, so a partial pair is never loaded
+        with open(audio_path + ".tmp", "wb") as file:
+            file.write(audio)
+        os.replace(audio_path + ".tmp", audio_path)
+        with open(transcript_path + ".tmp", "w", encoding="utf-8") as file:
+            file.write(transcript)
+        os.replace(transcript_path + ".tmp", transcript_path)
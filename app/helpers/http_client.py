@@ -0,0 +1,43 @@
+import logging
+from typing import Optional
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+from app.helpers.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+_session: Optional[ClientSession] = None
+
+
+def get_http_session() -> ClientSession:
+    """
+    Returns the process-wide aiohttp session used for Azure OpenAI REST calls.
+    Connections are kept alive and reused, so requests after the first one skip
+    the TCP and TLS handshakes.
+
+    Must be called from within the running event loop.
+    """
+    global _session
+    if _session is None or _session.closed:
+        settings = get_settings()
+        _session = ClientSession(
+            connector=TCPConnector(
+                limit=settings.CHAT_HTTP_POOL_SIZE,
+                limit_per_host=settings.CHAT_HTTP_POOL_SIZE_PER_HOST,
+                keepalive_timeout=settings.CHAT_HTTP_KEEPALIVE_S,
+            ),
+            timeout=ClientTimeout(total=settings.CHAT_HTTP_TIMEOUT_S),
+        )
+        logger.info("Shared HTTP session initialized.")
+    return _session
+
+
+async def close_http_session():
+    """
+    Closes the shared HTTP session and its pooled connections.
+    """
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
@@ -0,0 +1,193 @@
+"""
+Logging set up once for the whole process, from app.main.
+
+Records are put on a bounded queue by the thread that logs them, then formatted
+and written to stderr by a background thread, so neither formatting nor a slow
+terminal or log collector stalls the event loop relaying audio. When the queue
+is full, records are dropped and counted instead of waiting.
+
+DEBUG records, and records of other levels logged with `extra={"sampled": True}`
+from a per-frame call site, are rate-limited per logging call site so they cannot
+flood the queue; the number suppressed is appended to the next record of that call
+site that gets through. Other records are always kept. Log calls on the hot path pass
+their arguments separately (`logger.debug("... %s", value)`) so nothing is
+formatted unless the record is kept.
+
+With LOG_FORMAT=json each record is one JSON object carrying the call SID and
+stream SID of the media stream that logged it.
+"""
+import atexit
+import contextvars
+import copy
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from typing import Dict, Optional, Tuple
+
+from app.helpers import codec
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+# Call sites tracked by the rate limit before its state is reset
+MAX_RATE_LIMITED_SITES = 4096
+
+
+class CallLogContext:
+    """
+    The call a media stream handler and its tasks log for. One instance is bound
+    per handler before its tasks are created, and filled in once the stream starts,
+    so every task sees the same values.
+    """
+
+    def __init__(self):
+        self.call_sid: Optional[str] = None
+        self.stream_sid: Optional[str] = None
+
+
+_call_context: contextvars.ContextVar = contextvars.ContextVar("call_log_context", default=None)
+
+
+def bind_call_context() -> CallLogContext:
+    """
+    Binds a new call context to the current task and the tasks it creates from now on.
+    """
+    context = CallLogContext()
+    _call_context.set(context)
+    return context
+
+
+class CallContextFilter(logging.Filter):
+    """
+    Copies the call context onto the record. Runs in the logging thread, where
+    the context is known, before the record is queued.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _call_context.get()
+        record.call_sid = context.call_sid if context is not None else None
+        record.stream_sid = context.stream_sid if context is not None else None
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Keeps at most `rate` records per second of each DEBUG or sampled call site,
+    with bursts of up to `rate` records. Keyed by the source line rather than
+    the message, so messages formatted by the caller are limited as well.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        # (source file, line) -> (tokens, last refill, suppressed)
+        self._buckets: Dict[Tuple[str, int], Tuple[float, float, int]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0 or (record.levelno > logging.DEBUG and not getattr(record, "sampled", False)):
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        if key not in self._buckets and len(self._buckets) >= MAX_RATE_LIMITED_SITES:
+            self._buckets.clear()
+        tokens, refilled_at, suppressed = self._buckets.get(key, (self.rate, now, 0))
+        tokens = min(self.rate, tokens + (now - refilled_at) * self.rate)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now, suppressed + 1)
+            return False
+        self._buckets[key] = (tokens - 1, now, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues records without ever blocking; records that do not fit are counted and dropped.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merges the arguments into the message now, as the stdlib handler does, so
+        # arguments changed after the call cannot alter the record. The record never
+        # leaves the process, so rendering the traceback is left to the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        return f"{message} (+{suppressed} similar suppressed)" if suppressed else message
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        for field in ("call_sid", "stream_sid", "suppressed"):
+            value = getattr(record, field, None)
+            if value:
+                entry[field] = value
+        return codec.dumps(entry)
+
+
+_queue_handler: Optional[DroppingQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(settings):
+    """
+    Routes the root logger through the queue. Safe to call more than once.
+    """
+    global _queue_handler, _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(JsonFormatter() if settings.LOG_FORMAT == "json" else TextFormatter(TEXT_FORMAT))
+
+    _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_MAX_RECORDS))
+    _queue_handler.addFilter(RateLimitFilter(settings.LOG_RATE_LIMIT_PER_S))
+    _queue_handler.addFilter(CallContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(settings.LOG_LEVEL.upper())
+
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    # Writes out what is still queued when the process exits
+    atexit.register(_listener.stop)
+
+
+def stats() -> dict:
+    return {
+        "queued": _queue_handler.queue.qsize() if _queue_handler is not None else 0,
+        "dropped": _queue_handler.dropped if _queue_handler is not None else 0,
+    }
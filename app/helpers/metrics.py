@@ -0,0 +1,232 @@
+import logging
+import os
+import time
+from typing import Callable, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+
+def latency_percentiles_ms(samples) -> dict:
+    """
+    p50/p95/p99/max of latency samples in seconds, in milliseconds.
+    """
+    samples = sorted(samples)
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+
+    def percentile(p: float) -> float:
+        return samples[min(len(samples) - 1, int(p * len(samples)))] * 1000
+
+    return {"p50": percentile(0.50), "p95": percentile(0.95), "p99": percentile(0.99), "max": samples[-1] * 1000}
+
+# Conversational latencies are in the tens of milliseconds to a few seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+
+AZURE_CONNECT_SECONDS = Histogram(
+    "agent_azure_connect_seconds",
+    "Time to get an Azure realtime session, from the pool (hit) or a new connection (miss).",
+    ["pool"], buckets=LATENCY_BUCKETS,
+)
+SESSION_READY_SECONDS = Histogram(
+    "agent_session_ready_seconds",
+    "Time from accepting the Twilio stream to the session being configured and the opening response requested.",
+    buckets=LATENCY_BUCKETS,
+)
+FIRST_AUDIO_SECONDS = Histogram(
+    "agent_first_audio_delta_seconds",
+    "Time from the Twilio start event to the first audio delta from Azure.",
+    buckets=LATENCY_BUCKETS,
+)
+VOICE_TO_VOICE_SECONDS = Histogram(
+    "agent_voice_to_voice_seconds",
+    "Time from input_audio_buffer.speech_stopped to the first audio delta of the reply.",
+    buckets=LATENCY_BUCKETS,
+)
+AUDIO_FRAMES = Counter(
+    "agent_audio_frames",
+    "Audio frames relayed; inbound is Twilio to Azure, outbound is Azure to Twilio.",
+    ["direction"],
+)
+INTERRUPTIONS = Counter("agent_interruptions", "Caller speech that interrupted the agent while it was speaking.")
+TRUNCATES = Counter("agent_truncates", "conversation.item.truncate events sent to Azure.")
+RELAY_QUEUE_DEPTH = Gauge(
+    "agent_relay_queue_depth",
+    "Messages waiting in the per-call relay queues; upstream is towards Azure, downstream towards Twilio.",
+    ["direction"], multiprocess_mode="livesum",
+)
+RELAY_QUEUE_DELAY = Histogram(
+    "agent_relay_queue_delay_seconds",
+    "Time a message waited in a relay queue before being written to its socket.",
+    ["direction"], buckets=LATENCY_BUCKETS,
+)
+RELAY_DROPPED = Counter(
+    "agent_relay_dropped",
+    "Audio messages dropped by a relay queue, because it was full (overflow) or too late (stale).",
+    ["direction", "reason"],
+)
+PLAYOUT_BUFFERED = Gauge(
+    "agent_playout_buffered_seconds",
+    "Agent audio queued for paced playout towards Twilio, not sent yet.",
+    multiprocess_mode="livesum",
+)
+PLAYOUT_UNDERRUNS = Counter(
+    "agent_outbound_underruns", "Agent audio arriving after the audio already sent to Twilio had run out mid-item.",
+)
+PLAYOUT_CLEARED = Counter(
+    "agent_playout_cleared_seconds", "Agent audio dropped from the playout queue on barge-in, before reaching Twilio.",
+)
+RELAY_MERGED = Counter("agent_relay_merged_frames", "Late audio messages merged into a single send.", ["direction"])
+TOOL_CALLS = Counter("agent_tool_calls", "Function calls made by the model, by tool and result.", ["tool", "result"])
+TOOL_SECONDS = Histogram(
+    "agent_tool_seconds", "Time to run a tool handler.", ["tool"], buckets=LATENCY_BUCKETS,
+)
+AZURE_RECONNECTS = Counter(
+    "agent_azure_reconnects", "Azure sessions re-opened after dropping mid-call, by result.", ["result"],
+)
+AZURE_RECONNECT_SECONDS = Histogram(
+    "agent_azure_reconnect_seconds",
+    "Time from an Azure session dropping mid-call to a replacement being connected, or to giving up.",
+    ["result"], buckets=LATENCY_BUCKETS,
+)
+CALLS_REJECTED = Counter("agent_calls_rejected", "Calls turned away by admission control, by limit reached.", ["reason"])
+CALLS = Counter("agent_calls", "Media streams served.")
+ACTIVE_CALLS = Gauge("agent_active_calls", "Media streams currently served.", multiprocess_mode="livesum")
+
+_inbound_frames = AUDIO_FRAMES.labels(direction="inbound")
+_outbound_frames = AUDIO_FRAMES.labels(direction="outbound")
+
+
+def observe_azure_checkout(latency: float, hit: bool):
+    """
+    Checkout hook for AzureSessionPool.
+    """
+    AZURE_CONNECT_SECONDS.labels(pool="hit" if hit else "miss").observe(latency)
+
+
+class CallMetrics:
+    """
+    Latency and volume figures of one media stream. Each figure is exported to the
+    process-wide histograms and counters as it happens, and the whole call is
+    summarized in one log line when it ends.
+    """
+
+    def __init__(self):
+        self.accepted_at = time.perf_counter()
+        self.started_at: Optional[float] = None
+        self.first_audio_at: Optional[float] = None
+        self.session_ready: Optional[float] = None
+        self.first_audio: Optional[float] = None
+        self._speech_stopped_at: Optional[float] = None
+        self.turn_latencies = []
+        self.frames_in = 0
+        self.frames_out = 0
+        self.interruptions = 0
+        self.truncates = 0
+        self.reconnects = 0
+        CALLS.inc()
+        ACTIVE_CALLS.inc()
+
+    def inbound_frame(self):
+        self.frames_in += 1
+        _inbound_frames.inc()
+
+    def stream_started(self):
+        self.started_at = time.perf_counter()
+
+    def session_configured(self):
+        self.session_ready = time.perf_counter() - self.accepted_at
+        SESSION_READY_SECONDS.observe(self.session_ready)
+
+    def outbound_frame(self):
+        now = time.perf_counter()
+        self.frames_out += 1
+        _outbound_frames.inc()
+        if self.first_audio_at is None:
+            self.first_audio_at = now
+            if self.started_at is not None:
+                self.first_audio = now - self.started_at
+                FIRST_AUDIO_SECONDS.observe(self.first_audio)
+        if self._speech_stopped_at is not None:
+            latency = now - self._speech_stopped_at
+            self._speech_stopped_at = None
+            self.turn_latencies.append(latency)
+            VOICE_TO_VOICE_SECONDS.observe(latency)
+
+    def speech_stopped(self):
+        self._speech_stopped_at = time.perf_counter()
+
+    def interruption(self):
+        self.interruptions += 1
+        INTERRUPTIONS.inc()
+
+    def truncate(self):
+        self.truncates += 1
+        TRUNCATES.inc()
+
+    def reconnected(self):
+        self.reconnects += 1
+
+    def finish(self, call_sid: Optional[str] = None):
+        """
+        Logs the call summary and releases the active call gauge.
+        """
+        ACTIVE_CALLS.dec()
+
+        def ms(value: Optional[float]) -> str:
+            return f"{value * 1000:.0f}ms" if value is not None else "n/a"
+
+        turns = sorted(self.turn_latencies)
+        logger.info(
+            f"Call {call_sid or 'unknown'} metrics: duration {time.perf_counter() - self.accepted_at:.1f}s, "
+            f"session ready {ms(self.session_ready)}, first audio {ms(self.first_audio)}, "
+            f"voice-to-voice p50 {ms(turns[len(turns) // 2] if turns else None)} over {len(turns)} turns, "
+            f"frames in/out {self.frames_in}/{self.frames_out}, "
+            f"interruptions {self.interruptions}, truncates {self.truncates}, reconnects {self.reconnects}."
+        )
+
+
+class StatsCollector:
+    """
+    Exposes the counters a component already keeps in its stats() dict, without
+    duplicating them into Prometheus metrics on the hot path.
+    """
+
+    def __init__(self, prefix: str, stats: Callable[[], dict], counters: tuple = ()):
+        self.prefix = prefix
+        self.stats = stats
+        self.counters = set(counters)
+
+    def collect(self):
+        for name, value in self.stats().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            if name in self.counters:
+                yield CounterMetricFamily(f"{self.prefix}_{name}", f"{self.prefix} {name}", value=value)
+            else:
+                yield GaugeMetricFamily(f"{self.prefix}_{name}", f"{self.prefix} {name}", value=value)
+
+
+def register_stats(prefix: str, stats: Callable[[], dict], counters: tuple = ()):
+    """
+    Publishes the numeric fields of a stats() dict. Skipped in multiprocess mode,
+    where only the metrics stored in PROMETHEUS_MULTIPROC_DIR are aggregated.
+    """
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        REGISTRY.register(StatsCollector(prefix, stats, counters))
+
+
+def render_metrics() -> tuple:
+    """
+    Returns the exposition text and its content type. Under gunicorn with
+    PROMETHEUS_MULTIPROC_DIR set, the figures of all workers are aggregated.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
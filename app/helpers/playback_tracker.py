@@ -0,0 +1,133 @@
+import logging
+import time
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+from app.helpers.audio_coalescer import ULAW_BYTES_PER_MS
+
+logger = logging.getLogger(__name__)
+
+
+def decoded_length(payload: str) -> int:
+    """
+    Number of bytes in a base64 payload, without decoding it.
+    """
+    padding = 2 if payload.endswith("==") else 1 if payload.endswith("=") else 0
+    return len(payload) * 3 // 4 - padding
+
+
+class PlaybackTracker:
+    """
+    Keeps track of how much agent audio the caller has actually heard.
+
+    Every audio byte sent to Twilio gets an offset in the stream. A mark is
+    requested once `mark_interval_ms` of audio has been sent since the previous
+    one, instead of after every delta; Twilio echoes each mark when playback
+    reaches it. The last echoed mark anchors the playback position, which then
+    advances in real time (8 bytes per ms of g711_ulaw) up to the next pending
+    mark, so the played duration of the current item is exact to the byte at the
+    marks and within the link jitter in between.
+
+    Marks are named after a sequence number and echoed in order, so each echo
+    pops the pending marks up to and including it in O(1) amortized time.
+    """
+
+    def __init__(self, mark_interval_ms: int = 200):
+        self.mark_bytes = max(mark_interval_ms, 0) * ULAW_BYTES_PER_MS
+        # (sequence, stream offset) of the marks sent and not echoed yet
+        self._marks: Deque[Tuple[int, int]] = deque()
+        self._sequence = 0
+        self._queued = 0
+        self._unmarked = 0
+        self._anchor_offset = 0
+        self._anchor_at = time.perf_counter()
+        self.item_id: Optional[str] = None
+        self._item_start = 0
+        self.marks_sent = 0
+
+    def add_audio(self, item_id: Optional[str], size: int) -> Optional[str]:
+        """
+        Records `size` bytes of agent audio written to the caller. Returns the name
+        of a mark to send after it, or None when the interval is not reached yet.
+        """
+        now = time.perf_counter()
+        if self._position(now) >= self._queued:
+            # Playback had caught up, so this audio starts playing now
+            self._anchor_offset = self._queued
+            self._anchor_at = now
+        if item_id is not None and item_id != self.item_id:
+            self.item_id = item_id
+            self._item_start = self._queued
+        self._queued += size
+        self._unmarked += size
+        if self._unmarked >= self.mark_bytes:
+            return self.mark()
+        return None
+
+    def mark(self) -> Optional[str]:
+        """
+        Returns the name of a mark covering the audio queued since the last one,
+        e.g. at the end of a response. None when there is nothing to cover.
+        """
+        if not self._unmarked:
+            return None
+        self._sequence += 1
+        self._unmarked = 0
+        self._marks.append((self._sequence, self._queued))
+        self.marks_sent += 1
+        return str(self._sequence)
+
+    def on_mark(self, name: Optional[str]):
+        """
+        Handles a mark echoed by Twilio.
+        """
+        try:
+            sequence = int(name)
+        except (TypeError, ValueError):
+            logger.debug(f"Ignoring unknown mark {name!r}.")
+            return
+        offset = None
+        while self._marks and self._marks[0][0] <= sequence:
+            offset = self._marks.popleft()[1]
+        if offset is not None:
+            self._anchor_offset = offset
+            self._anchor_at = time.perf_counter()
+
+    def _position(self, now: float) -> int:
+        limit = self._marks[0][1] if self._marks else self._queued
+        position = self._anchor_offset + int((now - self._anchor_at) * 1000 * ULAW_BYTES_PER_MS)
+        return min(position, limit)
+
+    @property
+    def playing(self) -> bool:
+        """
+        Whether queued agent audio has not been played yet.
+        """
+        return bool(self._marks) or self._position(time.perf_counter()) < self._queued
+
+    def played_ms(self) -> int:
+        """
+        Milliseconds of the current item heard by the caller so far.
+        """
+        played = self._position(time.perf_counter()) - self._item_start
+        return max(played, 0) // ULAW_BYTES_PER_MS
+
+    def forget_item(self):
+        """
+        Stops attributing the audio queued so far to its item, e.g. once the session
+        that created the item is gone. The playback position is kept.
+        """
+        self.item_id = None
+        self._item_start = self._queued
+
+    def clear(self):
+        """
+        Forgets the pending audio after Twilio was told to clear its buffer. Marks
+        of the cleared audio echoed afterwards are ignored.
+        """
+        self._marks.clear()
+        self._unmarked = 0
+        self._anchor_offset = self._queued
+        self._anchor_at = time.perf_counter()
+        self.item_id = None
+        self._item_start = self._queued
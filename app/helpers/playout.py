@@ -0,0 +1,225 @@
+import asyncio
+import base64
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, Tuple
+
+from app.helpers.audio_coalescer import ULAW_BYTES_PER_MS
+from app.helpers.metrics import PLAYOUT_BUFFERED, PLAYOUT_CLEARED, PLAYOUT_UNDERRUNS
+from app.helpers.playback_tracker import decoded_length
+
+logger = logging.getLogger(__name__)
+
+
+class PlayoutStats:
+    """
+    Process-wide counters of the outbound playout of all calls.
+    """
+
+    def __init__(self, frame_ms: int, lead_ms: int):
+        self.frame_ms = frame_ms
+        self.lead_ms = lead_ms
+        self.frames_sent = 0
+        self.underruns = 0
+        self.clears = 0
+        self.cleared_ms = 0
+        self.max_depth_ms = 0
+
+    def summary(self) -> dict:
+        return {
+            "frame_ms": self.frame_ms,
+            "lead_ms": self.lead_ms,
+            "frames_sent": self.frames_sent,
+            "underruns": self.underruns,
+            "clears": self.clears,
+            "cleared_ms": self.cleared_ms,
+            "max_depth_ms": self.max_depth_ms,
+        }
+
+
+class PlayoutScheduler:
+    """
+    Paces the agent audio of one call towards Twilio instead of forwarding each
+    Azure burst as it arrives.
+
+    Audio deltas are queued and re-framed into `frame_ms` g711_ulaw frames, sent
+    by a dedicated task no more than `lead_ms` ahead of real time. Twilio then
+    holds little unplayed audio, so on barge-in clear() drops the unsent audio
+    locally at once and the played position used for truncation stays accurate.
+    Each frame is passed to `send_frame(payload, item_id, size)`; a marker queued
+    with add_marker() calls `on_marker()` once the audio queued before it is sent.
+
+    An underrun is counted when audio of the item being played arrives after the
+    audio already sent has run out.
+
+    With `enabled` False, audio and markers are passed through as they arrive.
+    """
+
+    def __init__(
+        self,
+        send_frame: Callable[[str, Optional[str], int], Awaitable[None]],
+        on_marker: Callable[[], Awaitable[None]],
+        stats: PlayoutStats,
+        enabled: bool = True,
+        frame_ms: int = 20,
+        lead_ms: int = 200,
+    ):
+        self.send_frame = send_frame
+        self.on_marker = on_marker
+        self.stats = stats
+        self.enabled = enabled
+        self.frame_bytes = max(frame_ms, 1) * ULAW_BYTES_PER_MS
+        self.lead_ms = lead_ms
+
+        # (item_id, audio); audio is None for a marker
+        self._queue: Deque[Tuple[Optional[str], Optional[bytes]]] = deque()
+        self._head_offset = 0
+        self._depth_bytes = 0
+        self._ready: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        # Real time the audio sent so far is measured against, reset whenever playout falls behind
+        self._started_at: Optional[float] = None
+        self._sent_ms = 0.0
+        self._last_item: Optional[str] = None
+
+        self.frames_sent = 0
+        self.underruns = 0
+
+    @property
+    def depth_ms(self) -> int:
+        return self._depth_bytes // ULAW_BYTES_PER_MS
+
+    def start(self):
+        """
+        Starts the pacing task. Must be called from within the running event loop.
+        """
+        if self.enabled:
+            self._ready = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="playout")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._drop_queue()
+        if self.enabled:
+            logger.info("Playout: sent %s frames, %s underruns.", self.frames_sent, self.underruns)
+
+    async def add(self, item_id: Optional[str], payload: str):
+        """
+        Queues a base64 g711_ulaw audio delta of an assistant item.
+        """
+        if not self.enabled:
+            await self.send_frame(payload, item_id, decoded_length(payload))
+            return
+        audio = base64.b64decode(payload)
+        if not audio:
+            return
+        if not self._queue and item_id == self._last_item and self._ahead_ms(time.perf_counter()) < 0:
+            self.underruns += 1
+            self.stats.underruns += 1
+            PLAYOUT_UNDERRUNS.inc()
+        self._queue.append((item_id, audio))
+        self._depth_bytes += len(audio)
+        PLAYOUT_BUFFERED.inc(len(audio) / (ULAW_BYTES_PER_MS * 1000))
+        if self.depth_ms > self.stats.max_depth_ms:
+            self.stats.max_depth_ms = self.depth_ms
+        self._ready.set()
+
+    async def add_marker(self):
+        """
+        Queues a call to `on_marker` behind the audio queued so far.
+        """
+        if not self.enabled:
+            await self.on_marker()
+            return
+        self._queue.append((None, None))
+        self._ready.set()
+
+    def forget_items(self):
+        """
+        Keeps the queued audio but detaches it from its items, e.g. once the session
+        that created them is gone, so it is never attributed to them when played.
+        """
+        self._queue = deque((None if audio is not None else item_id, audio) for item_id, audio in self._queue)
+        self._last_item = None
+
+    def clear(self) -> int:
+        """
+        Drops the audio and markers not sent yet. Returns the milliseconds of audio dropped.
+        """
+        cleared_ms = self.depth_ms
+        self._drop_queue()
+        self._started_at = None
+        if cleared_ms:
+            self.stats.clears += 1
+            self.stats.cleared_ms += cleared_ms
+            PLAYOUT_CLEARED.inc(cleared_ms / 1000)
+        return cleared_ms
+
+    def _drop_queue(self):
+        PLAYOUT_BUFFERED.dec(self._depth_bytes / (ULAW_BYTES_PER_MS * 1000))
+        self._queue.clear()
+        self._head_offset = 0
+        self._depth_bytes = 0
+
+    def _ahead_ms(self, now: float) -> float:
+        """
+        Milliseconds of audio sent beyond real time, negative once it has all been played.
+        """
+        if self._started_at is None:
+            return -1.0
+        return self._sent_ms - (now - self._started_at) * 1000
+
+    def _take_frame(self) -> Tuple[Optional[str], bytes]:
+        """
+        Takes up to one frame of audio of the item at the head of the queue.
+        """
+        item_id = self._queue[0][0]
+        parts, needed = [], self.frame_bytes
+        while needed and self._queue and self._queue[0][1] is not None and self._queue[0][0] == item_id:
+            audio = self._queue[0][1]
+            part = audio[self._head_offset:self._head_offset + needed]
+            parts.append(part)
+            needed -= len(part)
+            self._head_offset += len(part)
+            if self._head_offset >= len(audio):
+                self._queue.popleft()
+                self._head_offset = 0
+        frame = b"".join(parts)
+        self._depth_bytes -= len(frame)
+        PLAYOUT_BUFFERED.dec(len(frame) / (ULAW_BYTES_PER_MS * 1000))
+        return item_id, frame
+
+    async def _run(self):
+        while True:
+            if not self._queue:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            if self._queue[0][1] is None:
+                self._queue.popleft()
+                await self.on_marker()
+                continue
+
+            now = time.perf_counter()
+            ahead = self._ahead_ms(now)
+            if ahead < 0:
+                # Twilio has played everything, start pacing again from now
+                self._started_at, self._sent_ms = now, 0.0
+            elif ahead >= self.lead_ms:
+                await asyncio.sleep((ahead - self.lead_ms) / 1000 + self.frame_bytes / (ULAW_BYTES_PER_MS * 1000))
+                continue
+
+            item_id, frame = self._take_frame()
+            self._sent_ms += len(frame) / ULAW_BYTES_PER_MS
+            self._last_item = item_id
+            self.frames_sent += 1
+            self.stats.frames_sent += 1
+            await self.send_frame(base64.b64encode(frame).decode("ascii"), item_id, len(frame))
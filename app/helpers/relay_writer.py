@@ -0,0 +1,196 @@
+import asyncio
+import base64
+import logging
+import time
+from collections import Counter, deque
+from typing import Any, Awaitable, Callable, Deque, List, Optional, Tuple, Union
+
+from app.helpers.metrics import RELAY_DROPPED, RELAY_MERGED, RELAY_QUEUE_DELAY, RELAY_QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("drop", "merge")
+
+
+class SocketWriter:
+    """
+    Owns all writes to one socket. Messages are queued without waiting for the
+    peer and sent in order by a dedicated task, so a slow Azure region or caller
+    link only delays its own direction.
+
+    The queue holds at most `max_items` messages; when it is full the oldest audio
+    is dropped. Audio that has waited longer than `max_lag_ms` is handled by the
+    policy: "drop" discards it, "merge" sends it together with the audio queued
+    behind it as a single message, so the backlog is caught up in one send.
+    Control messages (marks, clear, truncate, session updates) are never dropped.
+
+    Audio can be queued with a tag; `on_audio_sent` is called with the tag of each
+    payload once it is written, so nothing is counted for audio that was dropped,
+    and a message it returns (e.g. a mark) is written right after the audio.
+    """
+
+    def __init__(
+        self,
+        direction: str,
+        send: Callable[[str], Awaitable[None]],
+        render_audio: Callable[[str], str],
+        policy: str = "drop",
+        max_items: int = 500,
+        max_lag_ms: int = 500,
+        on_error: Optional[Callable[[Exception], None]] = None,
+        on_audio_sent: Optional[Callable[[Any], Optional[str]]] = None,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown relay policy '{policy}', expected one of {POLICIES}.")
+        self.direction = direction
+        self._send = send
+        self.render_audio = render_audio
+        self.policy = policy
+        self.max_items = max(max_items, 1)
+        self.max_lag = max_lag_ms / 1000
+        self.on_error = on_error
+        self.on_audio_sent = on_audio_sent
+
+        # (enqueued_at, message, audio payload, tag); message is None for audio rendered at write
+        # time, or a function rendering a control message at write time
+        self._items: Deque[Tuple[float, Union[str, Callable[[], Optional[str]], None], Optional[str], Any]] = deque()
+        # Bumped when the queue is discarded, so audio being written meanwhile is not reported
+        self._generation = 0
+        self._ready: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.sent = 0
+        self.merged = 0
+        self.max_depth = 0
+        self.dropped: Counter = Counter()
+        self._depth = RELAY_QUEUE_DEPTH.labels(direction=direction)
+        self._delay = RELAY_QUEUE_DELAY.labels(direction=direction)
+
+    def start(self):
+        """
+        Starts the writer task. Must be called from within the running event loop.
+        """
+        self._ready = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name=f"{self.direction}_writer")
+
+    async def close(self):
+        """
+        Stops the writer task, discarding whatever is still queued.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._depth.dec(len(self._items))
+        self._items.clear()
+        logger.info(
+            f"{self.direction} writer: sent {self.sent}, merged {self.merged} frames, dropped {dict(self.dropped)}, "
+            f"max depth {self.max_depth}."
+        )
+
+    @property
+    def depth(self) -> int:
+        return len(self._items)
+
+    async def send(self, message: Union[str, Callable[[], Optional[str]]]):
+        """
+        Queues a control message, or a function called at write time to render one
+        from the state of that moment; nothing is written when it returns None.
+        """
+        self._put((time.perf_counter(), message, None, None))
+
+    async def send_audio(self, payload: str, tag: Any = None):
+        """
+        Queues a base64 audio payload, rendered into a message when it is written.
+        """
+        if len(self._items) >= self.max_items and self._drop_oldest_audio():
+            self.dropped["overflow"] += 1
+            RELAY_DROPPED.labels(direction=self.direction, reason="overflow").inc()
+        self._put((time.perf_counter(), None, payload, tag))
+
+    def discard_pending(self) -> int:
+        """
+        Drops every queued message, e.g. the agent audio and marks still waiting
+        when playback is cleared on barge-in. Returns how many were dropped.
+        """
+        discarded = len(self._items)
+        self._items.clear()
+        self._generation += 1
+        self._depth.dec(discarded)
+        return discarded
+
+    def _put(self, item):
+        self._items.append(item)
+        self._depth.inc()
+        if len(self._items) > self.max_depth:
+            self.max_depth = len(self._items)
+        if self._ready is not None:
+            self._ready.set()
+
+    def _drop_oldest_audio(self) -> bool:
+        for index, item in enumerate(self._items):
+            if item[2] is not None:
+                del self._items[index]
+                self._depth.dec()
+                return True
+        return False
+
+    def _take_audio_run(self, payload: str, tags: List[Any]) -> str:
+        """
+        Merges the audio queued right behind `payload` into one payload, adding their tags to `tags`.
+        """
+        payloads = [payload]
+        while self._items and self._items[0][2] is not None:
+            _, _, queued, tag = self._items.popleft()
+            payloads.append(queued)
+            tags.append(tag)
+        if len(payloads) == 1:
+            return payload
+        self._depth.dec(len(payloads) - 1)
+        self.merged += len(payloads)
+        RELAY_MERGED.labels(direction=self.direction).inc(len(payloads))
+        return base64.b64encode(b"".join(base64.b64decode(p) for p in payloads)).decode("ascii")
+
+    async def _run(self):
+        try:
+            while True:
+                if not self._items:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+
+                enqueued_at, message, payload, tag = self._items.popleft()
+                self._depth.dec()
+                tags = [tag]
+                if payload is not None:
+                    if time.perf_counter() - enqueued_at > self.max_lag:
+                        if self.policy == "drop":
+                            self.dropped["stale"] += 1
+                            RELAY_DROPPED.labels(direction=self.direction, reason="stale").inc()
+                            continue
+                        payload = self._take_audio_run(payload, tags)
+                    message = self.render_audio(payload)
+                elif callable(message):
+                    message = message()
+                    if message is None:
+                        continue
+
+                generation = self._generation
+                await self._send(message)
+                self.sent += 1
+                self._delay.observe(time.perf_counter() - enqueued_at)
+                if payload is not None and self.on_audio_sent is not None and generation == self._generation:
+                    for tag in tags:
+                        follow_up = self.on_audio_sent(tag)
+                        if follow_up is not None:
+                            await self._send(follow_up)
+                            self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"{self.direction} writer stopped: {e}")
+            if self.on_error is not None:
+                self.on_error(e)
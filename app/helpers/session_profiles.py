@@ -0,0 +1,245 @@
+import asyncio
+import copy
+import logging
+import os
+import time
+import weakref
+from typing import Dict, List, Optional
+
+from app.helpers import codec
+from app.helpers.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+CONFIG_DIR = os.path.join(os.path.dirname(__file__), "..", "config")
+SESSION_FILE_PATH = os.path.join(CONFIG_DIR, "gpt_audio_session_template.json")
+INSTRUCTION_FILE_PATH = os.path.join(CONFIG_DIR, "system_instructions.txt")
+PROFILES_DIR = os.path.join(CONFIG_DIR, "profiles")
+
+DEFAULT_PROFILE = "default"
+
+
+def _merge(base: dict, overrides: dict) -> dict:
+    """
+    Merges `overrides` into `base` in place, descending into nested objects.
+    """
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            _merge(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+
+def _read(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as file:
+        return file.read()
+
+
+class SessionProfiles:
+    """
+    Serialized session.update messages, built once from the session template,
+    the system instructions and the settings, so setting up a call involves no
+    disk I/O or JSON work.
+
+    Besides the default profile, every `<name>.json` in the profiles directory
+    defines a named profile:
+
+        {
+            "instructions_file": "system_instructions_es.txt",
+            "session": {"voice": "alloy", "turn_detection": {"threshold": 0.6}}
+        }
+
+    `session` is merged over the default session and `instructions_file`, relative
+    to the config directory, replaces the system instructions.
+
+    The files are reloaded when their modification time changes or when reload()
+    is called. A reload that fails keeps serving the previous payloads.
+    """
+
+    def __init__(self, settings, profiles_dir: str = PROFILES_DIR, reload_interval: float = 5.0):
+        self.settings = settings
+        self.profiles_dir = profiles_dir
+        self.reload_interval = reload_interval
+        self.version = 0
+        self.loaded_at: Optional[float] = None
+
+        self._payloads: Dict[str, str] = {}
+        self._mtimes: Dict[str, float] = {}
+        self._watch_task: Optional[asyncio.Task] = None
+        # Profile and version each Azure session was last configured with
+        self._applied: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+    @property
+    def names(self) -> List[str]:
+        return sorted(self._payloads)
+
+    def load(self):
+        """
+        Reads and serializes every profile. Blocking; runs at startup and in a
+        worker thread on reload.
+        """
+        mtimes = self._snapshot()
+        template = codec.loads(_read(SESSION_FILE_PATH))
+        default_instructions = _read(INSTRUCTION_FILE_PATH)
+
+        settings = self.settings
+        template.update({"temperature": settings.GPT_AUDIO_TEMPRATURE, "voice": settings.GPT_AUDIO_VOICE_NAME})
+        template["turn_detection"].update({
+            "threshold": settings.GPT_AUDIO_THRESHOLD,
+            "silence_duration_ms": settings.GPT_AUDIO_SILENCE_DURATION_MS,
+            "prefix_padding_ms": settings.GPT_AUDIO_PREFIX_PADDING_MS,
+        })
+
+        profiles = {DEFAULT_PROFILE: {}}
+        for file_name in self._profile_files():
+            profiles[file_name[:-len(".json")]] = codec.loads(_read(os.path.join(self.profiles_dir, file_name)))
+
+        payloads = {}
+        for name, profile in profiles.items():
+            session = _merge(copy.deepcopy(template), profile.get("session", {}))
+            # The media stream converts caller and agent audio to and from this format
+            session["input_audio_format"] = session["output_audio_format"] = settings.AZURE_AUDIO_FORMAT
+            instructions_file = profile.get("instructions_file")
+            session["instructions"] = (
+                _read(os.path.join(CONFIG_DIR, instructions_file)) if instructions_file else default_instructions
+            )
+            payloads[name] = codec.dumps({"type": "session.update", "session": session})
+
+        self._payloads = payloads
+        self._mtimes = mtimes
+        self.version += 1
+        self.loaded_at = time.time()
+        logger.info("Loaded session profiles %s (version %s).", sorted(payloads), self.version)
+
+    async def reload(self) -> bool:
+        """
+        Rebuilds the payloads off the event loop. Returns whether it succeeded.
+        """
+        try:
+            await asyncio.to_thread(self.load)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to reload session profiles, keeping version {self.version}: {e}")
+            return False
+
+    async def start(self):
+        """
+        Loads the profiles and starts watching the files for changes.
+        """
+        if not self._payloads:
+            await self.reload()
+        if self.reload_interval > 0 and self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._watch(), name="session_profiles_watch")
+
+    async def stop(self):
+        """
+        Stops watching the files.
+        """
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+    def resolve(self, name: Optional[str]) -> str:
+        """
+        Returns the profile name to use, falling back to the default for unknown names.
+        """
+        if not self._payloads:
+            self.load()
+        if not name:
+            return DEFAULT_PROFILE
+        if name not in self._payloads:
+            logger.warning(f"Unknown session profile '{name}', using '{DEFAULT_PROFILE}'.")
+            return DEFAULT_PROFILE
+        return name
+
+    def payload(self, name: Optional[str] = None) -> str:
+        """
+        Returns the serialized session.update message of a profile.
+        """
+        return self._payloads[self.resolve(name)]
+
+    async def apply(self, azure_ws, name: Optional[str] = None) -> str:
+        """
+        Configures an Azure session with a profile, unless it already runs the
+        current version of that profile. Returns the profile name applied.
+        """
+        name = self.resolve(name)
+        applied = (name, self.version)
+        if self._applied.get(azure_ws) != applied:
+            await azure_ws.send(self._payloads[name])
+            self._applied[azure_ws] = applied
+            logger.info("Session profile '%s' sent to Azure.", name)
+        return name
+
+    def stats(self) -> dict:
+        return {
+            "profiles": self.names,
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "reload_interval_s": self.reload_interval,
+        }
+
+    def _profile_files(self) -> List[str]:
+        if not os.path.isdir(self.profiles_dir):
+            return []
+        return sorted(name for name in os.listdir(self.profiles_dir) if name.endswith(".json"))
+
+    def _snapshot(self) -> Dict[str, float]:
+        """
+        Modification times of every file the payloads are built from.
+        """
+        paths = [SESSION_FILE_PATH, INSTRUCTION_FILE_PATH, self.profiles_dir]
+        for file_name in self._profile_files():
+            path = os.path.join(self.profiles_dir, file_name)
+            paths.append(path)
+            try:
+                instructions_file = codec.loads(_read(path)).get("instructions_file")
+            except Exception:
+                instructions_file = None
+            if instructions_file:
+                paths.append(os.path.join(CONFIG_DIR, instructions_file))
+
+        mtimes = {}
+        for path in paths:
+            try:
+                mtimes[path] = os.stat(path).st_mtime
+            except OSError:
+                mtimes[path] = 0.0
+        return mtimes
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                mtimes = await asyncio.to_thread(self._snapshot)
+            except Exception as e:
+                logger.error(f"Error checking session profile files: {e}")
+                continue
+            if mtimes != self._mtimes:
+                # Remembered even if the reload fails, so a broken file is reported once
+                self._mtimes = mtimes
+                logger.info("Session profile files changed, reloading.")
+                await self.reload()
+
+
+_profiles: Optional[SessionProfiles] = None
+
+
+def get_session_profiles() -> SessionProfiles:
+    """
+    Returns the process-wide session profile cache.
+    """
+    global _profiles
+    if _profiles is None:
+        settings = get_settings()
+        _profiles = SessionProfiles(
+            settings,
+            profiles_dir=settings.SESSION_PROFILES_DIR or PROFILES_DIR,
+            reload_interval=settings.SESSION_PROFILES_RELOAD_INTERVAL_S,
+        )
+    return _profiles
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+from typing import Coroutine, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class SessionTaskGroup:
+    """
+    Runs the tasks of one session until the first of them finishes, returns or
+    fails, then cancels the others and waits for them. asyncio.TaskGroup does not
+    fit: it waits for every task to return and only cancels the others when one
+    fails, while a session ends as soon as either direction of the relay stops.
+
+    Tasks created with `critical=False` (e.g. background watchers) do not end
+    the session when they finish.
+
+        async with SessionTaskGroup() as group:
+            group.create_task(receive(), name="receive")
+            group.create_task(send(), name="send")
+            await group.wait()
+    """
+
+    def __init__(self):
+        self._tasks: Set[asyncio.Task] = set()
+        self._finished: Optional[asyncio.Event] = None
+        self.first_done: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "SessionTaskGroup":
+        self._finished = asyncio.Event()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.cancel()
+
+    def create_task(self, coro: Coroutine, name: Optional[str] = None, critical: bool = True) -> asyncio.Task:
+        task = asyncio.create_task(coro, name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._on_done if critical else self._on_background_done)
+        return task
+
+    def _on_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.error(f"Task {task.get_name()} failed: {task.exception()!r}")
+        if self.first_done is None:
+            self.first_done = task
+        self._finished.set()
+
+    def _on_background_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Task {task.get_name()} failed: {task.exception()!r}")
+
+    async def wait(self) -> Optional[asyncio.Task]:
+        """
+        Waits until the first critical task finishes and returns it.
+        """
+        await self._finished.wait()
+        return self.first_done
+
+    async def cancel(self):
+        """
+        Cancels the remaining tasks and waits for them to finish.
+        """
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for task, result in zip(tasks, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error cancelling {task.get_name()}: {result!r}")
+        self._tasks.clear()
@@ -0,0 +1,213 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.helpers import codec
+from app.helpers.audio_relay import RESPONSE_CREATE_MESSAGE
+from app.helpers.config import get_settings
+from app.helpers.metrics import TOOL_CALLS, TOOL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class ToolContext:
+    """
+    What a tool handler knows about the call it runs for.
+    """
+
+    def __init__(self, call_sid: Optional[str], stream_sid: Optional[str], end_call: Callable[[], None]):
+        self.call_sid = call_sid
+        self.stream_sid = stream_sid
+        self.end_call = end_call
+
+
+class Tool:
+    """
+    A handler for one function declared in the session `tools`. The handler is
+    called as `await handler(context, arguments)` and returns the output sent
+    back to the model, any JSON-serializable value. With `reply` False nothing is
+    sent back (e.g. hangup_call ends the call). A `cache_ttl` > 0 reuses the
+    output of identical calls, across calls, for that many seconds.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[ToolContext, Dict[str, Any]], Awaitable[Any]],
+        timeout: Optional[float] = None,
+        cache_ttl: float = 0.0,
+        reply: bool = True,
+    ):
+        self.handler = handler
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.reply = reply
+
+
+class ToolRegistry:
+    """
+    The tools the model may call: the functions declared in the session template,
+    matched to their handlers by name, plus a small process-wide result cache.
+    """
+
+    def __init__(self, tools: Dict[str, Tool], declared: List[str], default_timeout: float = 5.0, cache_max_entries: int = 1024):
+        self.tools = {name: tool for name, tool in tools.items() if name in declared}
+        self.default_timeout = default_timeout
+        self.cache_max_entries = cache_max_entries
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+
+        for name in declared:
+            if name not in tools:
+                logger.warning(f"Tool '{name}' is declared in the session but has no handler.")
+        for name in tools:
+            if name not in declared:
+                logger.warning(f"Handler for tool '{name}' is not declared in the session, the model cannot call it.")
+
+    @classmethod
+    def from_session_template(cls, path: str, tools: Dict[str, Tool], **kwargs) -> "ToolRegistry":
+        with open(path, "r", encoding="utf-8") as file:
+            template = codec.loads(file.read())
+        declared = [spec["name"] for spec in template.get("tools", []) if spec.get("type") == "function"]
+        return cls(tools, declared, **kwargs)
+
+    def get(self, name: str) -> Optional[Tool]:
+        return self.tools.get(name)
+
+    def cached(self, name: str, key: str) -> Tuple[bool, Any]:
+        entry = self._cache.get((name, key))
+        if entry is None:
+            return False, None
+        expires_at, output = entry
+        if expires_at < time.monotonic():
+            del self._cache[(name, key)]
+            return False, None
+        self._cache.move_to_end((name, key))
+        return True, output
+
+    def store(self, name: str, key: str, output: Any, ttl: float):
+        self._cache[(name, key)] = (time.monotonic() + ttl, output)
+        self._cache.move_to_end((name, key))
+        while len(self._cache) > self.cache_max_entries:
+            self._cache.popitem(last=False)
+
+
+class ToolDispatcher:
+    """
+    Runs the function calls of one call. Each call runs in its own task, so a
+    slow tool never holds up the audio relay; its output is posted back as a
+    function_call_output item through `send`.
+
+    The model is asked to continue (response.create) once the response that made
+    the calls is done and no other call of it is still running, so parallel
+    calls are answered together in a single new response.
+    """
+
+    def __init__(self, registry: ToolRegistry, context: ToolContext, send: Callable[[str], Awaitable[None]]):
+        self.registry = registry
+        self.context = context
+        self.send = send
+        self._running = 0
+        self._response_active = False
+        self._outputs_posted = False
+
+    def response_started(self):
+        self._response_active = True
+
+    async def response_done(self):
+        self._response_active = False
+        await self._maybe_continue()
+
+    def reset(self):
+        """
+        Forgets the response in progress and the outputs posted to an Azure session
+        that was replaced. Calls still running post their output to the new one.
+        """
+        self._response_active = False
+        self._outputs_posted = False
+
+    def call(self, call_id: str, name: str, arguments: str) -> Awaitable[None]:
+        """
+        Returns the coroutine running one function call, to be run as a task.
+        """
+        self._running += 1
+        return self._run(call_id, name, arguments)
+
+    async def _run(self, call_id: str, name: str, arguments: str):
+        tool = self.registry.get(name)
+        try:
+            if tool is None:
+                logger.warning(f"Model called unknown tool '{name}'.")
+                output, result = {"error": f"Unknown tool '{name}'."}, "unknown"
+            else:
+                output, result = await self._execute(name, tool, arguments)
+            TOOL_CALLS.labels(tool=name if tool is not None else "unknown", result=result).inc()
+            if tool is None or tool.reply:
+                await self.send(codec.dumps({
+                    "type": "conversation.item.create",
+                    "item": {"type": "function_call_output", "call_id": call_id, "output": json.dumps(output)},
+                }))
+                self._outputs_posted = True
+        finally:
+            self._running -= 1
+        await self._maybe_continue()
+
+    async def _execute(self, name: str, tool: Tool, arguments: str) -> Tuple[Any, str]:
+        try:
+            args = codec.loads(arguments or "{}")
+        except codec.DECODE_ERRORS as e:
+            logger.error(f"Invalid arguments for tool '{name}': {e}")
+            return {"error": "Invalid arguments."}, "error"
+
+        cache_key = json.dumps(args, sort_keys=True) if tool.cache_ttl > 0 else None
+        if cache_key is not None:
+            hit, output = self.registry.cached(name, cache_key)
+            if hit:
+                return output, "cached"
+
+        started = time.perf_counter()
+        try:
+            output = await asyncio.wait_for(tool.handler(self.context, args), timeout=tool.timeout or self.registry.default_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Tool '{name}' timed out.")
+            return {"error": "The lookup took too long, please try again later."}, "timeout"
+        except Exception as e:
+            logger.error(f"Tool '{name}' failed: {e}", exc_info=True)
+            return {"error": "The lookup failed."}, "error"
+        finally:
+            TOOL_SECONDS.labels(tool=name).observe(time.perf_counter() - started)
+
+        logger.info("Tool '%s' completed in %.0fms.", name, (time.perf_counter() - started) * 1000)
+        if cache_key is not None:
+            self.registry.store(name, cache_key, output, tool.cache_ttl)
+        return output, "ok"
+
+    async def _maybe_continue(self):
+        if self._outputs_posted and not self._running and not self._response_active:
+            self._outputs_posted = False
+            await self.send(RESPONSE_CREATE_MESSAGE)
+
+
+_registry: Optional[ToolRegistry] = None
+
+
+def get_tool_registry() -> ToolRegistry:
+    """
+    Returns the process-wide tool registry, built from the session template and
+    the handlers in app.controllers.tools.
+    """
+    global _registry
+    if _registry is None:
+        from app.controllers.tools import TOOLS
+        from app.helpers.session_profiles import SESSION_FILE_PATH
+
+        settings = get_settings()
+        _registry = ToolRegistry.from_session_template(
+            SESSION_FILE_PATH,
+            TOOLS,
+            default_timeout=settings.TOOL_TIMEOUT_S,
+            cache_max_entries=settings.TOOL_CACHE_MAX_ENTRIES,
+        )
+        logger.info(f"Registered tools {sorted(_registry.tools)}.")
+    return _registry
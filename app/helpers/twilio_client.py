@@ -0,0 +1,91 @@
+import logging
+from typing import Dict, Optional
+
+from aiohttp import ClientConnectorError, ClientSession, ClientTimeout, TCPConnector
+from aiohttp_retry import ExponentialRetry, RetryClient
+from twilio.http.async_http_client import AsyncTwilioHttpClient
+from twilio.request_validator import RequestValidator
+from twilio.rest import Client
+
+from app.helpers.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Only retry answers that tell us the request was not acted upon, and failures to
+# connect, where the request was never sent. A timeout or a dropped connection is
+# not retried: Twilio may already have acted on the request, and a retried
+# calls.create would dial the same number twice
+RETRY_STATUSES = {429, 503}
+RETRY_EXCEPTIONS = {ClientConnectorError}
+
+_client: Optional[Client] = None
+
+
+class TimeoutTwilioHttpClient(AsyncTwilioHttpClient):
+    """
+    Applies the client timeout to every request. The Twilio client passes
+    timeout=None down to aiohttp, which would otherwise disable the timeout of
+    the session as well.
+    """
+
+    async def request(self, *args, timeout: Optional[float] = None, **kwargs):
+        return await super().request(*args, timeout=timeout or self.timeout, **kwargs)
+
+
+def get_twilio_client() -> Client:
+    """
+    Returns the process-wide Twilio client. It uses a single pooled aiohttp session
+    (keep-alive, timeouts, retries with exponential backoff), so REST calls made with
+    the *_async methods never block the event loop relaying audio.
+
+    Must be called from within the running event loop.
+    """
+    global _client
+    if _client is None:
+        settings = get_settings()
+        http_client = TimeoutTwilioHttpClient(pool_connections=False, timeout=settings.TWILIO_HTTP_TIMEOUT_S)
+        session = ClientSession(
+            connector=TCPConnector(
+                limit=settings.TWILIO_HTTP_POOL_SIZE,
+                keepalive_timeout=settings.TWILIO_HTTP_KEEPALIVE_S,
+            ),
+            timeout=ClientTimeout(total=settings.TWILIO_HTTP_TIMEOUT_S),
+        )
+        http_client.session = RetryClient(
+            client_session=session,
+            retry_options=ExponentialRetry(
+                attempts=settings.TWILIO_HTTP_MAX_RETRIES + 1,
+                start_timeout=0.2,
+                max_timeout=5.0,
+                statuses=RETRY_STATUSES,
+                exceptions=RETRY_EXCEPTIONS,
+                retry_all_server_errors=False,
+            ),
+        )
+
+        _client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN, http_client=http_client)
+        if settings.TWILIO_API_BASE_URL:
+            _client.api.base_url = settings.TWILIO_API_BASE_URL
+            logger.warning(f"Twilio REST API calls are sent to {settings.TWILIO_API_BASE_URL}.")
+        logger.info("Async Twilio client initialized.")
+    return _client
+
+
+def is_valid_twilio_request(url: str, params: Dict[str, str], signature: Optional[str]) -> bool:
+    """
+    Checks the X-Twilio-Signature of a webhook, computed by Twilio with the auth
+    token over the URL it requested and the posted form parameters.
+    """
+    if not signature:
+        return False
+    return RequestValidator(get_settings().TWILIO_AUTH_TOKEN).validate(url, params, signature)
+
+
+async def close_twilio_client():
+    """
+    Closes the pooled HTTP session of the Twilio client.
+    """
+    global _client
+    if _client is not None:
+        await _client.http_client.close()
+        _client = None
@@ -0,0 +1,173 @@
+import base64
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, Tuple
+
+from app.helpers.audio_codec import dbfs_to_power, mean_power
+from app.helpers.audio_coalescer import ULAW_BYTES_PER_MS
+
+logger = logging.getLogger(__name__)
+
+
+class VoiceGateStats:
+    """
+    Process-wide counters of the voice gates of all calls, to weigh the upstream
+    audio saved against the threshold used.
+    """
+
+    def __init__(self, threshold_dbfs: float, hangover_ms: int):
+        self.threshold_dbfs = threshold_dbfs
+        self.hangover_ms = hangover_ms
+        self.frames_in = 0
+        self.frames_forwarded = 0
+        self.frames_suppressed = 0
+        self.bytes_suppressed = 0
+        self.speech_segments = 0
+
+    def summary(self) -> dict:
+        return {
+            "threshold_dbfs": self.threshold_dbfs,
+            "hangover_ms": self.hangover_ms,
+            "frames_in": self.frames_in,
+            "frames_forwarded": self.frames_forwarded,
+            "frames_suppressed": self.frames_suppressed,
+            "bytes_suppressed": self.bytes_suppressed,
+            "suppressed_ratio": self.frames_suppressed / self.frames_in if self.frames_in else 0.0,
+            "speech_segments": self.speech_segments,
+        }
+
+
+class VoiceGate:
+    """
+    Local energy-based voice activity detection in front of the upstream audio.
+
+    While the caller is silent, frames are held in a `pre_roll_ms` buffer and
+    dropped as they age out of it, instead of being sent to Azure. Once the mean
+    power of the frames stays above `threshold_dbfs` for `onset_ms`, the gate
+    opens: the pre-roll is sent first, so the start of the speech is not clipped,
+    then every frame is forwarded. The gate closes after `hangover_ms` of silence;
+    this must exceed the silence duration of Azure's server_vad so it still sees
+    the end of the turn. With `keepalive_ms` set, one silent frame is sent every
+    `keepalive_ms` while the gate is closed, instead of none.
+
+    With `enabled` False every frame is forwarded as-is.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str], Awaitable[None]],
+        stats: VoiceGateStats,
+        enabled: bool = False,
+        threshold_dbfs: float = -45.0,
+        onset_ms: int = 40,
+        pre_roll_ms: int = 300,
+        hangover_ms: int = 1000,
+        keepalive_ms: int = 0,
+        on_speech_start: Optional[Callable[[], Awaitable[None]]] = None,
+        on_speech_stop: Optional[Callable[[], Awaitable[None]]] = None,
+    ):
+        self.send = send
+        self.stats = stats
+        self.enabled = enabled
+        self.threshold = dbfs_to_power(threshold_dbfs)
+        self.onset_ms = onset_ms
+        self.pre_roll_ms = pre_roll_ms
+        self.hangover_ms = hangover_ms
+        self.keepalive_ms = keepalive_ms
+        self.on_speech_start = on_speech_start
+        self.on_speech_stop = on_speech_stop
+
+        self.speaking = False
+        # (payload, size in bytes) of the latest silent frames
+        self._pre_roll: Deque[Tuple[str, int]] = deque()
+        self._pre_roll_bytes = 0
+        self._voiced_ms = 0
+        self._silent_ms = 0
+        self._since_keepalive_ms = 0
+
+        self.frames_forwarded = 0
+        self.frames_suppressed = 0
+        self.speech_segments = 0
+
+    async def add(self, payload: str):
+        """
+        Adds one base64 encoded g711_ulaw frame, forwarding it unless it is silence.
+        """
+        self.stats.frames_in += 1
+        if not self.enabled:
+            await self.send(payload)
+            return
+
+        audio = base64.b64decode(payload)
+        duration_ms = len(audio) // ULAW_BYTES_PER_MS
+        voiced = mean_power(audio) >= self.threshold
+
+        if self.speaking:
+            await self._forward(payload)
+            self._silent_ms = 0 if voiced else self._silent_ms + duration_ms
+            if self._silent_ms >= self.hangover_ms:
+                await self._close()
+            return
+
+        self._voiced_ms = self._voiced_ms + duration_ms if voiced else 0
+        self._pre_roll.append((payload, len(audio)))
+        self._pre_roll_bytes += len(audio)
+        if self._voiced_ms >= self.onset_ms:
+            await self._open()
+            return
+
+        if self.keepalive_ms:
+            self._since_keepalive_ms += duration_ms
+            if self._since_keepalive_ms >= self.keepalive_ms:
+                # The keepalive frame is the newest, so older ones can no longer be sent in order
+                self._since_keepalive_ms = 0
+                self._pre_roll.pop()
+                self._drop_pre_roll(0)
+                await self._forward(payload)
+                return
+
+        self._drop_pre_roll(self.pre_roll_ms * ULAW_BYTES_PER_MS)
+
+    def close(self):
+        """
+        Drops the pre-roll still held and logs the call's figures.
+        """
+        self._drop_pre_roll(0)
+        if self.enabled:
+            logger.info(
+                f"Voice gate: forwarded {self.frames_forwarded}, suppressed {self.frames_suppressed} frames, "
+                f"{self.speech_segments} speech segments."
+            )
+
+    async def _forward(self, payload: str):
+        await self.send(payload)
+        self.frames_forwarded += 1
+        self.stats.frames_forwarded += 1
+
+    def _drop_pre_roll(self, keep_bytes: int):
+        while self._pre_roll and self._pre_roll_bytes > keep_bytes:
+            _, size = self._pre_roll.popleft()
+            self._pre_roll_bytes -= size
+            self.frames_suppressed += 1
+            self.stats.frames_suppressed += 1
+            self.stats.bytes_suppressed += size
+
+    async def _open(self):
+        self.speaking = True
+        self._silent_ms = 0
+        self.speech_segments += 1
+        self.stats.speech_segments += 1
+        logger.debug(f"Local VAD: speech started, sending {self._pre_roll_bytes // ULAW_BYTES_PER_MS}ms of pre-roll.")
+        pre_roll, self._pre_roll, self._pre_roll_bytes = self._pre_roll, deque(), 0
+        for payload, _ in pre_roll:
+            await self._forward(payload)
+        if self.on_speech_start is not None:
+            await self.on_speech_start()
+
+    async def _close(self):
+        self.speaking = False
+        self._voiced_ms = 0
+        self._since_keepalive_ms = 0
+        logger.debug("Local VAD: speech stopped.")
+        if self.on_speech_stop is not None:
+            await self.on_speech_stop()
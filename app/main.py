@@ -1,16 +1,22 @@
 import logging
 from fastapi import FastAPI
-from fastapi.responses import JSONResponse
-from app.routes import call, media_stream, chat 
+from fastapi.responses import JSONResponse, Response
+from app.routes import call, media_stream, chat, campaign
+from app.helpers.call_state import get_call_state_store
+from app.helpers.call_log import get_call_log
+from app.helpers.campaign import get_campaign_dialer
+from app.helpers.twilio_client import close_twilio_client
+from app.helpers.http_client import close_http_session
+from app.helpers.chat_cache import close_chat_cache
+from app.helpers.session_profiles import get_session_profiles
+from app.helpers.config import get_settings
+from app.helpers.log_config import configure_logging
+from app.helpers.metrics import register_stats, render_metrics
+from app.helpers import log_config
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    handlers=[
-        logging.StreamHandler()
-    ]
-)
+# Configure logging once for every module, see app.helpers.log_config
+configure_logging(get_settings())
+register_stats("agent_logging", log_config.stats, counters=("dropped",))
 logger = logging.getLogger("Dentinnova Agent")
 
 app = FastAPI()
@@ -19,6 +25,35 @@ app = FastAPI()
 app.include_router(call.router)
 app.include_router(media_stream.router)
 app.include_router(chat.router)
+app.include_router(campaign.router)
+
+@app.on_event("startup")
+async def startup() -> None:
+    """
+    Builds the session profiles, starts the call log writer, pre-connects the
+    Azure realtime session pool, renders the greetings and starts the campaign dialer.
+    """
+    await get_session_profiles().start()
+    await get_call_log().start()
+    await media_stream.session_pool.start()
+    await media_stream.greeting_cache.start()
+    await get_campaign_dialer().start()
+
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    """
+    Stops the campaign dialer, closes the idle Azure realtime sessions, writes
+    the pending call log records and closes the call state store and the HTTP sessions.
+    """
+    await get_campaign_dialer().stop()
+    await media_stream.greeting_cache.stop()
+    await media_stream.session_pool.stop()
+    await get_call_log().stop()
+    await get_session_profiles().stop()
+    await get_call_state_store().close()
+    await close_twilio_client()
+    await close_http_session()
+    await close_chat_cache()
 
 @app.get("/", response_class=JSONResponse)
 async def index_page() -> JSONResponse:
@@ -30,3 +65,12 @@ async def index_page() -> JSONResponse:
     """
     logger.info("Root endpoint '/' accessed.")
     return JSONResponse({"message": "Dentinnova calls agent is running!"}, status_code=200)
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    """
+    Prometheus scrape endpoint: per-call latency histograms, relayed frames,
+    interruptions and the Azure session pool and audio coalescing counters.
+    """
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
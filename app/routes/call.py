@@ -1,25 +1,28 @@
-from fastapi import APIRouter, Request, HTTPException, Depends, status
+from fastapi import APIRouter, Request, HTTPException, Depends, Query, status
 from fastapi.responses import JSONResponse, HTMLResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from twilio.twiml.voice_response import VoiceResponse, Connect
-from twilio.rest import Client
+from twilio.twiml.voice_response import VoiceResponse, Connect, Gather
 from  app.helpers.config import get_settings
+from app.helpers.call_state import get_call_state_store
+from app.helpers.call_log import get_call_log
+from app.helpers.admission import get_admission_controller
+from app.helpers.twilio_client import get_twilio_client, is_valid_twilio_request
 import logging
 from typing import Optional
+from urllib.parse import parse_qs, urlencode
 import secrets
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    handlers=[logging.StreamHandler()]
-)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 security = HTTPBasic()
 app_settings = get_settings()
 
+OVERFLOW_HOLD_MESSAGE = "Thank you for calling Dentinnova. All our lines are busy right now, please stay on the line."
+OVERFLOW_CALLBACK_MESSAGE = "All our lines are still busy. Press 1 and we will call you back as soon as possible."
+OVERFLOW_GOODBYE_MESSAGE = "Thank you for calling Dentinnova. Please try again later. Goodbye."
+CALLBACK_CONFIRMED_MESSAGE = "Thank you, we will call you back shortly. Goodbye."
+
 def authenticate(credentials: HTTPBasicCredentials = Depends(security)):
     """
     Validates Basic Auth credentials.
@@ -40,39 +43,43 @@ async def initiate_call(request: Request, username: str = Depends(authenticate))
     """
     Initiates a call to the specified phone number using Twilio.
     
-    Expects a JSON payload with the 'to_phone' field.
+    Expects a JSON payload with the 'to_phone' field and an optional session 'profile'.
     Requires Basic Authentication.
     """
     try:
-        TWILIO_ACCOUNT_SID = app_settings.TWILIO_ACCOUNT_SID
-        TWILIO_AUTH_TOKEN = app_settings.TWILIO_AUTH_TOKEN
         TWILIO_PHONE_NUMBER = app_settings.TWILIO_PHONE_NUMBER
 
-        twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-        logger.info("Twilio Client initialized.")
+        twilio_client = get_twilio_client()
         data = await request.json()
         to_phone: Optional[str] = data.get('to_phone')
+        profile: Optional[str] = data.get('profile')
 
         if not to_phone:
             logger.warning("Missing 'to_phone' in request data.")
             raise HTTPException(status_code=400, detail="Phone number ('to_phone') is required.")
 
+        if await get_admission_controller().available() == 0:
+            raise HTTPException(status_code=503, detail="No capacity for another call right now, try again later.")
+
         host = request.url.hostname
         if not host:
             logger.error("Unable to determine the host from the request URL.")
             raise HTTPException(status_code=500, detail="Invalid host in request URL.")
 
         callback_url = f'https://{host}/incoming-call'
+        if profile:
+            callback_url += '?' + urlencode({"profile": profile})
         logger.info(f"Callback URL constructed: {callback_url}")
         logger.info(f"Authenticated user '{username}' is initiating a call from {TWILIO_PHONE_NUMBER} to {to_phone}.")
 
-        call = twilio_client.calls.create(
+        call = await twilio_client.calls.create_async(
             to=to_phone,
             from_=TWILIO_PHONE_NUMBER,
             url=callback_url
         )
 
         logger.info(f"Call initiated successfully. Call SID: {call.sid}")
+        await get_call_state_store().update(call.sid, status="initiated", to_phone=to_phone, from_phone=TWILIO_PHONE_NUMBER)
         return JSONResponse({"message": "Call initiated", "call_sid": call.sid}, status_code=200)
 
     except HTTPException as http_exc:
@@ -82,13 +89,78 @@ async def initiate_call(request: Request, username: str = Depends(authenticate))
         logger.error(f"Error initiating call: {e}", exc_info=True)
         return JSONResponse({"error": str(e)}, status_code=500)
 
+async def read_signed_twilio_params(request: Request) -> dict:
+    """
+    Reads the parameters of a Twilio webhook, rejecting it with 403 unless it
+    carries a valid X-Twilio-Signature. Twilio signs the URL it requested, built
+    from PUBLIC_BASE_URL (or https://{host}) like the URLs handed to it, and the
+    form parameters of a POST. The parameters come in the form body on POST and
+    in the query string on GET.
+    """
+    form = {key: values[0] for key, values in parse_qs((await request.body()).decode("utf-8")).items()}
+    url = f"{app_settings.PUBLIC_BASE_URL or f'https://{request.url.hostname}'}{request.url.path}"
+    if request.url.query:
+        url += f"?{request.url.query}"
+    if not is_valid_twilio_request(url, form, request.headers.get("X-Twilio-Signature")):
+        logger.warning(f"Rejected a request to {request.url.path} with an invalid Twilio signature.")
+        raise HTTPException(status_code=403, detail="Invalid Twilio signature.")
+    return {**form, **request.query_params}
+
+def call_query(params: dict) -> dict:
+    """
+    Query parameters that follow a call through the redirects of the overflow flow.
+    """
+    query = {"overflow_attempt": int(params.get("overflow_attempt") or 0)}
+    if params.get("profile"):
+        query["profile"] = params["profile"]
+    return query
+
+def overflow_response(params: dict) -> VoiceResponse:
+    """
+    TwiML for a call that cannot be taken now: hold music and another try
+    ("queue"), an offer to be called back ("callback"), or an apology ("reject").
+    After ADMISSION_QUEUE_MAX_ATTEMPTS tries in the queue, the callback is offered.
+    """
+    response = VoiceResponse()
+    mode = app_settings.ADMISSION_OVERFLOW_MODE
+    attempt = int(params.get("overflow_attempt") or 0)
+
+    if mode == "queue" and attempt < app_settings.ADMISSION_QUEUE_MAX_ATTEMPTS:
+        if attempt == 0:
+            response.say(OVERFLOW_HOLD_MESSAGE)
+        response.play(app_settings.ADMISSION_HOLD_MUSIC_URL)
+        query = {**call_query(params), "overflow_attempt": attempt + 1}
+        response.redirect(f"/incoming-call?{urlencode(query)}", method="POST")
+    elif mode in ("queue", "callback"):
+        gather = Gather(num_digits=1, action="/incoming-call/callback", method="POST", timeout=8)
+        gather.say(OVERFLOW_CALLBACK_MESSAGE)
+        response.append(gather)
+        response.say(OVERFLOW_GOODBYE_MESSAGE)
+        response.hangup()
+    else:
+        response.say(OVERFLOW_GOODBYE_MESSAGE)
+        response.hangup()
+    return response
+
 @router.api_route("/incoming-call", methods=["GET", "POST"], response_class=HTMLResponse)
 async def handle_incoming_call(request: Request) -> HTMLResponse:
     """
     Handles incoming Twilio calls by responding with TwiML instructions.
-    Streams the call to the specified WebSocket endpoint.
+    Streams the call to the specified WebSocket endpoint, or answers with the
+    overflow TwiML when admission control turns the call away.
+    Requires a valid X-Twilio-Signature.
     """
     try:
+        params = await read_signed_twilio_params(request)
+        call_sid = params.get("CallSid")
+        rejected = await get_admission_controller().admit(call_sid)
+        if call_sid:
+            await get_call_state_store().update(
+                call_sid, status="overflow" if rejected else "ringing", to_phone=params.get("To"), from_phone=params.get("From")
+            )
+        if rejected:
+            return HTMLResponse(content=str(overflow_response(params)), media_type="application/xml")
+
         response = VoiceResponse()
         response.pause(length=1)  # Adds a 1-second pause before connecting
 
@@ -100,8 +172,14 @@ async def handle_incoming_call(request: Request) -> HTMLResponse:
         stream_url = f'wss://{host}/media-stream'
         logger.info(f"Streaming call to WebSocket URL: {stream_url}")
 
-        connect = Connect()
-        connect.stream(url=stream_url)
+        # Twilio asks what to do next when the stream ends, e.g. when a full worker refuses it;
+        # the overflow attempts so far are carried along, so a refused stream does not restart the count
+        connect = Connect(action=f"/incoming-call/stream-ended?{urlencode(call_query(params))}", method="POST")
+        stream = connect.stream(url=stream_url)
+        # Session profile of the call, handed to /media-stream in the start event
+        profile = params.get("profile")
+        if profile:
+            stream.parameter(name="profile", value=profile)
         response.append(connect)
 
         logger.info("Incoming call response constructed successfully.")
@@ -112,4 +190,118 @@ async def handle_incoming_call(request: Request) -> HTMLResponse:
         raise http_exc
     except Exception as e:
         logger.error(f"Error handling incoming call: {e}", exc_info=True)
-        return JSONResponse({"error": str(e)}, status_code=500)
\ No newline at end of file
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@router.post("/incoming-call/stream-ended", response_class=HTMLResponse)
+async def handle_stream_ended(request: Request) -> HTMLResponse:
+    """
+    Ends the call once its media stream is over, unless the stream was refused
+    for lack of capacity, in which case the overflow TwiML is played.
+    Requires a valid X-Twilio-Signature.
+    """
+    params = await read_signed_twilio_params(request)
+    call_sid = params.get("CallSid")
+    record = None
+    if call_sid:
+        # Frees the slot reserved by /incoming-call, whether or not the stream ever started
+        await get_admission_controller().release(call_sid)
+        record = await get_call_state_store().get(call_sid)
+    if record is not None and record.status == "overflow":
+        return HTMLResponse(content=str(overflow_response(params)), media_type="application/xml")
+    response = VoiceResponse()
+    response.hangup()
+    return HTMLResponse(content=str(response), media_type="application/xml")
+
+@router.post("/incoming-call/callback", response_class=HTMLResponse)
+async def handle_callback_request(request: Request) -> HTMLResponse:
+    """
+    Records a callback request made from the overflow menu as a call outcome.
+    Requires a valid X-Twilio-Signature.
+    """
+    params = await read_signed_twilio_params(request)
+    call_sid = params.get("CallSid")
+    if not call_sid:
+        raise HTTPException(status_code=400, detail="CallSid is required.")
+    response = VoiceResponse()
+    if params.get("Digits") == "1":
+        get_call_log().add_outcome(call_sid, {
+            "customer_name": None,
+            "is_Intrested": None,
+            "Comments": "Callback requested, all lines were busy.",
+            "ContactNumber": params.get("From"),
+        })
+        logger.info(f"Callback requested by {params.get('From')} (call {call_sid}).")
+        response.say(CALLBACK_CONFIRMED_MESSAGE)
+    else:
+        response.say(OVERFLOW_GOODBYE_MESSAGE)
+    response.hangup()
+    await get_call_state_store().remove(call_sid)
+    return HTMLResponse(content=str(response), media_type="application/xml")
+
+@router.get("/admission-stats", response_class=JSONResponse)
+async def get_admission_stats(username: str = Depends(authenticate)) -> JSONResponse:
+    """
+    Returns the admission limits, the calls admitted and the calls turned away by limit.
+    Requires Basic Authentication.
+    """
+    admission = get_admission_controller()
+    return JSONResponse({**admission.stats(), "available": await admission.available()}, status_code=200)
+
+@router.get("/calls", response_class=JSONResponse)
+async def list_active_calls(username: str = Depends(authenticate)) -> JSONResponse:
+    """
+    Lists the active calls across all workers and nodes.
+    Requires Basic Authentication.
+    """
+    records = await get_call_state_store().list_active()
+    return JSONResponse({"calls": [record.model_dump() for record in records]}, status_code=200)
+
+@router.get("/calls/{call_sid}", response_class=JSONResponse)
+async def get_call(call_sid: str, username: str = Depends(authenticate)) -> JSONResponse:
+    """
+    Returns the state of a single call.
+    Requires Basic Authentication.
+    """
+    record = await get_call_state_store().get(call_sid)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Call not found.")
+    return JSONResponse(record.model_dump(), status_code=200)
+
+@router.get("/calls/{call_sid}/transcript", response_class=JSONResponse)
+async def get_call_transcript(call_sid: str, username: str = Depends(authenticate)) -> JSONResponse:
+    """
+    Returns the persisted transcript segments of a call.
+    Requires Basic Authentication.
+    """
+    segments = await get_call_log().transcript(call_sid)
+    if not segments:
+        raise HTTPException(status_code=404, detail="No transcript for this call.")
+    return JSONResponse({"call_sid": call_sid, "segments": segments}, status_code=200)
+
+@router.get("/call-outcomes", response_class=JSONResponse)
+async def list_call_outcomes(
+    interested: Optional[bool] = None,
+    since: Optional[float] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    username: str = Depends(authenticate),
+) -> JSONResponse:
+    """
+    Lists the recorded call outcomes, newest first.
+    Requires Basic Authentication.
+    """
+    outcomes = await get_call_log().outcomes(since=since, interested=interested, limit=limit)
+    return JSONResponse({"outcomes": outcomes}, status_code=200)
+
+@router.post("/calls/{call_sid}/hangup", response_class=JSONResponse)
+async def hangup_call(call_sid: str, username: str = Depends(authenticate)) -> JSONResponse:
+    """
+    Asks the worker holding the call's media stream to end the call.
+    Requires Basic Authentication.
+    """
+    store = get_call_state_store()
+    record = await store.get(call_sid)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Call not found.")
+    await store.send_command(call_sid, "hangup")
+    logger.info(f"User '{username}' requested hangup of call {call_sid} on worker {record.worker}.")
+    return JSONResponse({"message": "Hangup requested", "call_sid": call_sid}, status_code=202)
@@ -0,0 +1,151 @@
+from fastapi import APIRouter, Request, HTTPException, Depends
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.helpers.config import get_settings
+from app.helpers.campaign import get_campaign_dialer, FINAL_STATUSES
+from app.helpers.call_state import get_call_state_store
+from app.routes.call import authenticate, read_signed_twilio_params
+from typing import AsyncIterator, Optional
+import codecs
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+app_settings = get_settings()
+
+BATCH_SIZE = 1000
+PHONE_PATTERN = re.compile(r"^\+?\d{6,15}$")
+
+def normalize_number(value: str) -> Optional[str]:
+    """
+    Cleans up a phone number taken from a request, returning None if it is not a valid number.
+    """
+    number = re.sub(r"[\s\-().\"']", "", value)
+    return number if PHONE_PATTERN.match(number) else None
+
+async def iter_csv_numbers(request: Request) -> AsyncIterator[str]:
+    """
+    Yields the first column of every line of a CSV body as it streams in. Decoded
+    incrementally, since a chunk can end in the middle of a multi-byte character.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    async for chunk in request.stream():
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.split(",", 1)[0]
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.split(",", 1)[0]
+
+@router.post("/campaigns", response_class=JSONResponse)
+async def create_campaign(request: Request, username: str = Depends(authenticate)) -> JSONResponse:
+    """
+    Creates an outbound campaign from a batch of phone numbers.
+
+    Accepts either a JSON body `{"name": "...", "numbers": ["+1...", ...]}` or a CSV
+    body (Content-Type: text/csv) with the number in the first column, which is
+    read as it streams in. The name of a CSV campaign can be passed as ?name=.
+    Requires Basic Authentication. A campaign whose numbers fail to upload is cancelled.
+    """
+    campaign_id = None
+    try:
+        dialer = get_campaign_dialer()
+        base_url = app_settings.PUBLIC_BASE_URL or f"https://{request.url.hostname}"
+        content_type = request.headers.get("content-type", "")
+
+        if content_type.startswith("application/json"):
+            data = await request.json()
+            name = data.get("name")
+            raw_numbers = data.get("numbers") or []
+            if not isinstance(raw_numbers, list):
+                raise HTTPException(status_code=400, detail="Field 'numbers' must be a list.")
+
+            async def numbers_source():
+                for number in raw_numbers:
+                    yield str(number)
+        elif content_type.startswith("text/csv") or content_type.startswith("text/plain"):
+            name = request.query_params.get("name")
+            numbers_source = lambda: iter_csv_numbers(request)
+        else:
+            raise HTTPException(status_code=415, detail="Send the numbers as application/json or text/csv.")
+
+        campaign_id = await dialer.create_campaign(name, base_url)
+        total, rejected, batch = 0, 0, []
+        async for value in numbers_source():
+            number = normalize_number(value)
+            if number is None:
+                rejected += 1
+                continue
+            batch.append(number)
+            if len(batch) >= BATCH_SIZE:
+                total += await dialer.add_numbers(campaign_id, batch)
+                batch = []
+        if batch:
+            total += await dialer.add_numbers(campaign_id, batch)
+
+        if total == 0:
+            await dialer.set_campaign_status(campaign_id, "cancelled")
+            raise HTTPException(status_code=400, detail="No valid phone numbers in the request.")
+
+        logger.info(f"User '{username}' created campaign {campaign_id} with {total} numbers ({rejected} rejected).")
+        return JSONResponse({"campaign_id": campaign_id, "total": total, "rejected": rejected}, status_code=201)
+
+    except HTTPException as http_exc:
+        logger.warning(f"HTTP exception occurred: {http_exc.detail}")
+        raise http_exc
+    except Exception as e:
+        logger.error(f"Error creating campaign: {e}", exc_info=True)
+        if campaign_id is not None:
+            # Numbers already added would otherwise be dialed for a campaign the client never got back
+            await dialer.set_campaign_status(campaign_id, "cancelled")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@router.post("/campaigns/status", response_class=PlainTextResponse)
+async def handle_call_status(request: Request) -> PlainTextResponse:
+    """
+    Receives Twilio status callbacks for campaign calls.
+    Requires a valid X-Twilio-Signature.
+    """
+    params = await read_signed_twilio_params(request)
+    call_sid = params.get("CallSid")
+    call_status = params.get("CallStatus")
+    # Set in the StatusCallback URL by the dialer
+    row_id, attempt = params.get("row"), params.get("attempt")
+    if call_sid and call_status:
+        await get_campaign_dialer().handle_status(
+            call_sid,
+            call_status,
+            int(row_id) if row_id and row_id.isdigit() else None,
+            int(attempt) if attempt and attempt.isdigit() else None,
+        )
+        if call_status in FINAL_STATUSES:
+            await get_call_state_store().remove(call_sid)
+    return PlainTextResponse("", status_code=204)
+
+@router.get("/campaigns/{campaign_id}", response_class=JSONResponse)
+async def get_campaign_progress(campaign_id: str, username: str = Depends(authenticate)) -> JSONResponse:
+    """
+    Returns the progress, throughput and ETA of a campaign.
+    Requires Basic Authentication.
+    """
+    progress = await get_campaign_dialer().progress(campaign_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Campaign not found.")
+    return JSONResponse(progress, status_code=200)
+
+@router.post("/campaigns/{campaign_id}/{action}", response_class=JSONResponse)
+async def control_campaign(campaign_id: str, action: str, username: str = Depends(authenticate)) -> JSONResponse:
+    """
+    Pauses, resumes or cancels a campaign. Calls already in progress are not affected.
+    Requires Basic Authentication.
+    """
+    statuses = {"pause": "paused", "resume": "running", "cancel": "cancelled"}
+    if action not in statuses:
+        raise HTTPException(status_code=404, detail="Unknown campaign action.")
+    if not await get_campaign_dialer().set_campaign_status(campaign_id, statuses[action]):
+        raise HTTPException(status_code=404, detail="Campaign not found.")
+    logger.info(f"User '{username}' set campaign {campaign_id} to '{statuses[action]}'.")
+    return JSONResponse({"campaign_id": campaign_id, "status": statuses[action]}, status_code=200)
@@ -1,20 +1,15 @@
 from fastapi import FastAPI, HTTPException, Depends, status, APIRouter
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from pydantic import BaseModel
-import requests
-from typing import List
+from typing import AsyncIterator, List, Optional
 from  app.helpers.config import get_settings
+from app.helpers.http_client import get_http_session
+from app.helpers.chat_cache import get_chat_cache, make_key
+from app.helpers.metrics import register_stats
+from app.helpers import codec
 import secrets
 import logging
-import asyncio
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    handlers=[logging.StreamHandler()]
-)
 
 # Load environment variables
 logger = logging.getLogger(__name__)
@@ -22,6 +17,8 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 app_settings = get_settings()
 
+register_stats("agent_chat_cache", lambda: get_chat_cache().stats(), counters=("hits", "misses", "stores"))
+
 # Basic Authentication setup
 security = HTTPBasic()
 
@@ -45,32 +42,95 @@ def authenticate(credentials: HTTPBasicCredentials = Depends(security)):
 class ChatRequest(BaseModel):
     last_message: str  # The latest user message,
     masseges_history: str  # The last message from the bot
+    stream: bool = False  # Stream the completion back as server-sent events
 
-    
+CHAT_COMPLETIONS_URL = f"https://{app_settings.AZURE_OPENAI_ENDPOINT}/openai/deployments/{app_settings.AZURE_OPENAI_CHAT_DEPLOYMENT_NAME}/chat/completions?api-version=2024-08-01-preview"
+CHAT_HEADERS = {
+    "Content-Type": "application/json",
+    "api-key": app_settings.AZURE_OPENAI_API_KEY,
+}
 
-def send_request_to_openai(payload: dict) -> dict:
+async def send_request_to_openai(payload: dict) -> dict:
+    """
+    Sends a request to Azure OpenAI over the shared, pooled HTTP session.
+    """
+    async with get_http_session().post(CHAT_COMPLETIONS_URL, data=codec.dumps(payload), headers=CHAT_HEADERS) as response:
+        body = await response.text()
+        if response.status != 200:
+            logger.error(f"Azure OpenAI API error: {body}")
+            raise HTTPException(status_code=response.status, detail=body)
+        return codec.loads(body)
+
+async def stream_openai_completion(payload: dict) -> AsyncIterator[str]:
     """
-    Sends a request to Azure OpenAI using the requests library.
-    This function runs in a separate thread to avoid blocking the event loop.
+    Sends a streaming request to Azure OpenAI and yields the completion text as it arrives.
     """
-    url = f"https://{app_settings.AZURE_OPENAI_ENDPOINT}/openai/deployments/{app_settings.AZURE_OPENAI_CHAT_DEPLOYMENT_NAME}/chat/completions?api-version=2024-08-01-preview"
-    headers = {
-        "Content-Type": "application/json",
-            "api-key": app_settings.AZURE_OPENAI_API_KEY,
-    }
+    async with get_http_session().post(CHAT_COMPLETIONS_URL, data=codec.dumps({**payload, "stream": True}), headers=CHAT_HEADERS) as response:
+        if response.status != 200:
+            body = await response.text()
+            logger.error(f"Azure OpenAI API error: {body}")
+            raise HTTPException(status_code=response.status, detail=body)
+
+        async for line in response.content:
+            line = line.strip()
+            if not line.startswith(b"data:"):
+                continue
+            data = line[len(b"data:"):].strip()
+            if data == b"[DONE]":
+                return
+            chunk = codec.loads(data)
+            for choice in chunk.get("choices") or []:
+                content = (choice.get("delta") or {}).get("content")
+                if content:
+                    yield content
+
+def format_sse(data: dict, event: Optional[str] = None) -> str:
+    """
+    Formats one server-sent event.
+    """
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {codec.dumps(data)}\n\n"
 
-    response = requests.post(url, json=payload, headers=headers)
+async def sse_completion(payload: dict, cache_key: str) -> AsyncIterator[str]:
+    """
+    Relays the streamed completion to the client as server-sent events and caches
+    the full response once the stream completes.
+    Errors after the stream has started are sent as an `error` event.
+    """
+    try:
+        parts = []
+        async for content in stream_openai_completion(payload):
+            parts.append(content)
+            yield format_sse({"delta": content})
+        yield "data: [DONE]\n\n"
+        if parts:
+            await get_chat_cache().set(cache_key, "".join(parts))
+        logger.info("Azure OpenAI streamed response completed successfully.")
+    except HTTPException as http_exc:
+        yield format_sse({"error": http_exc.detail, "status_code": http_exc.status_code}, event="error")
+    except Exception as e:
+        logger.error(f"Error streaming completion: {e}", exc_info=True)
+        yield format_sse({"error": str(e)}, event="error")
 
-    if response.status_code != 200:
-        logger.error(f"Azure OpenAI API error: {response.text}")
-        raise HTTPException(status_code=response.status_code, detail=response.text)
+async def sse_cached(output: str) -> AsyncIterator[str]:
+    """
+    Sends a cached response as a single server-sent event.
+    """
+    yield format_sse({"delta": output})
+    yield "data: [DONE]\n\n"
 
-    return response.json()
+@router.get("/chat/cache-stats", response_class=JSONResponse)
+async def get_chat_cache_stats(username: str = Depends(authenticate)) -> JSONResponse:
+    """
+    Returns the /chat response cache hit/miss/eviction counters.
+    """
+    return JSONResponse(get_chat_cache().stats(), status_code=200)
 
 @router.post("/chat", response_class=JSONResponse)
 async def chat_with_gpt(request: ChatRequest, username: str = Depends(authenticate)) -> JSONResponse:
     """
-    Handles chat requests to Azure OpenAI and returns the response.
+    Handles chat requests to Azure OpenAI and returns the response, or streams it
+    as server-sent events when `stream` is true.
     Requires Basic Authentication.
     """
     try:
@@ -88,12 +148,28 @@ async def chat_with_gpt(request: ChatRequest, username: str = Depends(authentica
             "messages": [{"role": "user", "content": prompt}],
             "max_tokens": 500,
         }
-        logger.info(f"User '{username}' is sending a request to Azure OpenAI.")
 
-        # Run the request in a separate thread to avoid blocking FastAPI's async execution
-        response_data = await asyncio.to_thread(send_request_to_openai, payload)
-        output = response_data["choices"][0]["message"]["content"]
-        logger.info("Azure OpenAI response received successfully.")
+        # Repeated questions are answered from the cache without a completion call
+        cache = get_chat_cache()
+        cache_key = make_key(prompt, request.masseges_history, app_settings.AZURE_OPENAI_CHAT_DEPLOYMENT_NAME)
+        output = await cache.get(cache_key)
+        if output is not None:
+            logger.info(f"Answering user '{username}' from the chat response cache.")
+        else:
+            logger.info(f"User '{username}' is sending a request to Azure OpenAI.")
+
+        if request.stream:
+            return StreamingResponse(
+                sse_cached(output) if output is not None else sse_completion(payload, cache_key),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
+        if output is None:
+            response_data = await send_request_to_openai(payload)
+            output = response_data["choices"][0]["message"]["content"]
+            await cache.set(cache_key, output)
+            logger.info("Azure OpenAI response received successfully.")
         return JSONResponse(content=output, status_code=200)
 
     except HTTPException as http_exc:
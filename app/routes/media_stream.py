@@ -1,29 +1,36 @@
-import json
 import base64
 import asyncio
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
 from fastapi.websockets import WebSocketState  
+from fastapi.responses import JSONResponse
 import websockets
-import os
 import logging
-from typing import Optional
+from typing import AsyncIterator, Optional, Tuple
 from  app.helpers.config import get_settings
+from app.helpers.azure_pool import AzureSessionPool
+from app.helpers.azure_reconnect import AudioRingBuffer, AzureReconnector, ConversationHistory, ReconnectStats
+from app.helpers.audio_relay import RESPONSE_CREATE_MESSAGE, render_azure_append, render_twilio_media, extract_twilio_media, extract_azure_audio_delta, is_valid_payload
+from app.helpers.audio_coalescer import AudioCoalescer, CoalescerStats
+from app.helpers.audio_codec import AudioTranscoder
+from app.helpers.voice_gate import VoiceGate, VoiceGateStats
+from app.helpers.greeting_cache import Greeting, GreetingCache
+from app.helpers.relay_writer import SocketWriter
+from app.helpers.task_group import SessionTaskGroup
+from app.helpers.playback_tracker import PlaybackTracker
+from app.helpers.playout import PlayoutScheduler, PlayoutStats
+from app.helpers.call_recorder import CallRecorder
+from app.helpers.call_state import get_call_state_store, WORKER_ID
+from app.helpers.call_log import get_call_log
+from app.helpers.admission import get_admission_controller
+from app.helpers.tool_dispatcher import ToolContext, ToolDispatcher, get_tool_registry
+from app.helpers.session_profiles import get_session_profiles
+from app.helpers.log_config import bind_call_context
+from app.helpers.metrics import CallMetrics, observe_azure_checkout, register_stats
+from app.helpers import codec
+from app.routes.call import authenticate
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    handlers=[
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
-# Load configuration paths
-BASE_DIR = os.path.dirname(__file__)
-SESSION_FILE_PATH = os.path.join(BASE_DIR, "..", "config", "gpt_audio_session_template.json")
-INSTRUCTION_FILE_PATH  = os.path.join(BASE_DIR, "..", "config", "system_instructions.txt")
-
 # Constants
 LOG_EVENT_TYPES = [
     'error', 'response.content.done', 'rate_limits.updated',
@@ -31,109 +38,568 @@ LOG_EVENT_TYPES = [
     'input_audio_buffer.speech_stopped', 'input_audio_buffer.speech_started',
     'session.created']
 
+# Azure events acted upon in send_to_twilio; anything else is skipped after a
+# cheap look at its type, without decoding the rest of the message.
+HANDLED_EVENT_TYPES = set(LOG_EVENT_TYPES) | {
+    'response.content_part.done', 'response.audio.delta', 'response.audio.done',
+    'conversation.item.input_audio_transcription.completed',
+    'response.function_call_arguments.done', 'response.created'}
+
 SHOW_TIMING_MATH = False
 app_settings = get_settings()
+session_profiles = get_session_profiles()
+
+# Messages sent on every call, serialized once
+END_CALL_MESSAGE = codec.dumps({
+    "type": "conversation.item.create",
+    "item": {
+        "type": "message",
+        "role": "user",
+        "content": [
+            {
+                "type": "input_text",
+                "text": "close the call now with the customer"
+            }
+        ]
+    }
+})
 
 router = APIRouter()
+
+def build_azure_ws_url(settings) -> str:
+    """
+    Builds the Azure OpenAI realtime WebSocket URL from the settings.
+    """
+    if settings.AZURE_OPENAI_REALTIME_URL:
+        return settings.AZURE_OPENAI_REALTIME_URL
+    return (
+        f"wss://{settings.AZURE_OPENAI_ENDPOINT}/openai/realtime"
+        f"?api-version={settings.AZURE_OPENAI_API_VERSION}"
+        f"&deployment={settings.AZURE_OPENAI_DEPLOYMENT_NAME}"
+        f"&api-key={settings.AZURE_OPENAI_API_KEY}"
+    )
+
+async def configure_session(azure_ws):
+    """
+    Sends the session configuration to a freshly opened Azure session.
+    Used by the session pool to prepare sessions ahead of incoming calls.
+    """
+    await initialize_session(azure_ws, create_response=False)
+
+session_pool = AzureSessionPool(
+    build_azure_ws_url(app_settings),
+    configure=configure_session,
+    size=app_settings.AZURE_POOL_SIZE,
+    max_age=app_settings.AZURE_POOL_MAX_AGE_S,
+    ping_interval=app_settings.AZURE_POOL_PING_INTERVAL_S,
+    ping_timeout=app_settings.AZURE_POOL_PING_TIMEOUT_S,
+    on_checkout=observe_azure_checkout,
+)
+
+# Secondary endpoint or deployment tried when reconnecting a call, opened on demand only
+fallback_pool = AzureSessionPool(
+    app_settings.AZURE_OPENAI_REALTIME_FALLBACK_URL,
+    configure=configure_session,
+    size=0,
+) if app_settings.AZURE_OPENAI_REALTIME_FALLBACK_URL else None
+
+reconnect_stats = ReconnectStats()
+
+greeting_cache = GreetingCache(
+    session_pool.connect,
+    session_profiles,
+    enabled=app_settings.GREETING_CACHE_ENABLED,
+    directory=app_settings.GREETING_CACHE_DIR,
+    render_timeout=app_settings.GREETING_RENDER_TIMEOUT_S,
+)
+
+upstream_audio_stats = CoalescerStats(
+    app_settings.AUDIO_COALESCE_WINDOW_MS,
+    app_settings.AUDIO_COALESCE_MAX_BYTES,
+    app_settings.AUDIO_COALESCE_MAX_LATENCY_MS,
+)
+
+playout_stats = PlayoutStats(app_settings.PLAYOUT_FRAME_MS, app_settings.PLAYOUT_LEAD_MS)
+
+voice_gate_stats = VoiceGateStats(app_settings.VAD_THRESHOLD_DBFS, app_settings.VAD_HANGOVER_MS)
+
+register_stats("agent_azure_pool", session_pool.stats, counters=("hits", "misses", "discarded", "connect_failures"))
+register_stats(
+    "agent_azure_reconnect", reconnect_stats.summary,
+    counters=("drops", "reconnects", "failures", "attempts", "frames_buffered", "frames_dropped"),
+)
+register_stats("agent_greeting_cache", greeting_cache.stats, counters=("hits", "misses", "renders", "render_failures"))
+register_stats(
+    "agent_playout", playout_stats.summary, counters=("frames_sent", "underruns", "clears", "cleared_ms"),
+)
+register_stats("agent_upstream_audio", upstream_audio_stats.summary, counters=("frames_in", "appends_out", "bytes_out"))
+register_stats(
+    "agent_voice_gate", voice_gate_stats.summary,
+    counters=("frames_in", "frames_forwarded", "frames_suppressed", "bytes_suppressed", "speech_segments"),
+)
+register_stats("agent_call_log", get_call_log().stats, counters=("written", "dropped", "failed"))
+
+@router.get("/media-stream/pool-stats", response_class=JSONResponse)
+async def get_pool_stats() -> JSONResponse:
+    """
+    Returns the Azure session pool hit/miss counters and checkout latency.
+    """
+    return JSONResponse(session_pool.stats(), status_code=200)
+
+@router.get("/media-stream/reconnect-stats", response_class=JSONResponse)
+async def get_reconnect_stats() -> JSONResponse:
+    """
+    Returns how often Azure sessions dropped mid-call and how long reconnecting took.
+    """
+    return JSONResponse(reconnect_stats.summary(), status_code=200)
+
+@router.get("/media-stream/greeting-stats", response_class=JSONResponse)
+async def get_greeting_stats() -> JSONResponse:
+    """
+    Returns the cached greetings and how many calls started with one.
+    """
+    return JSONResponse(greeting_cache.stats(), status_code=200)
+
+@router.get("/media-stream/playout-stats", response_class=JSONResponse)
+async def get_playout_stats() -> JSONResponse:
+    """
+    Returns the frames paced towards Twilio, underruns and the audio dropped locally on barge-in.
+    """
+    return JSONResponse(playout_stats.summary(), status_code=200)
+
+@router.get("/media-stream/coalescer-stats", response_class=JSONResponse)
+async def get_coalescer_stats() -> JSONResponse:
+    """
+    Returns how many upstream appends the coalescing window saves and the latency it adds.
+    """
+    return JSONResponse(upstream_audio_stats.summary(), status_code=200)
+
+@router.get("/media-stream/vad-stats", response_class=JSONResponse)
+async def get_vad_stats() -> JSONResponse:
+    """
+    Returns how many caller frames the local voice gate kept from Azure.
+    """
+    return JSONResponse(voice_gate_stats.summary(), status_code=200)
+
+@router.get("/media-stream/profiles", response_class=JSONResponse)
+async def get_profiles(username: str = Depends(authenticate)) -> JSONResponse:
+    """
+    Lists the loaded session profiles and their version.
+    Requires Basic Authentication.
+    """
+    return JSONResponse(session_profiles.stats(), status_code=200)
+
+@router.post("/media-stream/profiles/reload", response_class=JSONResponse)
+async def reload_profiles(username: str = Depends(authenticate)) -> JSONResponse:
+    """
+    Rebuilds the session profiles from the config files. Calls already in progress keep their session.
+    Requires Basic Authentication.
+    """
+    logger.info("User '%s' requested a reload of the session profiles.", username)
+    if not await session_profiles.reload():
+        return JSONResponse({"error": "Reload failed, previous profiles kept.", **session_profiles.stats()}, status_code=500)
+    return JSONResponse(session_profiles.stats(), status_code=200)
+
+async def refuse_media_stream(websocket: WebSocket):
+    """
+    Turns away a stream this worker has no room for. The call is flagged so that
+    /incoming-call/stream-ended plays the overflow TwiML instead of hanging up.
+    """
+    call_sid = None
+    try:
+        # One-off wait for the start event, which carries the call SID
+        while call_sid is None:
+            data = codec.loads(await asyncio.wait_for(websocket.receive_text(), timeout=5.0))
+            if data.get('event') == 'start':
+                call_sid = data['start'].get('callSid')
+                break
+    except Exception as e:
+        logger.warning(f"Refused stream ended before its start event: {e}")
+    if call_sid:
+        # The call goes back through admission from the overflow TwiML, so its reservation is not kept
+        await get_admission_controller().release(call_sid)
+        await get_call_state_store().update(call_sid, status="overflow")
+    logger.warning(f"Worker is full, refused the media stream of call {call_sid}.")
+    if websocket.application_state != WebSocketState.DISCONNECTED:
+        await websocket.close()
+
 @router.websocket("/media-stream")
 async def handle_media_stream(websocket: WebSocket):
     """
     Manages the WebSocket connection between Twilio and the GPT-powered service.
     Streams audio data to and from the GPT service.
     """
-    app_settings = get_settings()
     await websocket.accept()
+    log_context = bind_call_context()
     logger.info("Client connected to /media-stream.")
-   
-    azure_ws_url = (
-        f"wss://{app_settings.AZURE_OPENAI_ENDPOINT}/openai/realtime"
-        f"?api-version={app_settings.AZURE_OPENAI_API_VERSION}"
-        f"&deployment={app_settings.AZURE_OPENAI_DEPLOYMENT_NAME}"
-        f"&api-key={app_settings.AZURE_OPENAI_API_KEY}"
-    )
+
+    admission = get_admission_controller()
+    if not admission.enter_stream():
+        await refuse_media_stream(websocket)
+        return
 
     shutdown_event = asyncio.Event()  # Event to signal shutdown
+    session_tasks = SessionTaskGroup()
+    azure_ws = None
+    upstream_audio = None
+    voice_gate = None
+    call_sid: Optional[str] = None
+    recorder: Optional[CallRecorder] = None
+    upstream: Optional[SocketWriter] = None
+    downstream: Optional[SocketWriter] = None
+    playout: Optional[PlayoutScheduler] = None
+    call_state_store = get_call_state_store()
+    call_log = get_call_log()
+    call_metrics = CallMetrics()
+    # Scanning raw messages for the fields needed only beats a full decode with the
+    # standard library json; orjson decodes the whole message about as fast
+    scan_first = codec.BACKEND == "json"
 
     try:
-        async with websockets.connect(azure_ws_url, ssl=True) as azure_ws:
-            logger.info("Connected to Azure OpenAI WebSocket.")
-            await initialize_session(azure_ws)
-            # Initialize state variables
-            stream_sid: Optional[str] = None
-            latest_media_timestamp: int = 0
-            last_assistant_item: Optional[str] = None
-            mark_queue: list = []
-            response_start_timestamp_twilio: Optional[int] = None
-            conversation_transcript = ""
-
-
-            async def receive_from_twilio():
-                nonlocal stream_sid, latest_media_timestamp, response_start_timestamp_twilio, conversation_transcript
-                logger.info("Started receiving from Twilio.")
+        azure_ws = await session_pool.acquire()
+        logger.info("Connected to Azure OpenAI WebSocket.")
+        # Initialize state variables
+        stream_sid: Optional[str] = None
+        last_assistant_item: Optional[str] = None
+        greeting_item: Optional[str] = None
+        session_profile: Optional[str] = None
+        response_in_progress = False
+        # Whether the response in progress sent any audio yet
+        response_audio_started = False
+        playback = PlaybackTracker(app_settings.PLAYBACK_MARK_INTERVAL_MS)
+
+        # Replaces the Azure session if it drops mid-call; the caller audio received
+        # meanwhile is held in gap_audio and the transcript replayed from history
+        reconnector = AzureReconnector(
+            [session_pool.acquire] + ([fallback_pool.connect] if fallback_pool is not None else []),
+            reconnect_stats,
+            attempts=app_settings.AZURE_RECONNECT_ATTEMPTS,
+            backoff=app_settings.AZURE_RECONNECT_BACKOFF_S,
+            connect_timeout=app_settings.AZURE_RECONNECT_TIMEOUT_S,
+        )
+        history = ConversationHistory(app_settings.AZURE_RECONNECT_HISTORY_SEGMENTS, app_settings.AZURE_RECONNECT_HISTORY_MAX_CHARS)
+        gap_audio = AudioRingBuffer(app_settings.AZURE_RECONNECT_BUFFER_MS, reconnect_stats)
+        azure_ready = asyncio.Event()
+        azure_ready.set()
+
+        def render_downstream(audio_payload: str) -> str:
+            if app_settings.AUDIO_RELAY_ZERO_COPY:
+                return render_twilio_media(stream_sid, audio_payload)
+            audio_delta = {
+                "event": "media",
+                "streamSid": stream_sid,
+                "media": {
+                    "payload": audio_payload
+                }
+            }
+            return codec.dumps(audio_delta)
+
+        transcript_segments = 0
+
+        def log_segment(role: str, text: str):
+            nonlocal transcript_segments
+            transcript_segments += 1
+            history.add(role, text)
+            # Keyed by call, or by stream for streams without a call SID
+            call_log.add_segment(call_sid or stream_sid or "unknown", role, text, transcript_segments, stream_sid)
+
+        def on_writer_error(error: Exception):
+            shutdown_event.set()
+
+        async def send_to_azure(message: str):
+            while True:
+                await azure_ready.wait()
+                target = azure_ws
                 try:
-                    while not shutdown_event.is_set():
-                        try:
-                            message = await asyncio.wait_for(websocket.receive_text(), timeout=1.0)
-                        except asyncio.TimeoutError:
-                            continue  # Periodically check for shutdown
-                        data = json.loads(message)
-                        event_type = data.get('event')
-
-                        if event_type == 'media' and azure_ws.open:
-                            latest_media_timestamp = int(data['media']['timestamp'])
-                            audio_payload = data['media']['payload']
-                            audio_append = {
-                                "type": "input_audio_buffer.append",
-                                "audio": audio_payload
-                            }
-                            await azure_ws.send(json.dumps(audio_append))
-                            logger.debug("Appended audio buffer to Azure.")
-
-                        elif event_type == 'start':
-                            stream_sid = data['start']['streamSid']
-                            logger.info(f"Incoming stream started: {stream_sid}")
-                            response_start_timestamp_twilio = None
-
-                        elif event_type == 'mark':
-                            if mark_queue:
-                                mark_queue.pop(0)
-                                logger.debug("Processed a mark event from Twilio.")
-
-                        elif event_type == 'hangup':
-                            logger.info("Received hangup event from Twilio.")
-                            shutdown_event.set()
-
-                except WebSocketDisconnect:
-                    logger.warning("Twilio disconnected from /media-stream.")
-                    shutdown_event.set()
-                except Exception as e:
-                    logger.error(f"Error in receive_from_twilio: {e}", exc_info=True)
-                    shutdown_event.set()
-
-            async def send_to_twilio():
-                nonlocal stream_sid, last_assistant_item, response_start_timestamp_twilio, conversation_transcript
-                logger.info("Started sending to Twilio.")
+                    await target.send(message)
+                    return
+                except websockets.exceptions.ConnectionClosed:
+                    if not reconnector.enabled:
+                        raise
+                    # Sent again once send_to_twilio has replaced the session
+                    if target is azure_ws:
+                        azure_ready.clear()
+
+        # Caller audio is converted to the Azure session format as it is written, after gating and merging
+        transcoder = AudioTranscoder(app_settings.AZURE_AUDIO_FORMAT)
+
+        def render_upstream(audio_payload: str) -> str:
+            return render_azure_append(transcoder.to_azure(audio_payload))
+
+        # Each socket is written by its own task, so a slow peer only delays its own direction
+        upstream = SocketWriter(
+            "upstream", send_to_azure, render_upstream,
+            policy=app_settings.RELAY_UPSTREAM_POLICY,
+            max_items=app_settings.RELAY_QUEUE_MAX_ITEMS,
+            max_lag_ms=app_settings.RELAY_MAX_LAG_MS,
+            on_error=on_writer_error,
+        )
+
+        def on_agent_audio_sent(frame: Tuple[Optional[str], int]) -> Optional[str]:
+            # Counted once written, so agent audio dropped by the writer never moves the playback position
+            return mark_message(playback.add_audio(*frame))
+
+        downstream = SocketWriter(
+            "downstream", websocket.send_text, render_downstream,
+            policy=app_settings.RELAY_DOWNSTREAM_POLICY,
+            max_items=app_settings.RELAY_QUEUE_MAX_ITEMS,
+            max_lag_ms=app_settings.RELAY_MAX_LAG_MS,
+            on_error=on_writer_error,
+            on_audio_sent=on_agent_audio_sent,
+        )
+        upstream.start()
+        downstream.start()
+
+        async def play_frame(audio_payload: str, item_id: Optional[str], size: int):
+            await downstream.send_audio(audio_payload, (item_id, size))
+            if recorder is not None:
+                recorder.add_agent(audio_payload)
+
+        async def play_marker():
+            # Mark the tail of the response so its end of playback is known, once the audio ahead of it is written
+            await downstream.send(lambda: mark_message(playback.mark()))
+
+        playout = PlayoutScheduler(
+            play_frame,
+            play_marker,
+            playout_stats,
+            enabled=app_settings.PLAYOUT_PACING_ENABLED,
+            frame_ms=app_settings.PLAYOUT_FRAME_MS,
+            lead_ms=app_settings.PLAYOUT_LEAD_MS,
+        )
+        playout.start()
+        upstream_audio = AudioCoalescer(
+            upstream.send_audio,
+            upstream_audio_stats,
+            window_ms=app_settings.AUDIO_COALESCE_WINDOW_MS,
+            max_bytes=app_settings.AUDIO_COALESCE_MAX_BYTES,
+            max_latency_ms=app_settings.AUDIO_COALESCE_MAX_LATENCY_MS,
+        )
+
+        tool_context = ToolContext(call_sid, stream_sid, end_call=shutdown_event.set)
+        tools = ToolDispatcher(get_tool_registry(), tool_context, upstream.send)
+
+        async def on_local_speech_stop():
+            await upstream_audio.flush("local_vad")
+
+        # Keeps caller silence from Azure when VAD_ENABLED; Azure's server_vad still detects the turns
+        voice_gate = VoiceGate(
+            upstream_audio.add,
+            voice_gate_stats,
+            enabled=app_settings.VAD_ENABLED,
+            threshold_dbfs=app_settings.VAD_THRESHOLD_DBFS,
+            onset_ms=app_settings.VAD_ONSET_MS,
+            pre_roll_ms=app_settings.VAD_PRE_ROLL_MS,
+            hangover_ms=app_settings.VAD_HANGOVER_MS,
+            keepalive_ms=app_settings.VAD_KEEPALIVE_MS,
+            on_speech_stop=on_local_speech_stop,
+        )
+
+        async def watch_call_commands(call_sid: str, commands: AsyncIterator[str]):
+            try:
+                async for command in commands:
+                    if command == "hangup":
+                        logger.info("Hangup requested for call %s.", call_sid)
+                        shutdown_event.set()
+                        return
+                    logger.warning(f"Ignoring unknown command '{command}' for call {call_sid}.")
+            except Exception as e:
+                logger.error(f"Error watching commands for call {call_sid}: {e}", exc_info=True)
+            finally:
+                await commands.aclose()
+
+        async def receive_from_twilio():
+            nonlocal stream_sid, call_sid, session_profile, recorder
+            logger.info("Started receiving from Twilio.")
+            try:
+                # No timeout: the task is cancelled as soon as the session ends
+                while True:
+                    message = await websocket.receive_text()
+                    if scan_first and app_settings.AUDIO_RELAY_ZERO_COPY:
+                        media = extract_twilio_media(message)
+                        if media is not None:
+                            await forward_caller_audio(media[1], media[0])
+                            continue
+
+                    data = codec.loads(message)
+                    event_type = data.get('event')
+
+                    if event_type == 'media':
+                        await forward_caller_audio(data['media']['payload'], int(data['media'].get('timestamp') or 0))
+
+                    elif event_type == 'start':
+                        stream_sid = data['start']['streamSid']
+                        log_context.call_sid, log_context.stream_sid = data['start'].get('callSid'), stream_sid
+                        logger.info("Incoming stream started: %s", stream_sid)
+                        if app_settings.RECORDING_ENABLED:
+                            try:
+                                recorder = CallRecorder(
+                                    app_settings.RECORDING_DIR,
+                                    data['start'].get('callSid') or stream_sid,
+                                    audio_format=app_settings.RECORDING_FORMAT,
+                                    chunk_bytes=app_settings.RECORDING_CHUNK_KB * 1024,
+                                    max_pending_bytes=app_settings.RECORDING_MAX_PENDING_KB * 1024,
+                                    max_seconds=app_settings.RECORDING_MAX_S,
+                                )
+                            except ValueError as e:
+                                logger.warning(f"Not recording stream {stream_sid!r}: {e}")
+                        call_metrics.stream_started()
+
+                        # Apply the profile picked for this call, then let the agent open the conversation
+                        session_profile = (data['start'].get('customParameters') or {}).get('profile')
+                        greeting = greeting_cache.get(session_profile)
+                        await initialize_session(azure_ws, create_response=greeting is None, profile=session_profile)
+                        if greeting is not None:
+                            await play_greeting(greeting)
+                        call_metrics.session_configured()
+
+                        call_sid = data['start'].get('callSid')
+                        tool_context.call_sid, tool_context.stream_sid = call_sid, stream_sid
+                        if call_sid:
+                            await admission.confirm(call_sid)
+                            # Subscribed before the record names this worker, so no command sent to it is lost
+                            commands = await call_state_store.subscribe_commands(call_sid)
+                            await call_state_store.update(call_sid, status="in-progress", stream_sid=stream_sid, worker=WORKER_ID)
+                            session_tasks.create_task(watch_call_commands(call_sid, commands), name="watch_call_commands", critical=False)
+
+                    elif event_type == 'mark':
+                        playback.on_mark(data.get('mark', {}).get('name'))
+                        logger.debug("Processed a mark event from Twilio.")
+
+                    elif event_type == 'stop':
+                        logger.info("Received stop event from Twilio.")
+                        await upstream_audio.flush("stop")
+
+                    elif event_type == 'hangup':
+                        logger.info("Received hangup event from Twilio.")
+                        await upstream_audio.flush("hangup")
+                        shutdown_event.set()
+                        return
+
+            except WebSocketDisconnect:
+                logger.warning("Twilio disconnected from /media-stream.")
+                shutdown_event.set()
+            except Exception as e:
+                logger.error(f"Error in receive_from_twilio: {e}", exc_info=True)
+                shutdown_event.set()
+
+        async def play_greeting(greeting: Greeting):
+            """
+            Plays the cached greeting to the caller and adds it to the conversation
+            as said by the agent, instead of having the model generate it.
+            """
+            nonlocal last_assistant_item, greeting_item
+            greeting_item = Greeting.new_item_id()
+            await upstream.send(greeting.item_message(greeting_item))
+            for audio_payload, _ in greeting.chunks:
+                await playout.add(greeting_item, audio_payload)
+                call_metrics.outbound_frame()
+            await playout.add_marker()
+            last_assistant_item = greeting_item
+            logger.info("AGENT TRANSCRIPT: %s", greeting.transcript)
+            log_segment("agent", greeting.transcript)
+
+        async def forward_caller_audio(audio_payload: str, timestamp: int):
+            if recorder is not None:
+                recorder.add_caller(audio_payload, timestamp)
+            if azure_ready.is_set() and azure_ws.open:
+                call_metrics.inbound_frame()
+                await voice_gate.add(audio_payload)
+                logger.debug("Appended audio buffer to Azure.")
+            elif reconnector.enabled:
+                call_metrics.inbound_frame()
+                gap_audio.add(audio_payload)
+
+        async def azure_events():
+            """
+            Yields the messages of the call's Azure session, across reconnects.
+            """
+            while True:
+                error = None
                 try:
                     async for openai_message in azure_ws:
-                        if shutdown_event.is_set():
-                            logger.info("Shutdown event detected. Stopping send_to_twilio.")
-                            break
+                        yield openai_message
+                except websockets.exceptions.ConnectionClosed as e:
+                    error = e
+                if shutdown_event.is_set() or not reconnector.enabled:
+                    if error is not None:
+                        raise error
+                    return
+                logger.warning(f"Azure WebSocket connection lost ({error or 'closed by Azure'}), reconnecting.")
+                await resume_azure_session()
+
+        async def resume_azure_session():
+            nonlocal azure_ws, last_assistant_item, response_in_progress
+            azure_ready.clear()
+            # Asked again only if the caller heard none of it, part of a reply must not be heard twice
+            interrupted = response_in_progress and not response_audio_started
+            new_ws = await reconnector.reconnect()
+            try:
+                await session_profiles.apply(new_ws, session_profile)
+                resume_message = history.resume_message()
+                if resume_message is not None:
+                    await new_ws.send(resume_message)
+                if interrupted:
+                    # The agent was cut off before it said anything, let it answer again
+                    await new_ws.send(RESPONSE_CREATE_MESSAGE)
+            except BaseException:
+                await new_ws.close()
+                raise
+            azure_ws = new_ws
+            # Items and responses of the dropped session are unknown to the new one. Its audio
+            # still queued is played out, but never truncated or attributed to its item.
+            last_assistant_item = None
+            response_in_progress = False
+            playout.forget_items()
+            playback.forget_item()
+            tools.reset()
+            call_metrics.reconnected()
+
+            buffered = gap_audio.drain()
+            for audio_payload in buffered:
+                await voice_gate.add(audio_payload)
+            azure_ready.set()
+            logger.info("Azure session resumed, replayed %s buffered caller frames.", len(buffered))
+
+        async def send_to_twilio():
+            nonlocal stream_sid, last_assistant_item, response_in_progress, response_audio_started
+            logger.info("Started sending to Twilio.")
+            try:
+                async for openai_message in azure_events():
+                    event_type = codec.peek(openai_message, 'type') if scan_first else None
+                    if event_type is not None and event_type not in HANDLED_EVENT_TYPES:
+                        continue
+
+                    response = None
+                    if event_type == 'response.audio.delta' and app_settings.AUDIO_RELAY_ZERO_COPY:
+                        fields = extract_azure_audio_delta(openai_message)
+                        if fields is not None:
+                            response = {"type": event_type, "item_id": fields[0], "delta": fields[1]}
+
+                    if response is None:
                         try:
-                            response = json.loads(openai_message)
-
-                        except json.JSONDecodeError as e:
+                            response = codec.loads(openai_message)
+                        except codec.DECODE_ERRORS as e:
                             logger.error(f"Failed to decode OpenAI message: {e}")
                             continue
 
-                        event_type = response.get('type')
-
-                        if event_type in LOG_EVENT_TYPES:
-                            logger.info(f"Received event from Azure: {event_type}")
-
-                        if  event_type ==  "response.content_part.done":
-                                logger.info(f"AGENT TRANSCRIPT: {response['content']['transcript']}")
-                                conversation_transcript += f"AGENT TRANSCRIPT: {response['content']['transcript']}" + "\n"
-                        if event_type == 'response.audio.delta' and 'delta' in response:
+                    event_type = response.get('type')
+
+                    if event_type in LOG_EVENT_TYPES:
+                        logger.info("Received event from Azure: %s", event_type)
+
+                    if  event_type ==  "response.content_part.done":
+                            agent_transcript = response.get('part', {}).get('transcript')
+                            if agent_transcript:
+                                logger.info("AGENT TRANSCRIPT: %s", agent_transcript)
+                                log_segment("agent", agent_transcript)
+                    if event_type == 'response.audio.delta' and 'delta' in response:
+                        if app_settings.AUDIO_RELAY_ZERO_COPY:
+                            audio_payload = response['delta']
+                            if app_settings.AUDIO_RELAY_VALIDATE_PAYLOAD and not is_valid_payload(audio_payload):
+                                logger.error("Invalid base64 in audio delta, skipping it.")
+                                continue
+                        else:
                             try:
                                 decoded_audio = base64.b64decode(response['delta'])
                                 audio_payload = base64.b64encode(decoded_audio).decode('utf-8')
@@ -141,154 +607,162 @@ async def handle_media_stream(websocket: WebSocket):
                                 logger.error(f"Error decoding audio delta: {e}")
                                 continue  # Skip this message
 
-                            audio_delta = {
-                                "event": "media",
-                                "streamSid": stream_sid,
-                                "media": {
-                                    "payload": audio_payload
-                                }
-                            }
+                        if not transcoder.passthrough:
                             try:
-                                await websocket.send_json(audio_delta)
-                                logger.debug("Sent audio delta to Twilio.")
-                            except WebSocketDisconnect:
-                                logger.warning("Twilio WebSocket disconnected while sending audio_delta.")
-                                shutdown_event.set()
-                                break
-                            except Exception as e:
-                                logger.error(f"Error sending audio_delta to Twilio: {e}", exc_info=True)
-                                shutdown_event.set()
-                                break
-
-                            if response_start_timestamp_twilio is None:
-                                response_start_timestamp_twilio = latest_media_timestamp
-                                if SHOW_TIMING_MATH:
-                                    logger.info(f"Start timestamp set: {response_start_timestamp_twilio}ms")
-
-                            if response.get('item_id'):
-                                last_assistant_item = response['item_id']
-                                logger.debug(f"Updated last_assistant_item: {last_assistant_item}")
-
-                            await send_mark(websocket, stream_sid)
-
-                        elif event_type == 'input_audio_buffer.speech_started':
-                            logger.info("Speech started detected from caller.")
-                            if last_assistant_item:
-                                logger.info(f"Interrupting response with ID: {last_assistant_item}")
-                                await handle_speech_started_event()
-
-                        # Handle Customer Transcript
-                        elif event_type == 'conversation.item.input_audio_transcription.completed':
-                            customer_transcript = response['transcript']
-                            conversation_transcript += f"CUSTOMER TRANSCRIPT: {customer_transcript}" + "\n"
-                            logger.info(f"CUSTOMER TRANSCRIPT: {customer_transcript}")
-
-                        elif event_type == "response.function_call_arguments.done":
-                            function_name = response.get('name')
-                            if function_name == "hangup_call":
-                                args = json.loads(response.get('arguments', '{}'))
-                                logger.info(f"Function call 'hangup_call' with args: {args}")
-                                print(conversation_transcript)
-                                shutdown_event.set()
-                        
-                except websockets.exceptions.ConnectionClosed as e:
-                    logger.error(f"Azure WebSocket connection closed: {e}")
-                    shutdown_event.set()
-                except Exception as e:
-                    logger.error(f"Error in send_to_twilio: {e}", exc_info=True)
-                    shutdown_event.set()
-
-            async def handle_speech_started_event():
-                nonlocal response_start_timestamp_twilio, last_assistant_item
-                logger.info("Handling speech started event from caller.")
-                if mark_queue and response_start_timestamp_twilio is not None:
-                    elapsed_time = latest_media_timestamp - response_start_timestamp_twilio
+                                audio_payload = transcoder.from_azure(audio_payload)
+                            except (base64.binascii.Error, TypeError) as e:
+                                logger.error(f"Error converting audio delta: {e}")
+                                continue
+                            if not audio_payload:
+                                continue
+
+                        if response.get('item_id'):
+                            last_assistant_item = response['item_id']
+                            logger.debug("Updated last_assistant_item: %s", last_assistant_item)
+
+                        await playout.add(last_assistant_item, audio_payload)
+                        response_audio_started = True
+                        call_metrics.outbound_frame()
+                        logger.debug("Queued audio delta for Twilio.")
+
+                    elif event_type == 'response.audio.done':
+                        await playout.add_marker()
+
+                    elif event_type == 'input_audio_buffer.speech_started':
+                        logger.info("Speech started detected from caller.")
+                        await upstream_audio.flush("speech_started")
+                        if last_assistant_item:
+                            logger.info("Interrupting response with ID: %s", last_assistant_item)
+                            call_metrics.interruption()
+                            await handle_speech_started_event()
+
+                    elif event_type == 'input_audio_buffer.speech_stopped':
+                        call_metrics.speech_stopped()
+                        await upstream_audio.flush("speech_stopped")
+
+                    # Handle Customer Transcript
+                    elif event_type == 'conversation.item.input_audio_transcription.completed':
+                        customer_transcript = response['transcript']
+                        log_segment("customer", customer_transcript)
+                        logger.info("CUSTOMER TRANSCRIPT: %s", customer_transcript)
+
+                    elif event_type == "response.function_call_arguments.done":
+                        # Run off the relay loop; the output is posted back when ready
+                        function_name = response.get('name')
+                        logger.info("Function call '%s' requested by the model.", function_name)
+                        session_tasks.create_task(
+                            tools.call(response.get('call_id'), function_name, response.get('arguments')),
+                            name=f"tool_{function_name}", critical=False,
+                        )
+
+                    elif event_type == 'rate_limits.updated':
+                        admission.update_rate_limits(response.get('rate_limits', []))
+
+                    elif event_type == 'response.created':
+                        response_in_progress = True
+                        response_audio_started = False
+                        tools.response_started()
+
+                    elif event_type == 'response.done':
+                        response_in_progress = False
+                        await tools.response_done()
+
+            except websockets.exceptions.ConnectionClosed as e:
+                logger.error(f"Azure WebSocket connection closed: {e}")
+                shutdown_event.set()
+            except Exception as e:
+                logger.error(f"Error in send_to_twilio: {e}", exc_info=True)
+                shutdown_event.set()
+
+        async def handle_speech_started_event():
+            nonlocal last_assistant_item
+            logger.info("Handling speech started event from caller.")
+            # Agent audio not paced out yet is dropped here, before it reaches Twilio
+            cleared_ms = playout.clear()
+            if playback.playing or cleared_ms:
+                # Truncate at the audio the caller actually heard, none of it if it was all still queued
+                elapsed_time = playback.played_ms() if playback.item_id == last_assistant_item else 0
+
+                # The greeting item holds text only, it has no audio to truncate
+                if last_assistant_item and last_assistant_item != greeting_item:
                     if SHOW_TIMING_MATH:
-                        logger.info(f"Calculating elapsed time for truncation: {latest_media_timestamp} - {response_start_timestamp_twilio} = {elapsed_time}ms")
-
-                    if last_assistant_item:
-                        if SHOW_TIMING_MATH:
-                            logger.info(f"Truncating item ID: {last_assistant_item} at {elapsed_time}ms")
-
-                        truncate_event = {
-                            "type": "conversation.item.truncate",
-                            "item_id": last_assistant_item,
-                            "content_index": 0,
-                            "audio_end_ms": elapsed_time
-                        }
-                        try:
-                            await azure_ws.send(json.dumps(truncate_event))
-                            logger.debug("Sent truncate_event to Azure.")
-                        except Exception as e:
-                            logger.error(f"Error sending truncate_event to Azure: {e}", exc_info=True)
-
-                    try:
-                        clear_event = {
-                            "event": "clear",
-                            "streamSid": stream_sid
-                        }
-                        await websocket.send_json(clear_event)
-                        logger.debug("Sent clear event to Twilio.")
-                    except WebSocketDisconnect:
-                        logger.warning("Twilio WebSocket disconnected while sending clear event.")
-                    except Exception as e:
-                        logger.error(f"Error sending clear event to Twilio: {e}", exc_info=True)
-
-                    mark_queue.clear()
-                    last_assistant_item = None
-                    response_start_timestamp_twilio = None
-                    logger.info("Cleared mark queue and reset timestamps.")
-
-            async def send_mark(connection: WebSocket, stream_sid: str):
-                if stream_sid:
-                    mark_event = {
-                        "event": "mark",
-                        "streamSid": stream_sid,
-                        "mark": {"name": "responsePart"}
-                    }
-                    try:
-                        await connection.send_json(mark_event)
-                        mark_queue.append('responsePart')
-                        logger.debug("Sent mark event to Twilio.")
-                    except WebSocketDisconnect:
-                        logger.warning("Twilio WebSocket disconnected while sending mark event.")
-                        shutdown_event.set()
-                    except Exception as e:
-                        logger.error(f"Error sending mark event to Twilio: {e}", exc_info=True)
-                        shutdown_event.set()
-
-            # Create tasks for receiving and sending
-            receive_task = asyncio.create_task(receive_from_twilio(), name="receive_from_twilio")
-            send_task = asyncio.create_task(send_to_twilio(), name="send_to_twilio")
+                        logger.info("Truncating item ID: %s at %sms", last_assistant_item, elapsed_time)
 
+                    truncate_event = {
+                        "type": "conversation.item.truncate",
+                        "item_id": last_assistant_item,
+                        "content_index": 0,
+                        "audio_end_ms": elapsed_time
+                    }
+                    await upstream.send(codec.dumps(truncate_event))
+                    call_metrics.truncate()
+                    logger.debug("Queued truncate_event for Azure.")
+
+                # Agent audio still queued would only be cleared again by Twilio
+                discarded = downstream.discard_pending()
+                clear_event = {
+                    "event": "clear",
+                    "streamSid": stream_sid
+                }
+                await downstream.send(codec.dumps(clear_event))
+                if recorder is not None:
+                    recorder.clear_agent()
+                logger.debug("Queued clear event for Twilio, discarded %s pending messages and %sms of unsent audio.", discarded, cleared_ms)
+
+                playback.clear()
+                last_assistant_item = None
+                logger.info("Cleared pending marks and playback position.")
+
+        def mark_message(name: Optional[str]) -> Optional[str]:
+            if not (stream_sid and name):
+                return None
+            mark_event = {
+                "event": "mark",
+                "streamSid": stream_sid,
+                "mark": {"name": name}
+            }
+            logger.debug("Sending mark event to Twilio.")
+            return codec.dumps(mark_event)
+
+        # The session ends as soon as either direction stops or shutdown is requested
+        # (hangup, writer failure); the other tasks are then cancelled and awaited.
+        async with session_tasks:
+            session_tasks.create_task(receive_from_twilio(), name="receive_from_twilio")
+            session_tasks.create_task(send_to_twilio(), name="send_to_twilio")
+            session_tasks.create_task(shutdown_event.wait(), name="shutdown_requested")
             logger.info("WebSocket handler tasks started.")
-            # Wait for shutdown_event to be set
-            await shutdown_event.wait()
-            logger.info("Shutdown event triggered. Closing connections...")
-
-            # Cancel tasks if they're still running
-            for task in [receive_task, send_task]:
-                if not task.done():
-                    task.cancel()
-                    try:
-                        await task
-                        logger.info(f"{task.get_name()} has been cancelled.")
-                    except asyncio.CancelledError:
-                        logger.info(f"{task.get_name()} was successfully cancelled.")
-                    except Exception as e:
-                        logger.error(f"Error cancelling {task.get_name()}: {e}", exc_info=True)
+            first_done = await session_tasks.wait()
+            logger.info("%s ended the session. Closing connections...", first_done.get_name())
 
     except Exception as e:
         logger.error(f"WebSocket connection error: {e}", exc_info=True)
     finally:
+        call_metrics.finish(call_sid)
+        if voice_gate is not None:
+            voice_gate.close()
+        if upstream_audio is not None:
+            upstream_audio.close()
+        if playout is not None:
+            await playout.close()
+        for writer in (upstream, downstream):
+            if writer is not None:
+                await writer.close()
+        await session_tasks.cancel()
+        admission.leave_stream()
+        if call_sid:
+            try:
+                await admission.release(call_sid)
+                await call_state_store.remove(call_sid)
+            except Exception as e:
+                logger.error(f"Error removing state of call {call_sid}: {e}", exc_info=True)
         try:
             # Check the WebSocket state before attempting to close
             if websocket.application_state != WebSocketState.DISCONNECTED:
                 await websocket.close()
                 logger.info("Twilio WebSocket connection closed.")
 
-            if not azure_ws.closed:
-                end_call(azure_ws)
+            if azure_ws is not None and not azure_ws.closed:
+                await end_call(azure_ws)
                 await azure_ws.close()
                 logger.info("Azure WebSocket connection closed.")
 
@@ -296,58 +770,42 @@ async def handle_media_stream(websocket: WebSocket):
             logger.error(f"Error closing Twilio WebSocket: {e}", exc_info=True)
         finally:
             logger.info("WebSocket connection closed.")
+        # Laid out off the event loop once both sockets are closed
+        if recorder is not None:
+            try:
+                await recorder.finish()
+            except Exception as e:
+                logger.error(f"Error finishing the recording of call {call_sid}: {e}", exc_info=True)
             
 async def end_call(azure_ws):
     """
-    Sends the initial message to start the conversation with the GPT service.
+    Asks the GPT service to close the call with the customer.
     """
-    initial_conversation_item = {
-        "type": "conversation.item.create",
-        "item": {
-            "type": "message",
-            "role": "user",
-            "content": [
-                {
-                    "type": "input_text",
-                    "text": "close the call now with the customer"
-                }
-            ]
-        }
-    }
-    await azure_ws.send(json.dumps(initial_conversation_item))
+    await azure_ws.send(END_CALL_MESSAGE)
 
-async def initialize_session(azure_ws):
+async def start_conversation(azure_ws):
     """
-    Initializes the session with the GPT 4o audio service by sending session configurations.
+    Asks the GPT service to produce the opening response of the conversation.
+    """
+    await azure_ws.send(RESPONSE_CREATE_MESSAGE)
+    logger.info("conversation started.")
+
+async def initialize_session(azure_ws, create_response: bool = True, profile: Optional[str] = None):
+    """
+    Initializes the session with the GPT 4o audio service by sending the precompiled
+    session configuration of a profile. Sessions already configured with the
+    current version of that profile are left untouched.
     """
     try:
-            # Load session configuration
-            with open(SESSION_FILE_PATH, "r", encoding="utf-8") as file:
-                session_config = json.load(file)
-            logger.info("GPT session file loaded successfully.")
-
-            # Load system instructions
-            with open(INSTRUCTION_FILE_PATH, 'r', encoding='utf-8') as file:
-                    instructions = file.read()
-            logger.info("System instructions file loaded successfully.")
-
-            # Update session configuration
-            session = {"type": "session.update", "session": session_config}
-            session["session"].update({"temperature": app_settings.GPT_AUDIO_TEMPRATURE, "instructions": instructions, "voice": app_settings.GPT_AUDIO_VOICE_NAME})
-            session["session"]["turn_detection"].update({ "threshold": app_settings.GPT_AUDIO_THRESHOLD,"silence_duration_ms": app_settings.GPT_AUDIO_SILENCE_DURATION_MS,"prefix_padding_ms": app_settings.GPT_AUDIO_PREFIX_PADDING_MS})
-
-            # Send session configuration to Azure
-            await azure_ws.send(json.dumps(session))
-            logger.info("Session update sent to Azure.")
-            
-            # Start conversation
-            await azure_ws.send(json.dumps({"type": "response.create"}))
-            logger.info("conversation started.")
+        await session_profiles.apply(azure_ws, profile)
+
+        # Start conversation
+        if create_response:
+            await start_conversation(azure_ws)
 
     except FileNotFoundError as e:
         logger.error(f"Session configuration or System instruction file not found: {e}")
-    except json.JSONDecodeError as e:
+    except codec.DECODE_ERRORS as e:
         logger.error(f"Error decoding session configuration JSON: {e}")
     except Exception as e:
         logger.error(f"Error initializing session: {e}", exc_info=True)
-        
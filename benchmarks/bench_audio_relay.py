@@ -0,0 +1,103 @@
+"""
+Microbenchmark for the per-frame work of the /media-stream audio relay.
+
+Compares the original path (full json.loads/json.dumps of every Twilio frame and
+a base64 decode/re-encode of every Azure delta) against the zero-copy path that
+passes the g711_ulaw payload strings straight through pre-rendered templates.
+
+Usage:
+    python -m benchmarks.bench_audio_relay [--frames 200000]
+"""
+import argparse
+import base64
+import json
+import os
+import time
+
+from app.helpers.audio_relay import (
+    extract_twilio_media,
+    is_valid_payload,
+    render_azure_append,
+    render_twilio_media,
+)
+from benchmarks.traces import FRAME_BYTES, STREAM_SID, twilio_media_frame
+
+def make_twilio_frames(count: int) -> list:
+    return [twilio_media_frame(index) for index in range(count)]
+
+
+def make_azure_deltas(count: int) -> list:
+    return [base64.b64encode(os.urandom(FRAME_BYTES * 5)).decode("ascii") for _ in range(count)]
+
+
+def inbound_legacy(frames):
+    for message in frames:
+        data = json.loads(message)
+        if data.get("event") == "media":
+            int(data["media"]["timestamp"])
+            json.dumps({"type": "input_audio_buffer.append", "audio": data["media"]["payload"]})
+
+
+def inbound_zero_copy(frames):
+    for message in frames:
+        media = extract_twilio_media(message)
+        if media is not None:
+            render_azure_append(media[1])
+
+
+def outbound_legacy(deltas):
+    for delta in deltas:
+        payload = base64.b64encode(base64.b64decode(delta)).decode("utf-8")
+        json.dumps({"event": "media", "streamSid": STREAM_SID, "media": {"payload": payload}})
+
+
+def outbound_zero_copy(deltas):
+    for delta in deltas:
+        render_twilio_media(STREAM_SID, delta)
+
+
+def outbound_zero_copy_validated(deltas):
+    for delta in deltas:
+        if is_valid_payload(delta):
+            render_twilio_media(STREAM_SID, delta)
+
+
+def measure(name: str, func, items) -> float:
+    started = time.process_time()
+    func(items)
+    elapsed = time.process_time() - started
+    rate = len(items) / elapsed if elapsed else float("inf")
+    print(f"{name:<36} {rate:>14,.0f} frames/s per core")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=200_000)
+    args = parser.parse_args()
+
+    frames = make_twilio_frames(args.frames)
+    deltas = make_azure_deltas(args.frames)
+
+    print("Twilio -> Azure")
+    inbound_before = measure("  legacy (json.loads + json.dumps)", inbound_legacy, frames)
+    inbound_after = measure("  zero-copy", inbound_zero_copy, frames)
+    print(f"  speedup: {inbound_after / inbound_before:.1f}x")
+
+    print("Azure -> Twilio")
+    outbound_before = measure("  legacy (b64 decode/encode + dumps)", outbound_legacy, deltas)
+    outbound_after = measure("  zero-copy", outbound_zero_copy, deltas)
+    validated = measure("  zero-copy + validation", outbound_zero_copy_validated, deltas)
+    print(f"  speedup: {outbound_after / outbound_before:.1f}x ({validated / outbound_before:.1f}x with validation)")
+
+    # Each call relays ~50 frames/s in each direction
+    def calls_per_core(inbound_rate, outbound_rate):
+        return 1 / (50 / inbound_rate + 50 / outbound_rate)
+
+    print("Calls per core at 50 frames/s/direction (relay work only):")
+    print(f"  legacy:    {calls_per_core(inbound_before, outbound_before):,.0f}")
+    print(f"  zero-copy: {calls_per_core(inbound_after, outbound_after):,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+CPU cost of converting call audio between Twilio's 8 kHz g711_ulaw and 24 kHz
+pcm16 Azure sessions (AZURE_AUDIO_FORMAT=pcm16), per call and at a target concurrency.
+
+Caller audio is fed to AudioTranscoder.to_azure in 20 ms frames as Twilio sends
+it, agent audio to from_azure in deltas of `--delta-ms` as Azure sends it. Both
+directions are counted as running for the whole call, which overstates the cost
+of a real conversation where the two sides mostly take turns. Where the
+interpreter still ships audioop, the same conversion through audioop.ratecv is
+timed for reference.
+
+Usage:
+    python -m benchmarks.bench_audio_transcode [--calls 50] [--budget-cores 1.0] [--audio caller.ulaw]
+
+`--audio` is raw 8 kHz μ-law, e.g. `ffmpeg -i call.wav -ar 8000 -ac 1 -f mulaw caller.ulaw`.
+"""
+import argparse
+import base64
+import os
+import time
+import warnings
+from typing import Callable, List, Optional
+
+from app.helpers.audio_codec import PCM16_RATE_FACTOR, AudioTranscoder
+from benchmarks.traces import FRAME_BYTES
+
+FRAME_MS = 20
+
+try:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        import audioop
+except ImportError:
+    audioop = None
+
+
+def load_audio(path: Optional[str], seconds: float) -> bytes:
+    if path is None:
+        return os.urandom(int(seconds * 1000 / FRAME_MS) * FRAME_BYTES)
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def split(audio: bytes, size: int) -> List[str]:
+    return [base64.b64encode(audio[offset:offset + size]).decode("ascii") for offset in range(0, len(audio), size)]
+
+
+def time_us(convert: Callable[[str], str], payloads: List[str]) -> float:
+    started = time.perf_counter()
+    for payload in payloads:
+        convert(payload)
+    return (time.perf_counter() - started) * 1e6
+
+
+def audioop_converters():
+    up_state, down_state = None, None
+
+    def to_azure(payload: str) -> str:
+        nonlocal up_state
+        pcm = audioop.ulaw2lin(base64.b64decode(payload), 2)
+        pcm, up_state = audioop.ratecv(pcm, 2, 1, 8000, 8000 * PCM16_RATE_FACTOR, up_state)
+        return base64.b64encode(pcm).decode("ascii")
+
+    def from_azure(payload: str) -> str:
+        nonlocal down_state
+        pcm, down_state = audioop.ratecv(base64.b64decode(payload), 2, 1, 8000 * PCM16_RATE_FACTOR, 8000, down_state)
+        return base64.b64encode(audioop.lin2ulaw(pcm, 2)).decode("ascii")
+
+    return to_azure, from_azure
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--audio", help="Raw 8 kHz μ-law audio, used for both directions")
+    parser.add_argument("--seconds", type=float, default=60.0, help="Length of the synthetic audio")
+    parser.add_argument("--delta-ms", type=int, default=100, help="Audio per Azure delta")
+    parser.add_argument("--calls", type=int, default=50, help="Target concurrent calls per worker")
+    parser.add_argument("--budget-cores", type=float, default=1.0, help="CPU the conversion may take at the target")
+    args = parser.parse_args()
+
+    audio = load_audio(args.audio, args.seconds)
+    audio_ms = len(audio) / FRAME_BYTES * FRAME_MS
+    caller_payloads = split(audio, FRAME_BYTES)
+    # Agent audio as Azure would send it: the same audio at 24 kHz pcm16
+    agent_pcm = AudioTranscoder("pcm16").encode_azure(audio)
+    agent_payloads = split(agent_pcm, args.delta_ms * 8 * PCM16_RATE_FACTOR * 2)
+
+    transcoder = AudioTranscoder("pcm16")
+    candidates = [("numpy", transcoder.to_azure, transcoder.from_azure)]
+    if audioop is not None:
+        candidates.append(("audioop", *audioop_converters()))
+
+    print(f"{audio_ms / 1000:.0f}s of audio, {len(caller_payloads)} caller frames, "
+          f"{len(agent_payloads)} agent deltas of {args.delta_ms}ms, target {args.calls} calls")
+    print(f"{'codec':>8} {'up us/frame':>12} {'down us/frame':>14} {'core/call':>10} {'cores@target':>13} {'budget':>7}")
+    for name, to_azure, from_azure in candidates:
+        frames = audio_ms / FRAME_MS
+        up_us = time_us(to_azure, caller_payloads) / frames
+        down_us = time_us(from_azure, agent_payloads) / frames
+        share = (up_us + down_us) / (FRAME_MS * 1000)
+        cores = share * args.calls
+        print(f"{name:>8} {up_us:>12.2f} {down_us:>14.2f} {share:>9.2%} {cores:>13.3f} "
+              f"{'ok' if cores <= args.budget_cores else 'OVER':>7}")
+
+
+if __name__ == "__main__":
+    main()
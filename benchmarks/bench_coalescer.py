@@ -0,0 +1,65 @@
+"""
+Upstream send rate and added latency of the audio coalescer for several window sizes.
+
+Frames are fed at Twilio's real-time pace (one 160 byte frame every 20 ms) for a
+number of simulated concurrent calls, and sent to a no-op sink in place of Azure.
+
+Usage:
+    python -m benchmarks.bench_coalescer [--calls 50] [--seconds 3] [--windows 0,40,100,200]
+"""
+import argparse
+import asyncio
+import base64
+import os
+import time
+
+from app.helpers.audio_coalescer import AudioCoalescer, CoalescerStats
+from benchmarks.traces import FRAME_BYTES
+
+
+async def run_call(coalescer: AudioCoalescer, frames: int, payload: str):
+    started = time.perf_counter()
+    for index in range(frames):
+        await coalescer.add(payload)
+        delay = started + (index + 1) * 0.02 - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+    await coalescer.flush("stop")
+    coalescer.close()
+
+
+async def run_window(window_ms: int, max_latency_ms: int, calls: int, seconds: float) -> dict:
+    stats = CoalescerStats(window_ms, 0, max_latency_ms)
+    payload = base64.b64encode(os.urandom(FRAME_BYTES)).decode("ascii")
+
+    async def sink(payload: str):
+        await asyncio.sleep(0)
+
+    coalescers = [AudioCoalescer(sink, stats, window_ms=window_ms, max_latency_ms=max_latency_ms) for _ in range(calls)]
+    frames = int(seconds / 0.02)
+    cpu_started = time.process_time()
+    await asyncio.gather(*(run_call(coalescer, frames, payload) for coalescer in coalescers))
+    summary = stats.summary()
+    summary["cpu_s"] = time.process_time() - cpu_started
+    summary["sends_per_call_per_s"] = summary["appends_out"] / calls / seconds
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--windows", default="0,40,100,200")
+    parser.add_argument("--max-latency-ms", type=int, default=250)
+    args = parser.parse_args()
+
+    print(f"{'window':>8} {'sends/call/s':>13} {'frames/send':>12} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'cpu s':>7}")
+    for window_ms in (int(window) for window in args.windows.split(",")):
+        summary = asyncio.run(run_window(window_ms, args.max_latency_ms, args.calls, args.seconds))
+        latency = summary["added_latency_ms"]
+        print(f"{window_ms:>6}ms {summary['sends_per_call_per_s']:>13.1f} {summary['frames_per_append']:>12.1f}"
+              f" {latency['p50']:>8.1f} {latency['p95']:>8.1f} {latency['max']:>8.1f} {summary['cpu_s']:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Throughput of the JSON codec layer over Twilio and Azure event traces.
+
+For every available backend it measures a full decode of each message, and the
+discriminator-first strategy used by /media-stream, where only the `event`/`type`
+field is read up front and media payloads are never parsed into dicts.
+
+Usage:
+    python -m benchmarks.bench_codec [--frames 50000]
+        [--twilio-trace twilio.jsonl] [--azure-trace azure.jsonl]
+"""
+import argparse
+import time
+
+from app.helpers import codec
+from app.helpers.audio_relay import extract_azure_audio_delta, extract_twilio_media, render_azure_append, render_twilio_media
+from app.routes.media_stream import HANDLED_EVENT_TYPES
+from benchmarks.traces import load_trace, synthetic_azure_trace, synthetic_twilio_trace
+
+
+def full_decode_twilio(trace):
+    for message in trace:
+        data = codec.loads(message)
+        if data.get("event") == "media":
+            codec.dumps({"type": "input_audio_buffer.append", "audio": data["media"]["payload"]})
+
+
+def discriminator_twilio(trace):
+    for message in trace:
+        media = extract_twilio_media(message)
+        if media is not None:
+            render_azure_append(media[1])
+            continue
+        codec.loads(message)
+
+
+def full_decode_azure(trace):
+    for message in trace:
+        response = codec.loads(message)
+        if response.get("type") == "response.audio.delta":
+            codec.dumps({"event": "media", "streamSid": "MZ", "media": {"payload": response["delta"]}})
+
+
+def discriminator_azure(trace):
+    for message in trace:
+        event_type = codec.peek(message, "type")
+        if event_type not in HANDLED_EVENT_TYPES:
+            continue
+        if event_type == "response.audio.delta":
+            fields = extract_azure_audio_delta(message)
+            if fields is not None:
+                render_twilio_media("MZ", fields[1])
+                continue
+        codec.loads(message)
+
+
+def measure(func, trace, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.process_time()
+        func(trace)
+        best = min(best, time.process_time() - started)
+    return len(trace) / best if best else float("inf")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=50_000)
+    parser.add_argument("--twilio-trace", help="Recorded Twilio trace (JSONL, one message per line)")
+    parser.add_argument("--azure-trace", help="Recorded Azure trace (JSONL, one message per line)")
+    args = parser.parse_args()
+
+    traces = {
+        "Twilio": (load_trace(args.twilio_trace) if args.twilio_trace else synthetic_twilio_trace(args.frames),
+                   full_decode_twilio, discriminator_twilio),
+        "Azure": (load_trace(args.azure_trace) if args.azure_trace else synthetic_azure_trace(args.frames),
+                  full_decode_azure, discriminator_azure),
+    }
+
+    for name, (trace, full_decode, discriminator) in traces.items():
+        print(f"{name} trace ({len(trace):,} messages), messages/s per core")
+        codec.use_backend("json")
+        baseline = measure(full_decode, trace)
+        for backend in codec.available_backends():
+            codec.use_backend(backend)
+            full = measure(full_decode, trace)
+            peeked = measure(discriminator, trace)
+            print(f"  {backend:<8} full decode {full:>12,.0f} ({full / baseline:4.1f}x)"
+                  f"   discriminator-first {peeked:>12,.0f} ({peeked / baseline:4.1f}x)")
+
+    codec.use_backend("auto")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Per-frame overhead and teardown time of the /media-stream session lifecycle.
+
+Compares the former loop, which wrapped every receive in
+asyncio.wait_for(..., timeout=1.0) to poll a shutdown event and cancelled the
+tasks one by one, with the SessionTaskGroup used now, where receives are
+plain awaits and the first task to finish ends the session.
+
+Each simulated call receives 20 ms frames from an in-memory socket. The
+benchmark reports CPU time per frame with `--calls` concurrent calls, then
+hangs up every call at once and reports how long each took to tear down.
+
+Usage:
+    python -m benchmarks.bench_session_lifecycle [--calls 200] [--seconds 5]
+"""
+import argparse
+import asyncio
+import time
+
+from app.helpers.task_group import SessionTaskGroup
+
+FRAME_INTERVAL = 0.02
+
+
+async def polling_session(inbox: asyncio.Queue, outbox: asyncio.Queue, shutdown: asyncio.Event, counter: list):
+    async def receive():
+        while not shutdown.is_set():
+            try:
+                message = await asyncio.wait_for(inbox.get(), timeout=1.0)
+            except asyncio.TimeoutError:
+                continue
+            if message is None:
+                shutdown.set()
+                return
+            counter[0] += 1
+
+    async def send():
+        while True:
+            await outbox.get()
+
+    tasks = [asyncio.create_task(receive()), asyncio.create_task(send())]
+    await shutdown.wait()
+    for task in tasks:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+
+async def grouped_session(inbox: asyncio.Queue, outbox: asyncio.Queue, shutdown: asyncio.Event, counter: list):
+    async def receive():
+        while True:
+            message = await inbox.get()
+            if message is None:
+                return
+            counter[0] += 1
+
+    async def send():
+        while True:
+            await outbox.get()
+
+    async with SessionTaskGroup() as group:
+        group.create_task(receive())
+        group.create_task(send())
+        group.create_task(shutdown.wait())
+        await group.wait()
+
+
+async def run(session, calls: int, seconds: float) -> dict:
+    inboxes = [asyncio.Queue() for _ in range(calls)]
+    counter = [0]
+    ended = {}
+
+    async def call(index: int):
+        await session(inboxes[index], asyncio.Queue(), asyncio.Event(), counter)
+        ended[index] = time.perf_counter()
+
+    calls_running = [asyncio.create_task(call(index)) for index in range(calls)]
+    await asyncio.sleep(0.1)
+
+    cpu_started = time.process_time()
+    next_tick = time.perf_counter()
+    deadline = next_tick + seconds
+    while next_tick < deadline:
+        for inbox in inboxes:
+            inbox.put_nowait("frame")
+        next_tick += FRAME_INTERVAL
+        await asyncio.sleep(max(0.0, next_tick - time.perf_counter()))
+    cpu = time.process_time() - cpu_started
+    frames = counter[0]
+
+    # Hang up every call at once
+    hangup_at = time.perf_counter()
+    for inbox in inboxes:
+        inbox.put_nowait(None)
+    await asyncio.gather(*calls_running)
+    teardown = sorted((ended[index] - hangup_at) * 1000 for index in range(calls))
+    return {
+        "frames": frames,
+        "cpu_us_per_frame": cpu / frames * 1e6 if frames else 0.0,
+        "teardown_p50_ms": teardown[len(teardown) // 2],
+        "teardown_max_ms": teardown[-1],
+    }
+
+
+async def tight_loop(frames: int, use_wait_for: bool) -> float:
+    inbox = asyncio.Queue()
+    for _ in range(frames):
+        inbox.put_nowait("frame")
+    started = time.perf_counter()
+    for _ in range(frames):
+        if use_wait_for:
+            await asyncio.wait_for(inbox.get(), timeout=1.0)
+        else:
+            await inbox.get()
+    return (time.perf_counter() - started) / frames * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--frames", type=int, default=200000, help="Frames for the single-loop receive cost")
+    args = parser.parse_args()
+
+    print(f"receive cost, one loop: wait_for {asyncio.run(tight_loop(args.frames, True)):.2f}us/frame, "
+          f"plain await {asyncio.run(tight_loop(args.frames, False)):.2f}us/frame")
+    print(f"{args.calls} concurrent calls at 50 frames/s for {args.seconds:.0f}s:")
+    print(f"{'lifecycle':<10} {'frames':>8} {'cpu us/frame':>13} {'teardown p50':>13} {'teardown max':>13}")
+    for name, session in (("polling", polling_session), ("grouped", grouped_session)):
+        result = asyncio.run(run(session, args.calls, args.seconds))
+        print(f"{name:<10} {result['frames']:>8} {result['cpu_us_per_frame']:>13.2f}"
+              f" {result['teardown_p50_ms']:>11.2f}ms {result['teardown_max_ms']:>11.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
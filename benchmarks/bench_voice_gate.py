@@ -0,0 +1,88 @@
+"""
+Share of caller audio kept from Azure by the local voice gate, and its CPU cost.
+
+Caller audio is fed through a VoiceGate frame by frame, without pacing, to a
+no-op sink in place of Azure. Without `--audio`, a synthetic call alternates
+talk spurts (loud μ-law noise) with line silence and low comfort noise.
+
+Usage:
+    python -m benchmarks.bench_voice_gate [--audio caller.ulaw] [--thresholds -55,-45,-35]
+
+`--audio` is raw 8 kHz μ-law, e.g. `ffmpeg -i call.wav -ar 8000 -ac 1 -f mulaw caller.ulaw`.
+"""
+import argparse
+import asyncio
+import base64
+import os
+import random
+import time
+from typing import List, Optional
+
+from app.helpers.audio_codec import mean_power, power_to_dbfs
+from app.helpers.voice_gate import VoiceGate, VoiceGateStats
+from benchmarks.traces import FRAME_BYTES
+
+# μ-law codes of the quietest magnitudes, both signs
+QUIET_CODES = bytes([0xFF, 0xFE, 0xFD, 0x7F, 0x7E, 0x7D])
+
+
+def synthetic_call(seconds: float, talk_s: float = 1.5, pause_s: float = 3.0) -> List[bytes]:
+    rng = random.Random(7)
+    frames, elapsed = [], 0.0
+    while elapsed < seconds:
+        for _ in range(int(talk_s / 0.02)):
+            frames.append(os.urandom(FRAME_BYTES))
+        for _ in range(int(pause_s / 0.02)):
+            frames.append(bytes(rng.choice(QUIET_CODES) for _ in range(FRAME_BYTES)))
+        elapsed += talk_s + pause_s
+    return frames
+
+
+def load_frames(path: Optional[str], seconds: float) -> List[bytes]:
+    if path is None:
+        return synthetic_call(seconds)
+    with open(path, "rb") as file:
+        audio = file.read()
+    return [audio[offset:offset + FRAME_BYTES] for offset in range(0, len(audio) - FRAME_BYTES + 1, FRAME_BYTES)]
+
+
+async def run(payloads: List[str], threshold_dbfs: float, hangover_ms: int, pre_roll_ms: int) -> dict:
+    stats = VoiceGateStats(threshold_dbfs, hangover_ms)
+
+    async def sink(payload: str):
+        pass
+
+    gate = VoiceGate(sink, stats, enabled=True, threshold_dbfs=threshold_dbfs, hangover_ms=hangover_ms, pre_roll_ms=pre_roll_ms)
+    started = time.perf_counter()
+    for payload in payloads:
+        await gate.add(payload)
+    elapsed = time.perf_counter() - started
+    gate.close()
+    summary = stats.summary()
+    summary["us_per_frame"] = elapsed / len(payloads) * 1e6
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--audio", help="Raw 8 kHz μ-law caller audio")
+    parser.add_argument("--seconds", type=float, default=300.0, help="Length of the synthetic call")
+    parser.add_argument("--thresholds", default="-55,-45,-35")
+    parser.add_argument("--hangover-ms", type=int, default=1000)
+    parser.add_argument("--pre-roll-ms", type=int, default=300)
+    args = parser.parse_args()
+
+    frames = load_frames(args.audio, args.seconds)
+    payloads = [base64.b64encode(frame).decode("ascii") for frame in frames]
+    levels = sorted(power_to_dbfs(mean_power(frame)) for frame in frames)
+    print(f"{len(frames)} frames ({len(frames) * 0.02:.0f}s), frame level p10 {levels[len(levels) // 10]:.1f} dBFS, "
+          f"p50 {levels[len(levels) // 2]:.1f} dBFS, p90 {levels[len(levels) * 9 // 10]:.1f} dBFS")
+    print(f"{'threshold':>10} {'forwarded':>10} {'suppressed':>11} {'saved':>7} {'segments':>9} {'us/frame':>9}")
+    for threshold in (float(value) for value in args.thresholds.split(",")):
+        summary = asyncio.run(run(payloads, threshold, args.hangover_ms, args.pre_roll_ms))
+        print(f"{threshold:>6.0f}dBFS {summary['frames_forwarded']:>10} {summary['frames_suppressed']:>11}"
+              f" {summary['suppressed_ratio']:>6.0%} {summary['speech_segments']:>9} {summary['us_per_frame']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Runs a campaign end to end against the fake Twilio endpoint.
+
+The app runs in-process with a temporary campaign database. The fake endpoint
+answers calls.create and posts random final statuses (completed, busy, no-answer,
+failed) back to /campaigns/status. The script checks that the dialer never exceeds
+the configured calls-per-second and concurrency limits, that busy/no-answer
+numbers are retried up to the max number of attempts, and it reports throughput.
+With --stall-rate, some calls.create requests time out after the call was created;
+the dialer must resolve them from the call list without dialing the number again.
+
+Usage:
+    python -m benchmarks.campaign_dry_run [--numbers 200] [--cps 20] [--concurrent 15] [--stall-rate 0.1]
+"""
+import argparse
+import asyncio
+import base64
+import os
+import tempfile
+import time
+
+
+def max_rate(times: list, window: float = 1.0) -> int:
+    """Largest number of requests seen in any sliding window of `window` seconds."""
+    best, start = 0, 0
+    for end, at in enumerate(times):
+        while at - times[start] >= window:
+            start += 1
+        best = max(best, end - start + 1)
+    return best
+
+
+async def run(args):
+    import uvicorn
+    from aiohttp import ClientSession
+    from app.helpers.config import get_settings
+    from app.main import app
+    from benchmarks.fake_twilio import FakeTwilio, start_fake_twilio
+
+    fake = FakeTwilio(latency=0.05, call_duration=(0.5, 2.0), seed=1, auth_token=get_settings().TWILIO_AUTH_TOKEN,
+                      stall_rate=args.stall_rate)
+    runner = await start_fake_twilio(fake, port=args.twilio_port)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    settings = get_settings()
+    auth = base64.b64encode(f"{settings.API_AUTH_USERNAME}:{settings.API_AUTH_PASSWORD}".encode()).decode()
+    numbers = "phone,name\n" + "".join(f"+1555{index:07d},Clinic {index}\n" for index in range(args.numbers))
+
+    started = time.monotonic()
+    async with ClientSession(headers={"Authorization": f"Basic {auth}"}) as session:
+        async with session.post(f"http://127.0.0.1:{args.port}/campaigns?name=dry-run", data=numbers,
+                                headers={"Content-Type": "text/csv"}) as response:
+            created = await response.json()
+        print(f"Created campaign: {created}")
+
+        while True:
+            await asyncio.sleep(1.0)
+            async with session.get(f"http://127.0.0.1:{args.port}/campaigns/{created['campaign_id']}") as response:
+                progress = await response.json()
+            eta = f"{progress['eta_s']:.0f}s" if progress["eta_s"] is not None else "-"
+            print(f"  {progress['finished']}/{progress['total']} finished, {progress['attempts']} attempts, "
+                  f"{progress['throughput_per_min']:.0f} calls/min, ETA {eta}")
+            if progress["remaining"] == 0:
+                break
+    elapsed = time.monotonic() - started
+
+    print(f"Done in {elapsed:.1f}s: {progress['by_status']}")
+    print(f"Fake Twilio outcomes: {dict(fake.final_statuses)}, {fake.stalled} requests timed out")
+    # Requests are spaced 1/cps apart, so a 1 s window can hold cps + 1 of them when arrival jitter
+    # shortens the gap at its edges
+    checks = {
+        f"peak dial rate {max_rate(fake.request_times)}/s <= {args.cps:g}/s (+1 edge request)":
+            max_rate(fake.request_times) <= args.cps + 1,
+        f"peak concurrent calls {fake.max_active_calls} <= {args.concurrent}":
+            fake.max_active_calls <= args.concurrent,
+        f"max attempts per number {max(fake.calls_per_number.values())} <= {settings.CAMPAIGN_MAX_ATTEMPTS}":
+            max(fake.calls_per_number.values()) <= settings.CAMPAIGN_MAX_ATTEMPTS,
+        "busy/no-answer numbers were retried": progress["attempts"] > progress["total"],
+        "every number reached a final status": progress["remaining"] == 0,
+    }
+    for check, passed in checks.items():
+        print(f"[{'PASS' if passed else 'FAIL'}] {check}")
+
+    server.should_exit = True
+    await server_task
+    await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--numbers", type=int, default=200)
+    parser.add_argument("--cps", type=float, default=20)
+    parser.add_argument("--concurrent", type=int, default=15)
+    parser.add_argument("--port", type=int, default=5052)
+    parser.add_argument("--twilio-port", type=int, default=8082)
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Share of calls.create requests that time out")
+    args = parser.parse_args()
+
+    os.environ.update({
+        "TWILIO_API_BASE_URL": f"http://127.0.0.1:{args.twilio_port}",
+        "PUBLIC_BASE_URL": f"http://127.0.0.1:{args.port}",
+        "CAMPAIGN_DB_PATH": os.path.join(tempfile.mkdtemp(), "campaigns.db"),
+        "CAMPAIGN_CALLS_PER_SECOND": str(args.cps),
+        "CAMPAIGN_MAX_CONCURRENT_CALLS": str(args.concurrent),
+        "CAMPAIGN_RETRY_DELAY_S": "1",
+        "AZURE_POOL_SIZE": "0",
+        "TWILIO_HTTP_TIMEOUT_S": "2",
+    })
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
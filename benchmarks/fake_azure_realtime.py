@@ -0,0 +1,220 @@
+"""
+Fake Azure OpenAI realtime WebSocket server for load tests.
+
+Speaks the events /media-stream acts upon. Caller audio drives a simulated
+server VAD: after `--listen-ms` of appended audio it sends speech_started, then
+speech_stopped, input_audio_buffer.committed and a transcription, and answers
+with `--response-ms` of audio deltas paced at real time (or `--speed` times
+faster), followed by the transcript and response.done. After `--turns` turns
+(0 for never) it asks the agent to hang up through a hangup_call function call.
+
+Audio frames carry a send timestamp (see stamp_frame), so the relay latency of
+caller frames is measured here and the latency of agent audio by the caller.
+GET /stats on the same port returns the counters as JSON (`?reset=1` clears them).
+
+Run it standalone and point the app at it with AZURE_OPENAI_REALTIME_URL:
+    python -m benchmarks.fake_azure_realtime --port 8082
+    AZURE_OPENAI_REALTIME_URL=ws://127.0.0.1:8082 uvicorn app.main:app --port 5050
+"""
+import argparse
+import asyncio
+import base64
+import http
+import itertools
+import json
+import struct
+import time
+from typing import List, Optional
+
+import websockets
+
+FRAME_BYTES = 160  # 20 ms of 8 kHz g711_ulaw
+STAMP = b"LT"
+STAMP_FORMAT = "<2sd"
+STAMP_SIZE = struct.calcsize(STAMP_FORMAT)
+
+
+def stamp_frame(frame: bytes) -> bytes:
+    """
+    Overwrites the start of an audio frame with the current monotonic time.
+    """
+    return struct.pack(STAMP_FORMAT, STAMP, time.perf_counter()) + frame[STAMP_SIZE:]
+
+
+def read_stamp(frame: bytes) -> Optional[float]:
+    """
+    Returns the time a stamped frame was sent, or None for unstamped audio.
+    """
+    if len(frame) < STAMP_SIZE or not frame.startswith(STAMP):
+        return None
+    return struct.unpack_from(STAMP_FORMAT, frame)[1]
+
+
+def percentiles(samples: List[float]) -> dict:
+    """
+    p50/p95/p99/max of latency samples in seconds, in milliseconds.
+    """
+    samples = sorted(samples)
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": samples[-1] * 1000}
+
+
+def _event(event_type: str, **fields) -> str:
+    return json.dumps({"type": event_type, **fields}, separators=(",", ":"))
+
+
+class FakeAzureRealtime:
+    def __init__(self, listen_ms: int = 2000, speech_ms: int = 1000, response_ms: int = 3000,
+                 delta_ms: int = 100, speed: float = 1.0, turns: int = 0):
+        self.listen_ms = listen_ms
+        self.speech_ms = speech_ms
+        self.response_ms = response_ms
+        self.delta_ms = delta_ms
+        self.speed = speed
+        self.turns = turns
+        self._ids = itertools.count(1)
+        self.reset()
+
+    def reset(self):
+        self.sessions = 0
+        self.active_sessions = 0
+        self.appends = 0
+        self.frames_in = 0
+        self.deltas_out = 0
+        self.responses = 0
+        self.inbound_latency: List[float] = []
+        self.started_at = time.perf_counter()
+
+    def stats(self) -> dict:
+        elapsed = time.perf_counter() - self.started_at
+        return {
+            "elapsed_s": elapsed,
+            "sessions": self.sessions,
+            "active_sessions": self.active_sessions,
+            "appends": self.appends,
+            "frames_in": self.frames_in,
+            "frames_in_per_s": self.frames_in / elapsed if elapsed else 0.0,
+            "deltas_out": self.deltas_out,
+            "responses": self.responses,
+            "inbound_latency_ms": percentiles(self.inbound_latency),
+        }
+
+    async def process_request(self, path: str, headers):
+        if path.startswith("/stats"):
+            body = json.dumps(self.stats()).encode()
+            if "reset=1" in path:
+                self.reset()
+            return http.HTTPStatus.OK, [("Content-Type", "application/json")], body
+        return None
+
+    async def handler(self, ws, path: Optional[str] = None):
+        self.sessions += 1
+        self.active_sessions += 1
+        await ws.send(_event("session.created", session={"id": f"sess_{next(self._ids)}"}))
+        heard_ms = 0.0
+        speaking = False
+        turn = 0
+        response: Optional[asyncio.Task] = None
+        try:
+            async for message in ws:
+                event = json.loads(message)
+                event_type = event.get("type")
+                if event_type == "session.update":
+                    await ws.send(_event("session.updated", session=event.get("session", {})))
+                elif event_type == "response.create":
+                    response = self._respond(ws, response)
+                elif event_type == "input_audio_buffer.append":
+                    audio = base64.b64decode(event["audio"])
+                    now = time.perf_counter()
+                    self.appends += 1
+                    for offset in range(0, len(audio), FRAME_BYTES):
+                        self.frames_in += 1
+                        sent_at = read_stamp(audio[offset:offset + FRAME_BYTES])
+                        if sent_at is not None:
+                            self.inbound_latency.append(now - sent_at)
+                    if response is not None and not response.done():
+                        continue  # The caller listens while the agent speaks
+                    heard_ms += len(audio) / 8
+                    if not speaking and heard_ms >= self.listen_ms:
+                        speaking = True
+                        await ws.send(_event("input_audio_buffer.speech_started", audio_start_ms=int(heard_ms)))
+                    elif speaking and heard_ms >= self.listen_ms + self.speech_ms:
+                        speaking, heard_ms, turn = False, 0.0, turn + 1
+                        item_id = f"item_{next(self._ids)}"
+                        await ws.send(_event("input_audio_buffer.speech_stopped", item_id=item_id))
+                        await ws.send(_event("input_audio_buffer.committed", item_id=item_id))
+                        await ws.send(_event("conversation.item.input_audio_transcription.completed",
+                                             item_id=item_id, content_index=0, transcript="I would like to know more."))
+                        if self.turns and turn >= self.turns:
+                            await ws.send(_event("response.function_call_arguments.done", name="hangup_call",
+                                                 call_id=f"call_{turn}", arguments=json.dumps({
+                                                     "customer_name": "Load Test", "is_Intrested": True,
+                                                     "Comments": "load test", "ContactNumber": 0})))
+                        else:
+                            response = self._respond(ws, response)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.active_sessions -= 1
+            if response is not None:
+                response.cancel()
+
+    def _respond(self, ws, previous: Optional[asyncio.Task]) -> asyncio.Task:
+        if previous is not None:
+            previous.cancel()
+        return asyncio.create_task(self._stream_response(ws))
+
+    async def _stream_response(self, ws):
+        self.responses += 1
+        response_id, item_id = f"resp_{next(self._ids)}", f"item_{next(self._ids)}"
+        await ws.send(_event("response.created", response={"id": response_id, "status": "in_progress"}))
+        delta_bytes = self.delta_ms * 8
+        silence = b"\xff" * delta_bytes
+        interval = self.delta_ms / 1000 / self.speed
+        next_send = time.perf_counter()
+        for index in range(max(1, self.response_ms // self.delta_ms)):
+            await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+            next_send += interval
+            audio = base64.b64encode(stamp_frame(silence)).decode("ascii")
+            await ws.send(_event("response.audio.delta", response_id=response_id, item_id=item_id,
+                                 output_index=0, content_index=0, delta=audio))
+            await ws.send(_event("response.audio_transcript.delta", response_id=response_id, item_id=item_id,
+                                 output_index=0, content_index=0, delta=" word"))
+            self.deltas_out += 1
+        await ws.send(_event("response.audio.done", response_id=response_id, item_id=item_id))
+        await ws.send(_event("response.content_part.done", response_id=response_id, item_id=item_id,
+                             output_index=0, content_index=0,
+                             part={"type": "audio", "transcript": "Thanks for calling, how can I help?"}))
+        await ws.send(_event("response.done", response={"id": response_id, "status": "completed", "output": []}))
+
+
+async def serve(fake: FakeAzureRealtime, host: str = "127.0.0.1", port: int = 8082):
+    return await websockets.serve(fake.handler, host, port, process_request=fake.process_request,
+                                  max_size=None, compression=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--listen-ms", type=int, default=2000, help="Caller audio before speech_started")
+    parser.add_argument("--speech-ms", type=int, default=1000, help="Caller audio between speech_started and speech_stopped")
+    parser.add_argument("--response-ms", type=int, default=3000, help="Agent audio per response")
+    parser.add_argument("--delta-ms", type=int, default=100, help="Agent audio per response.audio.delta")
+    parser.add_argument("--speed", type=float, default=1.0, help="Agent audio pace relative to real time")
+    parser.add_argument("--turns", type=int, default=0, help="Turns before asking to hang up (0 never)")
+    args = parser.parse_args()
+
+    fake = FakeAzureRealtime(args.listen_ms, args.speech_ms, args.response_ms, args.delta_ms, args.speed, args.turns)
+
+    async def run():
+        await serve(fake, args.host, args.port)
+        await asyncio.Future()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
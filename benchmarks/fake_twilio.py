@@ -0,0 +1,160 @@
+"""
+Fake Twilio REST endpoint for load tests.
+
+Answers POST /2010-04-01/Accounts/{AccountSid}/Calls.json like Twilio does, after
+a configurable latency. When the request carries a StatusCallback URL, a final
+call status (completed, busy, no-answer, failed) is posted back to it once the
+simulated call is over, signed with `auth_token` like Twilio signs its webhooks.
+GET on the same path lists the calls made, filtered by To and From. With
+`stall_rate`, that share of calls is created but answered only after `stall_s`,
+as when Twilio acts on a request whose response never arrives.
+
+Run it standalone and point the app at it with TWILIO_API_BASE_URL:
+    python -m benchmarks.fake_twilio --port 8081
+    TWILIO_API_BASE_URL=http://127.0.0.1:8081 uvicorn app.main:app --port 5050
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Dict, Optional
+
+from aiohttp import ClientSession, web
+from twilio.request_validator import RequestValidator
+
+DEFAULT_OUTCOMES = {"completed": 0.7, "busy": 0.1, "no-answer": 0.15, "failed": 0.05}
+
+
+class FakeTwilio:
+    def __init__(
+        self,
+        latency: float = 0.15,
+        call_duration: tuple = (1.0, 3.0),
+        outcomes: Optional[Dict[str, float]] = None,
+        seed: Optional[int] = None,
+        auth_token: str = "",
+        stall_rate: float = 0.0,
+        stall_s: float = 30.0,
+    ):
+        self.latency = latency
+        self.call_duration = call_duration
+        self.outcomes = outcomes or DEFAULT_OUTCOMES
+        self.random = random.Random(seed)
+        self.validator = RequestValidator(auth_token)
+        self.stall_rate = stall_rate
+        self.stall_s = stall_s
+        self.stalled = 0
+        self.calls: Dict[str, dict] = {}
+        self.requests = 0
+        self.request_times = []
+        self.active_calls = 0
+        self.max_active_calls = 0
+        self.final_statuses: Counter = Counter()
+        self.calls_per_number: Counter = Counter()
+        self._session: Optional[ClientSession] = None
+        self._tasks = set()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/2010-04-01/Accounts/{account_sid}/Calls.json", self.create_call)
+        app.router.add_get("/2010-04-01/Accounts/{account_sid}/Calls.json", self.list_calls)
+        app.on_cleanup.append(self._cleanup)
+        return app
+
+    async def create_call(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        self.request_times.append(time.monotonic())
+        form = await request.post()
+        await asyncio.sleep(self.latency)
+
+        call_sid = "CA" + uuid.uuid4().hex
+        to_phone = form.get("To")
+        self.calls_per_number[to_phone] += 1
+        call = {
+            "sid": call_sid,
+            "account_sid": request.match_info["account_sid"],
+            "to": to_phone,
+            "from": form.get("From"),
+            "status": "queued",
+            "direction": "outbound-api",
+            "date_created": format_datetime(datetime.now(timezone.utc)),
+        }
+        self.calls[call_sid] = call
+        status_callback = form.get("StatusCallback")
+        if status_callback:
+            task = asyncio.create_task(self._run_call(call, status_callback))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        if self.random.random() < self.stall_rate:
+            self.stalled += 1
+            await asyncio.sleep(self.stall_s)
+        return web.json_response(call, status=201)
+
+    async def list_calls(self, request: web.Request) -> web.Response:
+        calls = [
+            call for call in reversed(list(self.calls.values()))
+            if call["to"] == request.query.get("To", call["to"]) and call["from"] == request.query.get("From", call["from"])
+        ]
+        return web.json_response({
+            "calls": calls[:int(request.query.get("PageSize", 50))],
+            "page": 0,
+            "page_size": int(request.query.get("PageSize", 50)),
+            "next_page_uri": None,
+            "uri": request.path_qs,
+        })
+
+    async def _run_call(self, call: dict, status_callback: str):
+        call_sid, to_phone = call["sid"], call["to"]
+        call["status"] = "in-progress"
+        self.active_calls += 1
+        self.max_active_calls = max(self.max_active_calls, self.active_calls)
+        try:
+            status = self.random.choices(list(self.outcomes), weights=list(self.outcomes.values()))[0]
+            duration = self.random.uniform(*self.call_duration) if status == "completed" else self.call_duration[0] / 2
+            await asyncio.sleep(duration)
+        finally:
+            self.active_calls -= 1
+
+        call["status"] = status
+        self.final_statuses[status] += 1
+        if self._session is None:
+            self._session = ClientSession()
+        try:
+            params = {"CallSid": call_sid, "CallStatus": status, "To": to_phone}
+            headers = {"X-Twilio-Signature": self.validator.compute_signature(status_callback, params)}
+            async with self._session.post(status_callback, data=params, headers=headers):
+                pass
+        except Exception as e:
+            print(f"fake_twilio: status callback to {status_callback} failed: {e}")
+
+    async def _cleanup(self, app):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._session is not None:
+            await self._session.close()
+
+
+async def start_fake_twilio(fake: FakeTwilio, host: str = "127.0.0.1", port: int = 8081) -> web.AppRunner:
+    runner = web.AppRunner(fake.app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.15, help="Seconds before answering calls.create")
+    parser.add_argument("--auth-token", default="", help="TWILIO_AUTH_TOKEN of the app, to sign status callbacks")
+    args = parser.parse_args()
+    web.run_app(FakeTwilio(latency=args.latency, auth_token=args.auth_token).app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
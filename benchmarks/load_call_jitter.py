@@ -0,0 +1,135 @@
+"""
+Load test: audio relay jitter while POST /call is hammered.
+
+Runs the app in-process with uvicorn, and a fake Twilio REST endpoint and the
+load generator in separate processes. A 20 ms ticker on the app's event loop stands in for the
+audio relay: any time the loop is blocked, e.g. by a synchronous Twilio HTTP
+round-trip, shows up as late ticks. Jitter is reported idle and under load.
+
+Usage:
+    python -m benchmarks.load_call_jitter [--concurrency 20] [--seconds 5] [--twilio-latency 0.2]
+
+Requires the usual settings (.env); Twilio credentials can be dummies since
+requests go to the fake endpoint. Run it on a machine with at least three cores,
+otherwise the load generator and fake endpoint compete with the app for CPU and
+the tail figures measure OS scheduling rather than the app.
+"""
+import argparse
+import asyncio
+import base64
+import os
+import multiprocessing
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+FRAME_INTERVAL = 0.02
+
+
+def run_fake_twilio(latency: float, port: int):
+    from aiohttp import web
+    from benchmarks.fake_twilio import FakeTwilio
+
+    web.run_app(FakeTwilio(latency=latency).app(), host="127.0.0.1", port=port, print=None)
+
+
+def run_hammer(url: str, auth, concurrency: int, seconds: float) -> list:
+    return asyncio.run(hammer(url, auth, concurrency, time.perf_counter() + seconds))
+
+
+async def measure_jitter(stop: asyncio.Event) -> list:
+    lateness = []
+    next_tick = time.perf_counter() + FRAME_INTERVAL
+    while not stop.is_set():
+        await asyncio.sleep(max(0.0, next_tick - time.perf_counter()))
+        lateness.append((time.perf_counter() - next_tick) * 1000)
+        next_tick += FRAME_INTERVAL
+    return lateness
+
+
+async def hammer(url: str, auth, concurrency: int, deadline: float) -> list:
+    from aiohttp import ClientSession
+
+    latencies = []
+    headers = {"Authorization": "Basic " + base64.b64encode(":".join(auth).encode()).decode()}
+
+    async def worker(session):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            async with session.post(url, json={"to_phone": "+15550000000"}) as response:
+                await response.read()
+                if response.status == 200:
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+    async with ClientSession(headers=headers) as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    return latencies
+
+
+def describe(label: str, lateness: list):
+    lateness = sorted(lateness)
+    if not lateness:
+        print(f"{label}: no samples")
+        return
+    p = lambda q: lateness[min(len(lateness) - 1, int(q * len(lateness)))]
+    print(f"{label:<12} ticks={len(lateness):>5}  mean={statistics.mean(lateness):6.2f}ms"
+          f"  p50={p(0.5):6.2f}ms  p99={p(0.99):6.2f}ms  max={lateness[-1]:6.2f}ms")
+
+
+async def run(args):
+    import uvicorn
+    from app.helpers.config import get_settings
+    from app.main import app
+
+    settings = get_settings()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    stop = asyncio.Event()
+    jitter = asyncio.create_task(measure_jitter(stop))
+    await asyncio.sleep(args.seconds)
+    stop.set()
+    describe("idle", await jitter)
+
+    # The load generator runs in its own process so its work is not counted as app jitter
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        await asyncio.get_running_loop().run_in_executor(executor, time.sleep, 0)
+        stop = asyncio.Event()
+        jitter = asyncio.create_task(measure_jitter(stop))
+        load = asyncio.get_running_loop().run_in_executor(
+            executor, run_hammer, f"http://127.0.0.1:{args.port}/call",
+            (settings.API_AUTH_USERNAME, settings.API_AUTH_PASSWORD), args.concurrency, args.seconds)
+        call_latencies = sorted(await load)
+    stop.set()
+    describe("under load", await jitter)
+    if call_latencies:
+        print(f"/call: {len(call_latencies) / args.seconds:.1f} req/s, "
+              f"p50={call_latencies[len(call_latencies) // 2]:.0f}ms, max={call_latencies[-1]:.0f}ms")
+
+    server.should_exit = True
+    await server_task
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--twilio-latency", type=float, default=0.2)
+    parser.add_argument("--port", type=int, default=5051)
+    parser.add_argument("--twilio-port", type=int, default=8081)
+    args = parser.parse_args()
+
+    fake_twilio = multiprocessing.Process(target=run_fake_twilio, args=(args.twilio_latency, args.twilio_port), daemon=True)
+    fake_twilio.start()
+    os.environ["TWILIO_API_BASE_URL"] = f"http://127.0.0.1:{args.twilio_port}"
+    os.environ.setdefault("AZURE_POOL_SIZE", "0")
+    try:
+        asyncio.run(run(args))
+    finally:
+        fake_twilio.terminate()
+
+
+if __name__ == "__main__":
+    main()
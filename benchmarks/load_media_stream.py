@@ -0,0 +1,254 @@
+"""
+Load test: how many concurrent calls one worker can relay.
+
+Starts the fake Azure realtime server and the app (one uvicorn worker) in their
+own processes, then ramps simulated Twilio callers on /media-stream up to
+`--calls`, `--step` calls at a time. Each caller replays μ-law audio at real-time
+pace (20 ms frames), acknowledges marks, and measures the relay latency of the
+agent audio it receives; the fake Azure server measures the latency of caller
+frames. Every step reports frames/sec per direction, relay latency percentiles,
+and the app's CPU and RSS, overall and per call.
+
+Usage:
+    python -m benchmarks.load_media_stream [--calls 50] [--step 10] [--step-seconds 10]
+        [--audio caller.ulaw] [--coalesce-ms 0]
+
+`--audio` is raw 8 kHz μ-law, e.g. `ffmpeg -i call.wav -ar 8000 -ac 1 -f mulaw caller.ulaw`;
+it is looped, and the first bytes of each frame carry a timestamp. Requires the
+usual settings (.env); Azure and Twilio credentials can be dummies. CPU and RSS
+are read from /proc, so the figures are Linux only. Run it on a machine with
+spare cores, otherwise the callers and the fake server compete with the app.
+"""
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+import uuid
+from typing import List, Optional
+
+import websockets
+from aiohttp import ClientSession
+
+from benchmarks.fake_azure_realtime import FRAME_BYTES, FakeAzureRealtime, percentiles, read_stamp, serve, stamp_frame
+
+FRAME_INTERVAL = 0.02
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def load_audio(path: Optional[str]) -> List[bytes]:
+    if path is None:
+        return [b"\xff" * FRAME_BYTES]
+    with open(path, "rb") as file:
+        audio = file.read()
+    frames = [audio[offset:offset + FRAME_BYTES] for offset in range(0, len(audio) - FRAME_BYTES + 1, FRAME_BYTES)]
+    if not frames:
+        raise SystemExit(f"{path} holds less than one 20 ms frame of audio")
+    return frames
+
+
+class SimulatedCaller:
+    """
+    Plays the Twilio side of one call: start event, paced media frames, mark
+    acknowledgements and a stop event when the test ends.
+    """
+
+    def __init__(self, url: str, audio: List[bytes], profile: Optional[str] = None):
+        self.url = url
+        self.audio = audio
+        self.profile = profile
+        self.stream_sid = "MZ" + uuid.uuid4().hex
+        self.call_sid = "CA" + uuid.uuid4().hex
+        self.frames_out = 0
+        self.media_in = 0
+        self.marks = 0
+        self.clears = 0
+        self.outbound_latency: List[float] = []
+        self.closed_by_app = False
+        self.error: Optional[str] = None
+
+    def reset(self):
+        self.frames_out = self.media_in = 0
+        self.outbound_latency = []
+
+    async def run(self, stop: asyncio.Event):
+        try:
+            async with websockets.connect(self.url, max_size=None, compression=None) as ws:
+                await ws.send(json.dumps({"event": "connected", "protocol": "Call", "version": "1.0.0"}))
+                await ws.send(json.dumps({"event": "start", "sequenceNumber": "1", "streamSid": self.stream_sid, "start": {
+                    "streamSid": self.stream_sid, "callSid": self.call_sid, "tracks": ["inbound"],
+                    "customParameters": {"profile": self.profile} if self.profile else {},
+                    "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": 8000, "channels": 1}}}))
+                receiver = asyncio.create_task(self._receive(ws))
+                try:
+                    await self._send(ws, stop)
+                    await ws.send(json.dumps({"event": "stop", "streamSid": self.stream_sid,
+                                              "stop": {"callSid": self.call_sid}}))
+                finally:
+                    receiver.cancel()
+        except websockets.ConnectionClosed:
+            self.closed_by_app = True
+        except Exception as e:
+            self.error = str(e)
+
+    async def _send(self, ws, stop: asyncio.Event):
+        next_send = time.perf_counter()
+        for index in itertools.count():
+            if stop.is_set():
+                return
+            await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+            next_send += FRAME_INTERVAL
+            payload = base64.b64encode(stamp_frame(self.audio[index % len(self.audio)])).decode("ascii")
+            await ws.send(json.dumps({"event": "media", "sequenceNumber": str(index + 2), "streamSid": self.stream_sid,
+                                      "media": {"track": "inbound", "chunk": str(index + 1),
+                                                "timestamp": str(index * 20), "payload": payload}},
+                                     separators=(",", ":")))
+            self.frames_out += 1
+
+    async def _receive(self, ws):
+        async for message in ws:
+            now = time.perf_counter()
+            event = json.loads(message)
+            if event["event"] == "media":
+                self.media_in += 1
+                sent_at = read_stamp(base64.b64decode(event["media"]["payload"]))
+                if sent_at is not None:
+                    self.outbound_latency.append(now - sent_at)
+            elif event["event"] == "mark":
+                self.marks += 1
+                await ws.send(json.dumps({"event": "mark", "streamSid": self.stream_sid, "mark": event["mark"]}))
+            elif event["event"] == "clear":
+                self.clears += 1
+        self.closed_by_app = True
+
+
+def process_usage(pid: int):
+    """
+    CPU seconds and resident memory in MB of a process, from /proc.
+    """
+    with open(f"/proc/{pid}/stat") as file:
+        fields = file.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    with open(f"/proc/{pid}/status") as file:
+        rss_kb = next(int(line.split()[1]) for line in file if line.startswith("VmRSS:"))
+    return cpu, rss_kb / 1024
+
+
+def run_fake_azure(port: int, options: dict):
+    async def run():
+        await serve(FakeAzureRealtime(**options), port=port)
+        await asyncio.Future()
+
+    asyncio.run(run())
+
+
+async def wait_until_up(session: ClientSession, url: str, timeout: float = 30.0):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            async with session.get(url) as response:
+                if response.status < 500:
+                    return
+        except Exception:
+            if time.perf_counter() > deadline:
+                raise
+        await asyncio.sleep(0.2)
+
+
+async def run(args, app_pid: int):
+    audio = load_audio(args.audio)
+    stream_url = f"ws://127.0.0.1:{args.port}/media-stream"
+    stats_url = f"http://127.0.0.1:{args.azure_port}/stats"
+    stop = asyncio.Event()
+    callers: List[SimulatedCaller] = []
+    tasks = []
+
+    async with ClientSession() as session:
+        await wait_until_up(session, f"http://127.0.0.1:{args.port}/")
+        await wait_until_up(session, stats_url)
+        await asyncio.sleep(1.0)
+        _, baseline_rss = process_usage(app_pid)
+
+        print(f"{'calls':>5} {'in fps':>8} {'out fps':>8} {'in p50/p95/p99 ms':>20} {'out p50/p95/p99 ms':>20}"
+              f" {'CPU %':>6} {'CPU %/call':>10} {'RSS MB':>7} {'MB/call':>7} {'lost':>4}")
+        for level in range(args.step, args.calls + 1, args.step):
+            # Stagger the new calls over a second, like real call arrivals
+            for _ in range(level - len(callers)):
+                caller = SimulatedCaller(stream_url, audio, args.profile)
+                callers.append(caller)
+                tasks.append(asyncio.create_task(caller.run(stop)))
+                await asyncio.sleep(1.0 / args.step)
+            await asyncio.sleep(args.warmup)
+
+            for caller in callers:
+                caller.reset()
+            async with session.get(stats_url + "?reset=1") as response:
+                await response.read()
+            cpu_start, _ = process_usage(app_pid)
+            started = time.perf_counter()
+            await asyncio.sleep(args.step_seconds)
+            elapsed = time.perf_counter() - started
+            cpu_end, rss = process_usage(app_pid)
+            async with session.get(stats_url) as response:
+                azure = await response.json()
+
+            live = [caller for caller in callers if not caller.closed_by_app and caller.error is None]
+            cpu_percent = (cpu_end - cpu_start) / elapsed * 100
+            inbound = azure["inbound_latency_ms"]
+            outbound = percentiles([latency for caller in live for latency in caller.outbound_latency])
+            print(f"{len(live):>5} {azure['frames_in'] / elapsed:>8.0f}"
+                  f" {sum(caller.media_in for caller in live) / elapsed:>8.0f}"
+                  f" {inbound['p50']:>6.1f}/{inbound['p95']:>5.1f}/{inbound['p99']:>6.1f}"
+                  f" {outbound['p50']:>6.1f}/{outbound['p95']:>5.1f}/{outbound['p99']:>6.1f}"
+                  f" {cpu_percent:>6.1f} {cpu_percent / max(len(live), 1):>10.2f}"
+                  f" {rss:>7.1f} {(rss - baseline_rss) / max(len(live), 1):>7.2f} {len(callers) - len(live):>4}")
+
+        stop.set()
+        await asyncio.gather(*tasks)
+
+    errors = {caller.error for caller in callers if caller.error}
+    if errors:
+        print(f"caller errors: {sorted(errors)[:5]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=50, help="Concurrent calls to ramp up to")
+    parser.add_argument("--step", type=int, default=10, help="Calls added per step")
+    parser.add_argument("--step-seconds", type=float, default=10.0, help="Measurement window per step")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds after adding calls before measuring")
+    parser.add_argument("--audio", help="Raw 8 kHz μ-law audio replayed by every caller")
+    parser.add_argument("--profile", help="Session profile requested by the callers")
+    parser.add_argument("--coalesce-ms", type=int, default=0, help="AUDIO_COALESCE_WINDOW_MS of the app")
+    parser.add_argument("--response-ms", type=int, default=3000, help="Agent audio per fake response")
+    parser.add_argument("--port", type=int, default=5052)
+    parser.add_argument("--azure-port", type=int, default=8082)
+    args = parser.parse_args()
+
+    fake_azure = multiprocessing.Process(
+        target=run_fake_azure, args=(args.azure_port, {"response_ms": args.response_ms}), daemon=True)
+    fake_azure.start()
+    env = {
+        **os.environ,
+        "AZURE_OPENAI_REALTIME_URL": f"ws://127.0.0.1:{args.azure_port}",
+        "AUDIO_COALESCE_WINDOW_MS": str(args.coalesce_ms),
+    }
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--log-level", "warning"],
+        env=env, stderr=subprocess.DEVNULL,
+    )
+    try:
+        asyncio.run(run(args, app.pid))
+    finally:
+        app.terminate()
+        app.wait()
+        fake_azure.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Event traces for the benchmarks.
+
+Recorded traces are JSONL files with one raw WebSocket text message per line.
+When none is given, a synthetic trace with the same event mix as a real call
+is generated: Twilio sends ~50 media frames per second with the occasional
+mark, Azure sends audio deltas interleaved with transcript deltas and the
+usual lifecycle events.
+"""
+import base64
+import json
+import os
+import random
+from typing import List, Optional
+
+STREAM_SID = "MZ18ad3ab5a668481ce02b83e7395059f0"
+CALL_SID = "CA5f0c2ea7d1a3e6d88bd2bc5b8a9a1f77"
+FRAME_BYTES = 160  # 20 ms of 8 kHz g711_ulaw
+
+
+def _compact(event: dict) -> str:
+    return json.dumps(event, separators=(",", ":"))
+
+
+def load_trace(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8") as file:
+        return [line.rstrip("\n") for line in file if line.strip()]
+
+
+def twilio_media_frame(index: int, payload: Optional[str] = None) -> str:
+    if payload is None:
+        payload = base64.b64encode(os.urandom(FRAME_BYTES)).decode("ascii")
+    return _compact({
+        "event": "media",
+        "sequenceNumber": str(index + 2),
+        "media": {"track": "inbound", "chunk": str(index + 1), "timestamp": str(index * 20), "payload": payload},
+        "streamSid": STREAM_SID,
+    })
+
+
+def synthetic_twilio_trace(frames: int, seed: int = 7) -> List[str]:
+    rng = random.Random(seed)
+    trace = [
+        _compact({"event": "connected", "protocol": "Call", "version": "1.0.0"}),
+        _compact({"event": "start", "sequenceNumber": "1", "start": {
+            "accountSid": "AC" + "0" * 32, "streamSid": STREAM_SID, "callSid": CALL_SID,
+            "tracks": ["inbound"], "customParameters": {},
+            "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": 8000, "channels": 1}},
+            "streamSid": STREAM_SID}),
+    ]
+    for index in range(frames):
+        trace.append(twilio_media_frame(index))
+        if rng.random() < 0.05:
+            trace.append(_compact({"event": "mark", "sequenceNumber": str(index), "streamSid": STREAM_SID,
+                                   "mark": {"name": "responsePart"}}))
+    trace.append(_compact({"event": "stop", "sequenceNumber": str(frames + 2), "streamSid": STREAM_SID,
+                           "stop": {"accountSid": "AC" + "0" * 32, "callSid": CALL_SID}}))
+    return trace
+
+
+def synthetic_azure_trace(deltas: int, seed: int = 7) -> List[str]:
+    rng = random.Random(seed)
+    trace = [
+        _compact({"type": "session.created", "event_id": "event_1", "session": {"id": "sess_1", "voice": "shimmer"}}),
+        _compact({"type": "session.updated", "event_id": "event_2", "session": {"id": "sess_1", "voice": "shimmer"}}),
+        _compact({"type": "response.created", "event_id": "event_3", "response": {"id": "resp_1", "status": "in_progress"}}),
+    ]
+    for index in range(deltas):
+        delta = base64.b64encode(os.urandom(FRAME_BYTES * rng.randint(1, 10))).decode("ascii")
+        trace.append(_compact({"type": "response.audio.delta", "event_id": f"event_a{index}", "response_id": "resp_1",
+                               "item_id": "item_1", "output_index": 0, "content_index": 0, "delta": delta}))
+        if rng.random() < 0.5:
+            trace.append(_compact({"type": "response.audio_transcript.delta", "event_id": f"event_t{index}",
+                                   "response_id": "resp_1", "item_id": "item_1", "output_index": 0,
+                                   "content_index": 0, "delta": rng.choice(["Hello", " there", ",", " how", " are"])}))
+    trace.append(_compact({"type": "response.content_part.done", "event_id": "event_4", "response_id": "resp_1",
+                           "item_id": "item_1", "output_index": 0, "content_index": 0,
+                           "part": {"type": "audio", "transcript": "Hello there, how are you?"}}))
+    trace.append(_compact({"type": "response.done", "event_id": "event_5",
+                           "response": {"id": "resp_1", "status": "completed", "output": []}}))
+    return trace
@@ -0,0 +1,27 @@
+# Gunicorn configuration for running the agent on several worker processes.
+#
+#   gunicorn app.main:app -c gunicorn.conf.py
+#
+# Each worker runs its own event loop and Azure session pool. With more than one
+# worker (or node), set CALL_STATE_BACKEND=redis so /call, /incoming-call and
+# /media-stream can land on different workers and still share call state.
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5050")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Media streams are long-lived WebSockets: give calls time to finish on reload/shutdown
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "60"))
+keepalive = 5
+
+
+def child_exit(server, worker):
+    # With PROMETHEUS_MULTIPROC_DIR set, /metrics aggregates the figures of all
+    # workers; drop the live gauges of the ones that exit.
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)